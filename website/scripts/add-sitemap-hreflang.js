@@ -110,6 +110,10 @@ if (!fs.existsSync(sitemapPath)) {
 
 console.log('Reading sitemap.xml...');
 const sitemapContent = fs.readFileSync(sitemapPath, 'utf8');
+if (sitemapContent.includes('<sitemapindex')) {
+  console.error('Error: sitemap.xml is a sitemap index; run scripts/python/update-sitemap.py instead');
+  process.exit(1);
+}
 const urls = parseSitemap(sitemapContent);
 
 console.log(`Found ${urls.length} URLs in sitemap\n`);
@@ -12,9 +12,18 @@ console.log('\n' + '='.repeat(50));
 console.log('SITEMAP CHECK');
 console.log('='.repeat(50));
 
-// Read sitemap
+// Read sitemap (sitemap.xml may be an index of per-section sitemaps)
 const sitemapPath = path.join(__dirname, '../sitemap.xml');
-const sitemap = fs.readFileSync(sitemapPath, 'utf8');
+let sitemap = fs.readFileSync(sitemapPath, 'utf8');
+if (sitemap.includes('<sitemapindex')) {
+  const sectionRegex = /<loc>https:\/\/thebackrom\.com\/([^<]+\.xml)<\/loc>/g;
+  let section;
+  const sections = [];
+  while ((section = sectionRegex.exec(sitemap)) !== null) {
+    sections.push(fs.readFileSync(path.join(__dirname, '..', section[1]), 'utf8'));
+  }
+  sitemap = sections.join('\n');
+}
 
 // Extract URLs from sitemap
 const urlRegex = /<loc>https:\/\/thebackrom\.com\/([^<]+)<\/loc>/g;
@@ -2,206 +2,276 @@
 """
 Fix encoding errors in Norwegian HTML files.
 Replaces corrupted æ, ø, å characters (showing as replacement character).
+A corrupted word with its own REPLACEMENTS entry gets that spelling; any
+other is resolved from the site's own clean pages (see
+python/corpus_resolver.py), with the REPLACEMENTS fragments for words the
+site does not use yet.
+
+Usage:
+    python fix-encoding.py <directory> [--dry-run] [--diff] [--jobs N] [--no-cache]
+    python fix-encoding.py <directory> --format {jsonl,sarif} [--quiet] [--dry-run]
+    python fix-encoding.py <directory> --profile [FILE] [--dead-after N] [--dry-run]
+
+All fixed files are written together once the scan is done, or none of
+them if a write fails.
+
+--profile counts, per REPLACEMENTS entry, the corrupted tokens it matched,
+the files they were on, the fixes it made (whole words, and fragments of
+tokens the site's own pages did not resolve) and its match time, prints
+them and writes them as JSON (default: encoding-profile.json); see
+python/rule_profile.py. Entries that matched nothing in the last
+--dead-after N profiled runs are listed.
+
+--format jsonl or sarif writes every corrupted token (its position, and
+the spelling it is fixed to) to stdout as soon as its file is done, see
+python/issue_stream.py; --quiet prints the summary only.
 """
+import argparse
 import os
 import re
 import sys
+from functools import partial
 
-# Dictionary of known replacements (corrupted -> correct)
-REPLACEMENTS = {
-    # Words with å
-    'p\ufffd': 'på',
-    'n\ufffdr': 'når',
-    'N\ufffdr': 'Når',
-    '\ufffdrsaker': 'årsaker',
-    '\ufffdrsak': 'årsak',
-    '\ufffdrsaken': 'årsaken',
-    '\ufffdpne': 'Åpne',
-    '\ufffdpningstider': 'Åpningstider',
-    'm\ufffdneder': 'måneder',
-    'ogs\ufffd': 'også',
-    'm\ufffd': 'må',
-    's\ufffd': 'så',
-    'g\ufffd': 'gå',
-    'G\ufffd': 'Gå',
-    'g\ufffdr': 'går',
-    'st\ufffdr': 'står',
-    'oppst\ufffdr': 'oppstår',
-    'Unng\ufffd': 'Unngå',
-    'unng\ufffd': 'unngå',
-    'r\ufffdde': 'råde',
-    'fr\ufffd': 'frå',  # Less common, but possible
-
-    # Words with ø
-    'b\ufffdr': 'bør',
-    'B\ufffdr': 'Bør',
-    'f\ufffdr': 'før',
-    'F\ufffdr': 'Før',
-    'f\ufffdrst': 'først',
-    'f\ufffdrste': 'første',
-    '\ufffdvelser': 'øvelser',
-    '\ufffdvre': 'øvre',
-    '\ufffdkt': 'økt',
-    '\ufffdker': 'øker',
-    's\ufffdke': 'søke',
-    's\ufffdrlig': 'særlig',  # Actually æ
-    'gj\ufffdr': 'gjør',
-    'gj\ufffdre': 'gjøre',
-    'n\ufffdvendig': 'nødvendig',
-    'n\ufffdvendige': 'nødvendige',
-    'Opps\ufffdk': 'Oppsøk',
-    'opps\ufffdk': 'oppsøk',
-    'r\ufffdntgen': 'røntgen',
-    'R\ufffdntgen': 'Røntgen',
-    'vestibul\ufffdr': 'vestibulær',  # Actually æ
-    'F\ufffdlg': 'Følg',
-    'f\ufffdlg': 'følg',
-    'R\ufffdde': 'Røde',
-    'r\ufffdde': 'røde',
-    'Bes\ufffdk': 'Besøk',
-    'bes\ufffdk': 'besøk',
-    'h\ufffdy': 'høy',
-    'H\ufffdy': 'Høy',
-    'h\ufffdyre': 'høyre',
-    'H\ufffdyre': 'Høyre',
-    'h\uffddt': 'høyt',
-    'bl\ufffdff': 'bløff',
-    'bl\ufffdt': 'bløt',
-    'kj\ufffdp': 'kjøp',
-    'd\ufffdr': 'dør',
-    'D\ufffdr': 'Dør',
-    'sm\ufffdrte': 'smørte',
-    'st\ufffdrre': 'større',
-    'St\ufffdrre': 'Større',
-    'L\ufffdrdag': 'Lørdag',
-    'l\ufffdrdag': 'lørdag',
-    'S\ufffdndag': 'Søndag',
-    's\ufffdndag': 'søndag',
-    'sp\ufffdrsm': 'spørsm',
-    '\ufffdt': 'øt',  # Part of words
-    '\ufffdl': 'øl',  # Part of words
-    '\ufffds': 'ås',  # Part of words like 'ås'
-
-    # Words with æ
-    'v\ufffdre': 'være',
-    'V\ufffdre': 'Være',
-    'L\ufffdr': 'Lær',
-    'l\ufffdr': 'lær',
-    'l\ufffdre': 'lære',
-    's\ufffdrbarheten': 'sårbarheten',  # Actually å
-    'Personvernerkl\ufffdring': 'Personvernerklæring',
-    'erkl\ufffdring': 'erklæring',
-    'n\ufffdr': 'nær',  # Can also be når
-    'N\ufffdr': 'Nær',  # Can also be Når
-    'n\ufffdrliggende': 'nærliggende',
-    'sj\ufffdlden': 'sjælden',
-    'n\ufffermest': 'nærmest',
-    'n\ufffdrmere': 'nærmere',
-    'b\ufffdrende': 'bærende',
-    '\ufffdrekjeve': 'Ørekjeve',  # Actually ø
-    'Spr\ufffdkvalg': 'Språkvalg',
-    'spr\ufffdkvalg': 'språkvalg',
-
-    # Words with å (at word boundary)
-    'p\ufffdvirker': 'påvirker',
-    'p\ufffdvirke': 'påvirke',
-    'p\ufffdvirkning': 'påvirkning',
-    'p\ufffdta': 'påta',
-    'p\ufffdse': 'påse',
-    'p\ufffdpeke': 'påpeke',
-    'p\ufffdlegg': 'pålegg',
-    'p\ufffdf\ufffdlgende': 'påfølgende',
-    '\ufffdr': 'år',
-    '\ufffdret': 'året',
-    '\ufffdrs': 'års',
-    '\ufffdpen': 'åpen',
-    '\ufffdpent': 'åpent',
-    '\ufffdtte': 'åtte',
-
-    # Additional common patterns
-    'unders\ufffdkelse': 'undersøkelse',
-    'Unders\ufffdkelse': 'Undersøkelse',
-    'unders\ufffdk': 'undersøk',
-    's\ufffdrbar': 'sårbar',
-    'h\ufffdr': 'hår',
-    'H\ufffdr': 'Hår',
-    'kn\ufffd': 'knå',
-    'l\ufffdne': 'låne',
-    'bl\ufffd': 'blå',
-    'Bl\ufffd': 'Blå',
-    'r\ufffd': 'rå',
-    'tr\ufffd': 'trå',
-
-    # Single character at end/start of words (generic)
-    '\ufffd': 'å',  # Default to å if no context
-}
-
-def fix_file(filepath):
-    """Fix encoding issues in a single file."""
-    try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            content = f.read()
-    except Exception as e:
-        print(f"Error reading {filepath}: {e}")
-        return False, 0
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'python'))
+from corpus_resolver import CORRUPTED_TOKEN, CorpusResolver
+from issue_stream import IssueStream, add_format_arguments, issue_output
+from rule_bundle import load_rules
+from rule_profile import RuleProfile, add_profile_arguments
+from site_common import (ScanCache, StagedWrites, add_cache_argument, add_jobs_argument,
+                         add_write_arguments, build_trie_regex, find_html_files, line_offsets, locate,
+                         map_files, patch_output, read_candidate, resolve_jobs, rules_version)
+
+def compile_replacements(replacements):
+    """Compile the replacement table into one regex source plus a lookup table.
+
+    Returns {'regex': source, 'table': {corrupted: correct}, 'conflicts':
+    [(corrupted, dropped, used), ...]} for the keys listed more than once
+    with different replacements; the last entry wins.
+    """
+    table = {}
+    conflicts = []
+    for corrupted, correct in replacements:
+        if table.get(corrupted, correct) != correct:
+            conflicts.append((corrupted, table[corrupted], correct))
+        table[corrupted] = correct
+
+    # The trie alternation always prefers the longest key at a position
+    return {'regex': build_trie_regex(table), 'table': table, 'conflicts': conflicts}
+
+# Bump when compile_replacements() changes, so the cached compiled REPLACEMENTS are rebuilt
+REPLACEMENTS_COMPILER = 1
+
+# Known replacements (corrupted -> correct): whole words before the corpus
+# model, fragments of words the site has no clean spelling of after it (see
+# fix_content), from python/rules/encoding-replacements.tsv
+# (see python/rule_bundle.py). Applied longest match first; a key listed twice
+# with different meanings is reported at load time and the last entry wins.
+REPLACEMENTS, COMPILED_REPLACEMENTS = load_rules('encoding-replacements', 2, compile_replacements,
+                                                 REPLACEMENTS_COMPILER)
+
+for corrupted, dropped, used in COMPILED_REPLACEMENTS['conflicts']:
+    print(f"Warning: REPLACEMENTS maps {corrupted!r} to both {dropped!r} "
+          f"and {used!r}, using {used!r}", file=sys.stderr)
+
+REPLACEMENT_REGEX = re.compile(COMPILED_REPLACEMENTS['regex'])
+REPLACEMENT_TABLE = COMPILED_REPLACEMENTS['table']
+
+# U+FFFD in UTF-8; files without it are skipped before decoding
+ENCODING_PREFILTER = re.compile(re.escape('\ufffd'.encode('utf-8')))
+
+# Model of the site's spelling used to resolve U+FFFD tokens. Untrained it
+# leaves everything to REPLACEMENTS and picks å for the rest; fix_directory()
+# installs one trained on the site.
+RESOLVER = CorpusResolver({}, {})
+
+def use_replacements(regex, table, resolver=None):
+    """Pool initializer: install the compiled REPLACEMENTS and the corpus model in a worker process."""
+    global REPLACEMENT_REGEX, REPLACEMENT_TABLE, RESOLVER
+    REPLACEMENT_REGEX, REPLACEMENT_TABLE = regex, table
+    if resolver is not None:
+        RESOLVER = resolver
+
+# Per-rule counters of a --profile run (see python/rule_profile.py), or None
+PROFILE = None
+
+# Position in REPLACEMENTS of the entry in effect for each key (the last one)
+REPLACEMENT_RULES = {corrupted: index for index, (corrupted, _) in enumerate(REPLACEMENTS)}
+
+def start_profile():
+    """Install and return a RuleProfile of REPLACEMENTS."""
+    global PROFILE
+    PROFILE = RuleProfile('fix-encoding', [(corrupted, correct, '') for corrupted, correct in REPLACEMENTS],
+                          [(index, re.compile(re.escape(corrupted)).finditer)
+                           for index, (corrupted, _) in enumerate(REPLACEMENTS)])
+    return PROFILE
 
+def replace_fragment(match):
+    key = match.group()
+    if PROFILE is not None:
+        PROFILE.fix(REPLACEMENT_RULES[key])
+    return REPLACEMENT_TABLE[key]
+
+def known_word(token):
+    """Return the REPLACEMENTS spelling of a token that is a key of its own, or None."""
+    correct = REPLACEMENT_TABLE.get(token)
+    if correct is not None and PROFILE is not None:
+        PROFILE.fix(REPLACEMENT_RULES[token])
+    return correct
+
+def apply_replacements(token):
+    """Replace the corrupted fragments of a token that REPLACEMENTS knows."""
+    return REPLACEMENT_REGEX.sub(replace_fragment, token)
+
+def fix_content(content, filepath, applied=None):
+    """Fix encoding issues in a string. Returns (fixed_content, changes).
+
+    A corrupted token that is a REPLACEMENTS key gets that row's spelling,
+    whatever the site uses most. Any other becomes the spelling the site
+    itself uses most; tokens the site has no spelling for go through the
+    REPLACEMENTS fragments, and what is still left is resolved by the
+    corpus model's trigrams. The (token, fixed) pairs are appended to
+    applied, if given.
+    """
     if '\ufffd' not in content:
-        return True, 0  # No issues found
+        return content, 0  # No issues found
+
+    # Rewrite every corrupted token in a single pass
+    content, resolved = RESOLVER.fix(content, known=known_word, fallback=apply_replacements)
+    if PROFILE is not None:
+        for token, _ in resolved:
+            for match in REPLACEMENT_REGEX.finditer(token):
+                PROFILE.hit(REPLACEMENT_RULES[match.group()])
+    if applied is not None:
+        applied.extend(resolved)
+    return content, len(resolved)
 
-    original = content
-    changes = 0
+def has_corruption(filepath):
+    """Return True if the file contains U+FFFD, or could not be read (fix_file reports that)."""
+    try:
+        with open(filepath, 'rb') as f:
+            return ENCODING_PREFILTER.search(f.read()) is not None
+    except OSError:
+        return True
+
+def fix_file(filepath, collect=False):
+    """Fix encoding issues in a single file.
+
+    Returns (success, changes, change, tokens), change being (original,
+    fixed) text for StagedWrites or None. With collect, tokens is the list
+    of (line, column, token, fixed) of the fixes; otherwise it is None.
+    Nothing is written here.
+    """
+    if PROFILE is not None:
+        PROFILE.start_file()
+    try:
+        original = read_candidate(filepath, ENCODING_PREFILTER)
+    except Exception as e:
+        print(f"Error reading {filepath}: {e}")
+        return False, 0, None, None
 
-    # Apply replacements in order of length (longest first to avoid partial matches)
-    sorted_replacements = sorted(REPLACEMENTS.items(), key=lambda x: -len(x[0]))
+    if original is None:
+        return True, 0, None, None  # No issues found
 
-    for corrupted, correct in sorted_replacements:
-        if corrupted in content:
-            count = content.count(corrupted)
-            content = content.replace(corrupted, correct)
-            changes += count
+    if PROFILE is not None:
+        PROFILE.time_rules(original)
 
-    # Check if any replacement characters remain
-    remaining = content.count('\ufffd')
-    if remaining > 0:
-        # Find unique remaining patterns for debugging
-        patterns = set(re.findall(r'\w*\ufffd\w*', content))
-        print(f"  Warning: {remaining} replacement chars remain in {filepath}")
-        print(f"  Patterns: {list(patterns)[:10]}")
+    applied = [] if collect else None
+    content, changes = fix_content(original, filepath, applied)
 
     if content != original:
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(content)
-        return True, changes
+        tokens = None
+        if collect:
+            # The fixes are in the order their tokens appear in the original
+            offsets = line_offsets(original)
+            tokens = [(*locate(offsets, match.start()), token, fixed)
+                      for match, (token, fixed) in zip(CORRUPTED_TOKEN.finditer(original), applied)]
+        return True, changes, (original, content), tokens
 
-    return True, 0
+    return True, 0, None, None
 
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: python fix-encoding.py <directory>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description='Fix encoding errors in Norwegian HTML files')
+    parser.add_argument('directory', help='directory to fix (the en/ folder is skipped)')
+    add_write_arguments(parser)
+    add_jobs_argument(parser)
+    add_cache_argument(parser)
+    add_profile_arguments(parser, 'encoding-profile.json')
+    add_format_arguments(parser)
+    args = parser.parse_args()
+    if args.diff and args.format != 'text':
+        parser.error('--diff writes to stdout; it cannot be combined with --format ' + args.format)
+
+    with patch_output(args.diff) as diff, \
+            issue_output('fix-encoding', args.format, args.quiet, args.directory) as output:
+        fix_directory(args, diff, output)
+
+def fix_directory(args, diff=None, output=None):
+    """Fix every Norwegian page under args.directory and print the summary.
 
-    target_dir = sys.argv[1]
+    The fixed tokens and the summary also go to output, an IssueStream
+    (see python/issue_stream.py); without it only the text report is
+    printed.
+    """
+    if output is None:
+        output = IssueStream('fix-encoding')
+    target_dir = args.directory
     total_files = 0
     total_changes = 0
     files_fixed = 0
 
-    for root, dirs, files in os.walk(target_dir):
-        # Skip /en/ directory
-        if '/en/' in root or '\\en\\' in root:
-            continue
-        dirs[:] = [d for d in dirs if d != 'en']
-
-        for f in files:
-            if f.endswith('.html'):
-                filepath = os.path.join(root, f)
-                success, changes = fix_file(filepath)
-                total_files += 1
-                if changes > 0:
-                    files_fixed += 1
-                    total_changes += changes
-                    print(f"Fixed {filepath}: {changes} replacements")
-
-    print(f"\nSummary: Fixed {files_fixed}/{total_files} files, {total_changes} total replacements")
+    # Skip /en/ directory
+    corpus = find_html_files(target_dir, exclude_dirs={'en'})
+
+    # A profile covers the whole tree, counted in this process
+    profile = start_profile() if args.profile else None
+
+    # Skip files that were clean last time and have not changed since
+    cache = ScanCache(target_dir, {'fix-encoding': rules_version(REPLACEMENTS)},
+                      enabled=not (args.no_cache or profile))
+    html_files, skipped = cache.filter(corpus)
+
+    # Pages without U+FFFD are clean as they are; only the others need the corpus model
+    corrupted = []
+    for filepath in html_files:
+        if has_corruption(filepath):
+            corrupted.append(filepath)
+        else:
+            cache.mark_clean(filepath)
+    if not profile:
+        total_files = len(html_files) - len(corrupted)
+        html_files = corrupted
+
+    # Train on (or load the cached model of) all the Norwegian pages, if there is anything to fix
+    if corrupted:
+        use_replacements(REPLACEMENT_REGEX, REPLACEMENT_TABLE, CorpusResolver.load(target_dir, corpus))
+
+    writes = StagedWrites(target_dir, write=not args.dry_run, diff=diff)
+    for filepath, (success, changes, change, tokens) in map_files(
+            partial(fix_file, collect=output.records), html_files, 1 if profile else resolve_jobs(args.jobs),
+            initializer=use_replacements, initargs=(REPLACEMENT_REGEX, REPLACEMENT_TABLE, RESOLVER)):
+        total_files += 1
+        if change:
+            writes.stage(filepath, *change)
+        for line, column, token, fixed in tokens or ():
+            output.issue(filepath, line, column, 'corrupted-character', f"'{token}' -> '{fixed}'",
+                         found=token, replacement=fixed)
+        if changes > 0:
+            files_fixed += 1
+            total_changes += changes
+            if output.verbose:
+                print(f"{'Fixed' if writes.write else 'Would fix'} {filepath}: {changes} replacements")
+        elif success:
+            cache.mark_clean(filepath)
+    files_written = writes.commit()
+    cache.save()
+
+    print(f"\nSummary: Fixed {files_fixed}/{total_files} files, {total_changes} total replacements "
+          f"({len(skipped)} unchanged files skipped)")
+    output.finish({'files': total_files, 'files_fixed': files_fixed, 'replacements': total_changes,
+                   'files_skipped': len(skipped), 'files_written': files_written})
+
+    if profile:
+        profile.finish(target_dir, args.profile, args.dead_after)
 
 if __name__ == '__main__':
     main()
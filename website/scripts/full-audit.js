@@ -406,7 +406,18 @@ function checkSitemapSync(htmlFiles) {
     addIssue(SITEMAP_PATH, cat, 'sitemap.xml not found', 'critical');
     return;
   }
-  const sitemapContent = fs.readFileSync(SITEMAP_PATH, 'utf8');
+  let sitemapContent = fs.readFileSync(SITEMAP_PATH, 'utf8');
+  if (sitemapContent.includes('<sitemapindex')) {
+    // Index of per-section sitemaps (update-sitemap.py): audit the sections
+    const sectionRe = /<loc>([^<]+\.xml)<\/loc>/g;
+    const sections = [];
+    let s;
+    while ((s = sectionRe.exec(sitemapContent)) !== null) {
+      const sectionPath = path.join(ROOT, s[1].replace(SITE_ORIGIN, '').replace(/^\//, ''));
+      if (fs.existsSync(sectionPath)) sections.push(fs.readFileSync(sectionPath, 'utf8'));
+    }
+    sitemapContent = sections.join('\n');
+  }
   const locRe = /<loc>([^<]+)<\/loc>/g;
   const sitemapUrls = new Set();
   let m;
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Content-addressed backup store for the --fix modes.
+
+Before a file is rewritten its bytes are stored once, gzipped, under the
+SHA-256 of the content, so backing up content that is already in the store
+costs a stat and nothing else. Each --fix run writes a small manifest
+mapping the relative paths it touched to their blobs; runs can be listed,
+restored and pruned, and pruning drops the blobs no remaining run refers to.
+
+Layout, under BACKUP_DIR in the site root:
+
+    objects/ab/cdef...   gzipped file contents, named by SHA-256
+    runs/<run>.json      {"created": ..., "files": {relative path: SHA-256}}
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import re
+from datetime import datetime
+
+# Folder in the scanned root holding the store
+BACKUP_DIR = '.norwegian-spellcheck-backup'
+
+# Run names: the start time, plus _2, _3, ... for later runs in the same second
+RUN_NAME_PATTERN = re.compile(r'(\d{8}_\d{6})(?:_(\d+))?')
+
+
+def _write_atomic(path, data):
+    """Write bytes to path through a temp file, so readers never see half a file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+
+def _run_order(name):
+    """Sort key putting runs in the order they were saved (_10 after _9)."""
+    match = RUN_NAME_PATTERN.fullmatch(name)
+    if match is None:
+        return name, 0
+    return match.group(1), int(match.group(2) or 1)
+
+
+class BackupStore:
+    """The backup store of one site root."""
+
+    def __init__(self, root):
+        self.root = root
+        self.path = os.path.join(root, BACKUP_DIR)
+        self.objects = os.path.join(self.path, 'objects')
+        self.runs_dir = os.path.join(self.path, 'runs')
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects, digest[:2], digest[2:])
+
+    def _run_path(self, run):
+        return os.path.join(self.runs_dir, run + '.json')
+
+    def _key(self, path):
+        return os.path.relpath(path, self.root).replace(os.sep, '/')
+
+    def store(self, path):
+        """Back up a file's current content. Returns its SHA-256.
+
+        Safe to call from several processes at once: a blob is written
+        under a temporary name and renamed into place.
+        """
+        with open(path, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+        object_path = self._object_path(digest)
+        if not os.path.exists(object_path):
+            _write_atomic(object_path, gzip.compress(data))
+        return digest
+
+    def load(self, digest):
+        """Return the bytes of a stored blob."""
+        with open(self._object_path(digest), 'rb') as f:
+            return gzip.decompress(f.read())
+
+    def new_run(self):
+        """Start a run manifest. Returns a BackupRun to record files in and save()."""
+        return BackupRun(self)
+
+    def runs(self):
+        """Return the names of the saved runs, oldest first."""
+        try:
+            names = os.listdir(self.runs_dir)
+        except FileNotFoundError:
+            return []
+        return sorted((name[:-len('.json')] for name in names if name.endswith('.json')), key=_run_order)
+
+    def manifest(self, run):
+        """Return the {relative path: SHA-256} map of a run."""
+        with open(self._run_path(run), 'r', encoding='utf-8') as f:
+            return json.load(f)['files']
+
+    def restore(self, run, paths=None):
+        """Write the files of a run back to where they came from.
+
+        paths limits the restore to those relative paths. Returns the
+        relative paths restored.
+        """
+        files = self.manifest(run)
+        if paths is not None:
+            wanted = {path.replace(os.sep, '/') for path in paths}
+            files = {path: digest for path, digest in files.items() if path in wanted}
+
+        for rel_path, digest in sorted(files.items()):
+            _write_atomic(os.path.join(self.root, *rel_path.split('/')), self.load(digest))
+        return sorted(files)
+
+    def prune(self, keep):
+        """Delete all but the newest keep runs, then the blobs no remaining run uses.
+
+        Returns (runs_removed, blobs_removed).
+        """
+        runs = self.runs()
+        removed_runs = runs[:max(0, len(runs) - keep)]
+        for run in removed_runs:
+            os.remove(self._run_path(run))
+
+        referenced = set()
+        for run in self.runs():
+            referenced.update(self.manifest(run).values())
+
+        removed_blobs = 0
+        if os.path.isdir(self.objects):
+            for prefix in os.listdir(self.objects):
+                folder = os.path.join(self.objects, prefix)
+                for name in os.listdir(folder):
+                    if prefix + name not in referenced:
+                        os.remove(os.path.join(folder, name))
+                        removed_blobs += 1
+                if not os.listdir(folder):
+                    os.rmdir(folder)
+
+        return len(removed_runs), removed_blobs
+
+
+class BackupRun:
+    """The manifest of one --fix run, saved only if it recorded anything."""
+
+    def __init__(self, store):
+        self.store = store
+        self.name = datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.files = {}
+
+    def add(self, path, digest):
+        """Record that path was backed up as digest (see BackupStore.store)."""
+        self.files[self.store._key(path)] = digest
+
+    def save(self):
+        """Write the manifest. Returns the run name, or None if nothing was recorded."""
+        if not self.files:
+            return None
+        name = self.name
+        suffix = 1
+        while os.path.exists(self.store._run_path(name)):
+            suffix += 1
+            name = f'{self.name}_{suffix}'
+        self.name = name
+
+        manifest = {'created': datetime.now().isoformat(timespec='seconds'), 'files': self.files}
+        _write_atomic(self.store._run_path(name),
+                      json.dumps(manifest, indent=1, sort_keys=True).encode('utf-8'))
+        return name
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Resolver for U+FFFD characters left over after fix-encoding.py's table.
+
+The site's own clean Norwegian pages are the training data: every word
+with æ/ø/å is counted, and so is every character trigram. A corrupted
+token such as "m<U+FFFD>neder" is resolved by trying å, ø and æ for each
+U+FFFD and taking the candidate seen most often on the site. Candidates
+the site has never used are ranked by their trigrams instead, so unseen
+words still get the likeliest letter. Resolving a token is a handful of
+dict lookups.
+
+The model is cached as JSON in the site root and rebuilt only when a
+training page changes.
+"""
+
+import hashlib
+import itertools
+import json
+import math
+import os
+import re
+import sys
+from collections import Counter
+
+from html_scan import text_spans
+
+# File in the site root holding the trained model
+MODEL_FILE = '.encoding-model.json'
+
+# Bump when the model layout or the training changes
+MODEL_VERSION = 1
+
+# Letters a U+FFFD can stand for, most likely first (ties go to the first)
+CANDIDATE_LETTERS = 'åøæ'
+
+# A token with one or more U+FFFD in it
+CORRUPTED_TOKEN = re.compile(r'[\w\ufffd]*\ufffd[\w\ufffd]*')
+
+# A run of letters (no digits or underscores)
+WORD_PATTERN = re.compile(r'[^\W\d_]+')
+
+# Tokens with more U+FFFD than this are not words; each one falls back to the first letter
+MAX_CORRUPTED = 4
+
+
+def corpus_signature(root, files):
+    """Return a hash of the training pages' paths, sizes and mtimes."""
+    digest = hashlib.sha1()
+    for path in sorted(files):
+        stat = os.stat(path)
+        digest.update(f'{os.path.relpath(path, root)}\0{stat.st_size}\0{stat.st_mtime_ns}\n'.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def padded_trigrams(word):
+    """Return the character trigrams of a lowercase word, padded so the ends count too."""
+    word = f' {word} '
+    return [word[i:i + 3] for i in range(len(word) - 2)]
+
+
+def train(files):
+    """Count the æ/ø/å words and the trigrams of all words on the clean pages.
+
+    Pages that still contain U+FFFD are left out. Returns (words, trigrams):
+    word counts keyed by the form as written, trigram counts lowercased.
+    """
+    words = Counter()
+    trigrams = Counter()
+    for path in files:
+        with open(path, 'rb') as f:
+            data = f.read()
+        try:
+            content = data.decode('utf-8')
+        except UnicodeDecodeError:
+            continue
+        if '\ufffd' in content:
+            continue
+        for start, end in text_spans(content):
+            for match in WORD_PATTERN.finditer(content, start, end):
+                word = match.group()
+                lower = word.lower()
+                trigrams.update(padded_trigrams(lower))
+                if any(letter in lower for letter in CANDIDATE_LETTERS):
+                    words[word] += 1
+    return words, trigrams
+
+
+class CorpusResolver:
+    """Word and trigram counts of the site, used to resolve U+FFFD tokens."""
+
+    def __init__(self, words, trigrams):
+        self.words = Counter()
+        capital_counts = Counter()
+        for word, count in words.items():
+            lower = word.lower()
+            self.words[lower] += count
+            if word[0].isupper():
+                capital_counts[lower] += count
+        # Lowercase words that the site mostly writes capitalised
+        self.capitalised = {word for word, count in capital_counts.items()
+                            if count * 2 > self.words[word]}
+        self.trigrams = trigrams
+
+    @classmethod
+    def load(cls, root, files):
+        """Return the resolver trained on files, from the cached model if it is current."""
+        signature = corpus_signature(root, files)
+        model_path = os.path.join(root, MODEL_FILE)
+        try:
+            with open(model_path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            if cached.get('version') == MODEL_VERSION and cached.get('corpus') == signature:
+                return cls(cached['words'], cached['trigrams'])
+        except (OSError, ValueError):
+            pass
+
+        words, trigrams = train(files)
+        try:
+            temp_path = model_path + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': MODEL_VERSION, 'corpus': signature,
+                           'words': words, 'trigrams': trigrams},
+                          f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(temp_path, model_path)
+        except OSError as e:
+            print(f"Warning: could not cache the encoding model ({e})", file=sys.stderr)
+        return cls(words, trigrams)
+
+    def trigram_score(self, word):
+        """Log-likelihood of a lowercase word under the trigram counts (add-one smoothed)."""
+        return sum(math.log(self.trigrams.get(trigram, 0) + 1) for trigram in padded_trigrams(word))
+
+    def candidates(self, token):
+        """Yield token lowercased with each combination of å/ø/æ in its U+FFFD positions."""
+        lower = token.lower()
+        positions = [i for i, char in enumerate(lower) if char == '\ufffd']
+        for letters in itertools.product(CANDIDATE_LETTERS, repeat=len(positions)):
+            chars = list(lower)
+            for position, letter in zip(positions, letters):
+                chars[position] = letter
+            yield ''.join(chars)
+
+    def restore_case(self, token, word):
+        """Put word, the resolved lowercase token, back into the token's case.
+
+        A U+FFFD that starts the token is capitalised if the site mostly
+        writes the word capitalised.
+        """
+        letters = [char for char in token if char != '\ufffd' and char.isalpha()]
+        upper = len(letters) > 1 and all(char.isupper() for char in letters)
+        chars = list(token)
+        for position, char in enumerate(token):
+            if char == '\ufffd':
+                letter = word[position]
+                if upper or (position == 0 and word in self.capitalised):
+                    letter = letter.upper()
+                chars[position] = letter
+        return ''.join(chars)
+
+    def lookup(self, token):
+        """Return token resolved to the form the site uses most, or None if it uses none."""
+        if token.count('\ufffd') > MAX_CORRUPTED:
+            return None
+        count, word = max((self.words.get(word, 0), word) for word in self.candidates(token))
+        return self.restore_case(token, word) if count else None
+
+    def resolve(self, token):
+        """Return token with each U+FFFD replaced by the likeliest of å, ø and æ.
+
+        The form the site uses most wins; if it uses none, the candidates
+        are ranked by the trigram model.
+        """
+        if token.count('\ufffd') > MAX_CORRUPTED:
+            return token.replace('\ufffd', CANDIDATE_LETTERS[0])
+        best = None
+        best_key = None
+        for word in self.candidates(token):
+            key = (self.words.get(word, 0), self.trigram_score(word))
+            if best_key is None or key > best_key:
+                best, best_key = word, key
+        return self.restore_case(token, best)
+
+    def fix(self, content, known=None, fallback=None):
+        """Resolve every U+FFFD token in content. Returns (content, [(token, resolved), ...]).
+
+        known, if given, is tried first and wins over the site's own
+        spelling: it returns the fixed token, or None if it has no entry
+        for the whole token. fallback, if given, is tried on tokens the
+        site has no word for before the trigram model; it returns the
+        token with as many U+FFFD replaced as it knows.
+        """
+        resolved = []
+
+        def replace(match):
+            token = match.group()
+            fixed = None if known is None else known(token)
+            if fixed is None:
+                fixed = self.lookup(token)
+            if fixed is None and fallback is not None:
+                fixed = fallback(token)
+            if fixed is None or '\ufffd' in fixed:
+                fixed = self.resolve(fixed or token)
+            resolved.append((token, fixed))
+            return fixed
+
+        return CORRUPTED_TOKEN.sub(replace, content), resolved
@@ -1,134 +1,397 @@
 #!/usr/bin/env python3
 """
 Fix broken internal links in English pages.
+
+Usage:
+    python fix-broken-links.py [site_root] [--fix] [--dry-run] [--diff] [--jobs N] [--no-cache]
+    python fix-broken-links.py [site_root] --check [--fix] [--min-confidence C] [--dry-run] [--diff] [--jobs N]
+    python fix-broken-links.py [site_root] [--check] --format {jsonl,sarif} [--quiet]
+
+Options:
+    --fix       Apply LINK_CORRECTIONS (rules/link-corrections.tsv) to the en/
+                pages; with --check, rewrite broken links to their suggested
+                target instead
+    --check     Validate every href/src on the whole site against the files on
+                disk, suggesting the closest existing file for each broken link
+    --min-confidence C
+                Confidence a suggestion needs for --check --fix to apply it
+                (default: 0.9)
+    --dry-run   With --fix, go through the fixes without writing them
+    --diff      Print the fixes as a unified diff instead of writing them
+    --jobs N    Process files in N worker processes (0 = one per CPU)
+    --no-cache  Recheck files that passed before and have not changed since
+    --format FMT
+                text (default), or write each link to fix or broken link to
+                stdout as a JSON record as soon as its page is checked: jsonl
+                (one object per line) or sarif (see issue_stream.py)
+    --quiet, -q Print the summary only
 """
 
+import argparse
 import os
 import re
 import sys
+from functools import partial
+
+from html_scan import link_spans
+from issue_stream import IssueStream, add_format_arguments, issue_output
+from link_index import FileIndex, relink, resolve_link
+from rule_bundle import load_rules
+from site_common import (ScanCache, StagedWrites, add_cache_argument, add_jobs_argument,
+                         add_write_arguments, find_html_files, line_offsets, locate, map_files,
+                         patch_output, read_candidate, resolve_jobs, rules_version)
 
 if sys.platform == 'win32':
     sys.stdout.reconfigure(encoding='utf-8', errors='replace')
 
-# Link corrections (broken -> correct)
-LINK_CORRECTIONS = {
-    # Filename corrections
-    'c5-c6-prolapse.html': 'c5-c6-disc-herniation.html',
-    'c6-c7-prolapse.html': 'c6-c7-disc-herniation.html',
-    'numbness-fingers.html': 'finger-numbness.html',
-    'lumbago.html': 'acute-back-pain.html',
-    'acute-lumbago.html': 'acute-back-pain.html',
+# Link corrections (broken -> correct), from rules/link-corrections.tsv (see rule_bundle.py)
+LINK_CORRECTIONS = dict(load_rules('link-corrections', 2)[0])
 
-    # Folder typo
-    '/low-back/': '/lower-back/',
+# Special case: cervical-disc-herniation.html -> neck-disc-herniation.html
+# But we need to be careful not to match c5-c6-disc-herniation.html etc.,
+# so only a link whose whole filename is cervical-disc-herniation.html matches
+CERVICAL_DISC_LINK = re.compile(r'^(.*/)?cervical-disc-herniation\.html$')
 
-    # Double-word typo
-    'cervical-cervical-foraminal-stenosis.html': 'cervical-foraminal-stenosis.html',
+# Special case: disc-herniation.html in neck context
+# Match ...neck/disc-herniation.html -> neck-disc-herniation.html
+NECK_DISC_LINK = re.compile(r'^(.*neck/)disc-herniation\.html$')
 
-    # Relative links in neck folder - cervical-disc-herniation -> neck-disc-herniation
-    '"cervical-disc-herniation.html"': '"neck-disc-herniation.html"',
-}
+# Confidence a suggested target needs before --check --fix applies it
+MIN_CONFIDENCE = 0.9
 
-# Special case: cervical-disc-herniation.html -> neck-disc-herniation.html
-# But we need to be careful not to match c5-c6-disc-herniation.html etc.
+# Every fix_links() change contains one of these, so files without any are skipped
+LINK_PREFILTER = re.compile(b'|'.join(
+    re.escape(anchor.encode('utf-8')) for anchor in [*LINK_CORRECTIONS, 'disc-herniation.html']))
 
-def fix_links(content):
-    """Fix broken links in content."""
+def fix_url(url):
+    """Fix one href/src value. Returns (fixed_url, fixes)."""
     fixed = 0
-    new_content = content
 
     # Apply simple replacements
     for wrong, correct in LINK_CORRECTIONS.items():
-        if wrong in new_content:
-            count = new_content.count(wrong)
-            new_content = new_content.replace(wrong, correct)
+        if wrong in url:
+            fixed += url.count(wrong)
+            url = url.replace(wrong, correct)
+
+    for pattern in (CERVICAL_DISC_LINK, NECK_DISC_LINK):
+        url, count = pattern.subn(lambda m: (m.group(1) or '') + 'neck-disc-herniation.html', url)
+        fixed += count
+
+    return url, fixed
+
+def fix_links(content, applied=None):
+    """Fix broken links in the href/src attributes of content.
+
+    Returns (content, fixes). The (offset, old url, new url) of each link
+    changed are appended to applied, if given.
+    """
+    fixed = 0
+    segments = []
+    pos = 0
+
+    for attribute, start, end in link_spans(content):
+        url, count = fix_url(content[start:end])
+        if count:
+            segments.append(content[pos:start])
+            segments.append(url)
+            if applied is not None:
+                applied.append((start, content[start:end], url))
+            pos = end
             fixed += count
 
-    # Special case: cervical-disc-herniation.html -> neck-disc-herniation.html
-    # Only match when it's the full filename, not part of another name
-    pattern = r'href="([^"]*/)cervical-disc-herniation\.html"'
-    matches = re.findall(pattern, new_content)
-    if matches:
-        new_content = re.sub(pattern, r'href="\1neck-disc-herniation.html"', new_content)
-        fixed += len(matches)
-
-    # Special case: disc-herniation.html in neck context
-    # Match href="...neck/disc-herniation.html" -> neck-disc-herniation.html
-    pattern = r'href="([^"]*neck/)disc-herniation\.html"'
-    matches = re.findall(pattern, new_content)
-    if matches:
-        new_content = re.sub(pattern, r'href="\1neck-disc-herniation.html"', new_content)
-        fixed += len(matches)
-
-    return new_content, fixed
-
-def scan_and_fix(en_dir, fix=False):
-    """Scan and optionally fix broken links."""
+    segments.append(content[pos:])
+    return ''.join(segments), fixed
+
+def check_file(file_path, collect=False):
+    """Fix the links in one file.
+
+    Returns (links fixed, change, links), or None if unreadable. change is
+    (original, fixed) text for StagedWrites, or None; nothing is written here.
+    With collect, links is the list of (line, column, old url, new url) of
+    the links fixed; otherwise it is None.
+    """
+    try:
+        content = read_candidate(file_path, LINK_PREFILTER)
+    except Exception as e:
+        print(f"Error reading {file_path}: {e}")
+        return None
+
+    if content is None:
+        return 0, None, None
+
+    applied = [] if collect else None
+    new_content, fixed_count = fix_links(content, applied)
+    if not fixed_count:
+        return 0, None, None
+    links = None
+    if collect:
+        offsets = line_offsets(content)
+        links = [(*locate(offsets, start), old, new) for start, old, new in applied]
+    return fixed_count, (content, new_content), links
+
+def scan_and_fix(en_dir, writes, jobs=1, cache=None, output=None):
+    """Scan for broken links, staging the fixed files in writes (a StagedWrites).
+
+    Files the ScanCache says are unchanged since they last came out clean
+    are skipped. Each link to fix also goes to output, an IssueStream, if
+    given.
+    """
     stats = {
         'scanned': 0,
+        'skipped': 0,
         'files_with_issues': 0,
         'links_fixed': 0
     }
 
     issues = []
 
-    for root, dirs, files in os.walk(en_dir):
-        if 'node_modules' in root:
+    html_files = find_html_files(en_dir, exclude_dirs={'node_modules'})
+    if cache is not None:
+        html_files, skipped = cache.filter(html_files)
+        stats['skipped'] = len(skipped)
+
+    collect = output is not None and output.records
+    for file_path, result in map_files(partial(check_file, collect=collect), html_files, jobs):
+        if result is None:
             continue
 
-        for file in files:
-            if not file.endswith('.html'):
-                continue
+        fixed_count, change, links = result
+        stats['scanned'] += 1
+        if change:
+            writes.stage(file_path, *change)
+        for line, column, old, new in links or ():
+            output.issue(file_path, line, column, 'known-broken-link', f"{old} -> {new}",
+                         url=old, replacement=new)
+
+        if fixed_count > 0:
+            stats['files_with_issues'] += 1
+            stats['links_fixed'] += fixed_count
+            rel_path = os.path.relpath(file_path, en_dir)
+            issues.append((rel_path, fixed_count))
+        elif cache is not None:
+            cache.mark_clean(file_path)
+
+    if cache is not None:
+        cache.save()
 
-            file_path = os.path.join(root, file)
+    return stats, issues
 
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-            except Exception as e:
-                print(f"Error reading {file_path}: {e}")
-                continue
+def use_index(index):
+    """Pool initializer: install the site FileIndex in a worker process."""
+    global FILE_INDEX
+    FILE_INDEX = index
+
+FILE_INDEX = None
+
+def check_page(file_path, root, fix=False, min_confidence=MIN_CONFIDENCE, show=True, collect=False):
+    """Print every href/src in a page that does not resolve to a file in FILE_INDEX.
+
+    Each broken link is shown (with show) with the closest existing file.
+    With fix, links whose suggestion reaches min_confidence are rewritten
+    to it. Returns (links_checked, broken_links, links_fixed, change,
+    links), or None if the page could not be read; change is (original,
+    fixed) text for StagedWrites, or None. With collect, links is the list
+    of (line, column, attribute, url, target, suggested url, confidence,
+    fixed) of the broken links, the suggestion and confidence being None
+    when there is none; otherwise it is None.
+    """
+    page = os.path.relpath(file_path, root).replace(os.sep, '/')
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+    except Exception as e:
+        print(f"Error reading {file_path}: {e}")
+        return None
+
+    checked = 0
+    broken = 0
+    offsets = None
+    fixed = 0
+    segments = []
+    pos = 0
+    links = [] if collect else None
+    for attribute, start, end in link_spans(content):
+        url = content[start:end]
+        target = resolve_link(page, url)
+        if target is None:
+            continue
+        checked += 1
+        if FILE_INDEX.exists(target):
+            continue
 
-            stats['scanned'] += 1
+        if offsets is None:
+            offsets = line_offsets(content)
+        line, column = locate(offsets, start)
+        if show:
+            print(f"  {page}:{line}: {attribute}=\"{url}\" -> {target} (not found)")
+        broken += 1
+
+        suggestion = FILE_INDEX.suggest(target)
+        if suggestion is None:
+            if collect:
+                links.append((line, column, attribute, url, target, None, None, False))
+            continue
+        suggested, confidence = suggestion
+        new_url = relink(page, url, suggested)
+        applied = fix and confidence >= min_confidence
+        if collect:
+            links.append((line, column, attribute, url, target, new_url, confidence, applied))
+        if applied:
+            segments.append(content[pos:start])
+            segments.append(new_url)
+            pos = end
+            fixed += 1
+            if show:
+                print(f"      fixed: {new_url} (confidence {confidence:.2f})")
+        elif show:
+            print(f"      suggestion: {new_url} (confidence {confidence:.2f})")
+
+    if not fixed:
+        return checked, broken, 0, None, links
+    segments.append(content[pos:])
+    return checked, broken, fixed, (content, ''.join(segments)), links
+
+def validate_links(root, writes=None, min_confidence=MIN_CONFIDENCE, jobs=1, output=None):
+    """Check every internal link on the site. Returns the stats dict.
+
+    With writes (a StagedWrites), links with a confident suggestion are
+    fixed and the changed pages staged in it. The broken links go to
+    output, an IssueStream, if given; without it they are printed.
+    """
+    if output is None:
+        output = IssueStream('fix-broken-links')
+    stats = {
+        'pages': 0,
+        'links_checked': 0,
+        'broken_links': 0,
+        'pages_with_broken_links': 0,
+        'links_fixed': 0
+    }
 
-            new_content, fixed_count = fix_links(content)
+    # Index the whole tree once; every link is then a set lookup
+    index = FileIndex(root)
+    use_index(index)
 
-            if fixed_count > 0:
-                stats['files_with_issues'] += 1
-                stats['links_fixed'] += fixed_count
-                rel_path = os.path.relpath(file_path, en_dir)
-                issues.append((rel_path, fixed_count))
+    html_files = sorted(os.path.join(root, *path.split('/'))
+                        for path in index.files if path.endswith('.html'))
 
-                if fix:
-                    try:
-                        with open(file_path, 'w', encoding='utf-8') as f:
-                            f.write(new_content)
-                    except Exception as e:
-                        print(f"Error writing {file_path}: {e}")
+    check = partial(check_page, root=root, fix=writes is not None, min_confidence=min_confidence,
+                    show=output.verbose, collect=output.records)
+    for file_path, result in map_files(check, html_files, jobs,
+                                       initializer=use_index, initargs=(index,)):
+        if result is None:
+            continue
+        checked, broken, fixed, change, links = result
+        if change:
+            writes.stage(file_path, *change)
+        for line, column, attribute, url, target, suggested, confidence, applied in links or ():
+            message = f'{attribute}="{url}" -> {target} (not found)'
+            if suggested is not None:
+                message += f"; {'fixed' if applied else 'suggestion'}: {suggested} (confidence {confidence:.2f})"
+            output.issue(file_path, line, column, 'broken-link', message, url=url, target=target,
+                         suggestion=suggested, confidence=confidence, fixed=applied)
+        stats['pages'] += 1
+        stats['links_checked'] += checked
+        stats['broken_links'] += broken
+        stats['links_fixed'] += fixed
+        if broken:
+            stats['pages_with_broken_links'] += 1
+
+    return stats
+
+def run_check(root, fix=False, min_confidence=MIN_CONFIDENCE, jobs=1, dry_run=False, diff=None, output=None):
+    """Run --check mode and print its report (see validate_links for output)."""
+    if output is None:
+        output = IssueStream('fix-broken-links')
+    if output.verbose:
+        print("=" * 60)
+        print("Link Validator")
+        print("=" * 60)
+        print(f"Site root: {root}")
+        print(f"Mode: {f'FIX (confidence >= {min_confidence})' if fix or diff else 'CHECK ONLY'}")
+        print("=" * 60)
+        print()
 
-    return stats, issues
+    writes = StagedWrites(root, write=fix and not dry_run, diff=diff)
+    stats = validate_links(root, writes=writes if fix or diff else None,
+                           min_confidence=min_confidence, jobs=jobs, output=output)
+    files_written = writes.commit()
+
+    print()
+    print("=" * 60)
+    print("SUMMARY")
+    print("=" * 60)
+    print(f"Pages scanned: {stats['pages']}")
+    print(f"Internal links checked: {stats['links_checked']}")
+    print(f"Broken links: {stats['broken_links']}")
+    print(f"Pages with broken links: {stats['pages_with_broken_links']}")
+    if fix or diff:
+        print(f"Links fixed from suggestions: {stats['links_fixed']}")
+        print(f"Files written: {files_written}")
+    output.finish({**stats, 'files_written': files_written})
+
+    return 0 if stats['broken_links'] == stats['links_fixed'] else 1
 
 def main():
     script_dir = os.path.dirname(os.path.abspath(__file__))
-    en_dir = os.path.join(script_dir, 'en')
+
+    parser = argparse.ArgumentParser(description='Fix broken internal links in English pages')
+    parser.add_argument('directory', nargs='?', default=script_dir,
+                        help='site root containing the en/ folder (default: the script directory)')
+    parser.add_argument('--fix', action='store_true', help='write the fixes back to the files')
+    parser.add_argument('--check', action='store_true',
+                        help='validate every href/src on the site against the files on disk')
+    parser.add_argument('--min-confidence', type=float, default=MIN_CONFIDENCE, metavar='C',
+                        help=f'confidence a suggestion needs for --check --fix to apply it '
+                             f'(default: {MIN_CONFIDENCE})')
+    add_write_arguments(parser)
+    add_jobs_argument(parser)
+    add_cache_argument(parser)
+    add_format_arguments(parser)
+    args = parser.parse_args()
+    if args.diff and args.format != 'text':
+        parser.error('--diff writes to stdout; it cannot be combined with --format ' + args.format)
+
+    with patch_output(args.diff) as diff, \
+            issue_output('fix-broken-links', args.format, args.quiet, args.directory) as output:
+        if args.check:
+            return run_check(args.directory, fix=args.fix, min_confidence=args.min_confidence,
+                             jobs=resolve_jobs(args.jobs), dry_run=args.dry_run, diff=diff, output=output)
+        return fix_known_links(args, diff, output)
+
+def fix_known_links(args, diff=None, output=None):
+    """Run the LINK_CORRECTIONS mode over the en/ pages.
+
+    The links to fix and the summary also go to output, an IssueStream
+    (see issue_stream.py); without it only the text report is printed.
+    """
+    if output is None:
+        output = IssueStream('fix-broken-links')
+    en_dir = os.path.join(args.directory, 'en')
 
     if not os.path.exists(en_dir):
         print(f"Error: English directory not found at {en_dir}")
+        output.finish({'error': 'no en/ directory'})
         return 1
 
-    fix = '--fix' in sys.argv
+    fix = args.fix and not args.dry_run and diff is None
 
-    print("=" * 60)
-    print("Broken Link Fix Tool")
-    print("=" * 60)
-    print(f"Directory: {en_dir}")
-    print(f"Mode: {'FIX' if fix else 'SCAN ONLY'}")
-    print("=" * 60)
-    print()
+    if output.verbose:
+        print("=" * 60)
+        print("Broken Link Fix Tool")
+        print("=" * 60)
+        print(f"Directory: {en_dir}")
+        print(f"Mode: {'DIFF' if diff else 'FIX' if fix else 'SCAN ONLY'}")
+        print("=" * 60)
+        print()
 
-    stats, issues = scan_and_fix(en_dir, fix=fix)
+    cache = ScanCache(args.directory, {'fix-broken-links': rules_version(LINK_CORRECTIONS)},
+                      enabled=not args.no_cache)
+    writes = StagedWrites(args.directory, write=fix, diff=diff)
+    stats, issues = scan_and_fix(en_dir, writes, jobs=resolve_jobs(args.jobs), cache=cache, output=output)
+    files_written = writes.commit()
 
-    if issues:
+    if issues and output.verbose:
         print("Files with broken links:")
         for path, count in issues:
             print(f"  {path}: {count} link(s)")
@@ -138,12 +401,14 @@ def main():
     print("SUMMARY")
     print("=" * 60)
     print(f"Files scanned: {stats['scanned']}")
+    print(f"Files skipped (unchanged): {stats['skipped']}")
     print(f"Files with issues: {stats['files_with_issues']}")
     print(f"Links {'fixed' if fix else 'to fix'}: {stats['links_fixed']}")
 
-    if not fix and stats['links_fixed'] > 0:
+    if not args.fix and stats['links_fixed'] > 0:
         print()
         print(f"To fix {stats['links_fixed']} links, run: python fix-broken-links.py --fix")
+    output.finish({**stats, 'files_written': files_written})
 
     return 0
 
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Offset-preserving HTML tokenizer for the site maintenance scripts.
+
+Instead of running their rules over raw markup, the checkers ask this
+module for the (start, end) spans they care about: visible text and a few
+text attributes for the spellchecker, href/src values for the link fixer,
+every URL that may point at an image for the image checker.
+Spans index into the original string, so fixes can be spliced straight
+back into it. Nothing is unescaped or normalised.
+"""
+
+import re
+
+# Comments, doctypes/processing instructions and tags. Quoted attribute
+# values may contain '>'.
+TAG_PATTERN = re.compile(
+    r'<!--.*?(?:-->|\Z)'
+    r'|<[!?][^>]*>?'
+    r'|<(/?)([A-Za-z][^\s/>]*)((?:[^>"\']|"[^"]*"|\'[^\']*\')*)>',
+    re.DOTALL)
+
+ATTRIBUTE_PATTERN = re.compile(
+    r'([^\s"\'=<>/]+)(?:\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s"\'=<>`]+)))?')
+
+# Elements whose content is code, not text
+RAW_TEXT_ELEMENTS = {'script', 'style'}
+
+# Attributes holding text a visitor can see
+TEXT_ATTRIBUTES = {'alt', 'title'}
+
+# <meta name/property="..."> whose content attribute is page text
+META_TEXT_NAMES = {'description', 'og:description', 'og:title', 'twitter:description',
+                   'twitter:title'}
+
+# Attributes holding links
+LINK_ATTRIBUTES = {'href', 'src'}
+
+# Attributes holding one URL that may be an image (href covers <link rel="icon">)
+IMAGE_ATTRIBUTES = {'src', 'href', 'poster', 'data-src'}
+
+# Attributes holding a srcset: comma-separated URLs, each with an optional descriptor
+SRCSET_ATTRIBUTES = {'srcset', 'imagesrcset', 'data-srcset'}
+
+# <meta name/property="..."> whose content attribute is an image URL
+META_IMAGE_NAMES = {'og:image', 'og:image:url', 'og:image:secure_url', 'twitter:image',
+                    'twitter:image:src', 'msapplication-tileimage'}
+
+# A CSS url(), quoted or not
+CSS_URL_PATTERN = re.compile(r'url\(\s*(?:"([^"]*)"|\'([^\']*)\'|([^)"\'\s]*))\s*\)', re.IGNORECASE)
+
+# A srcset URL, up to the whitespace before its descriptor
+SRCSET_URL_PATTERN = re.compile(r'[^\s,]\S*')
+
+# End of a <style> element, whose body tokenize() skips
+STYLE_CLOSE_PATTERN = re.compile(r'</style\s*>', re.IGNORECASE)
+
+TEXT = 'text'
+TAG = 'tag'
+
+
+def tokenize(content):
+    """Yield (TEXT, start, end) for text between tags and (TAG, match) for each tag.
+
+    The bodies of RAW_TEXT_ELEMENTS are skipped; their opening tags are
+    still yielded so attributes such as <script src> can be read.
+    """
+    pos = 0
+    length = len(content)
+    while pos < length:
+        match = TAG_PATTERN.search(content, pos)
+        if match is None:
+            yield TEXT, pos, length
+            return
+        if match.start() > pos:
+            yield TEXT, pos, match.start()
+        yield TAG, match
+        pos = match.end()
+
+        name = match.group(2)
+        if name and not match.group(1) and name.lower() in RAW_TEXT_ELEMENTS:
+            close = re.compile(rf'</{name}\s*>', re.IGNORECASE).search(content, pos)
+            pos = close.start() if close else length
+
+
+def tag_name(match):
+    """Return the lowercased element name of a TAG match, or None for comments and doctypes."""
+    name = match.group(2)
+    return name.lower() if name else None
+
+
+def attributes(content, match):
+    """Yield (name, value_start, value_end) for each attribute of a TAG match that has a value."""
+    if not match.group(2):
+        return
+    for attribute in ATTRIBUTE_PATTERN.finditer(content, match.start(3), match.end(3)):
+        for group in (2, 3, 4):
+            if attribute.group(group) is not None:
+                yield attribute.group(1).lower(), attribute.start(group), attribute.end(group)
+                break
+
+
+def text_spans(content):
+    """Yield (start, end) for the visible text of a page, in document order.
+
+    That is text nodes outside <script>/<style>, TEXT_ATTRIBUTES values and
+    the content of META_TEXT_NAMES meta tags.
+    """
+    for token in tokenize(content):
+        if token[0] == TEXT:
+            yield token[1], token[2]
+            continue
+
+        match = token[1]
+        if match.group(1):
+            continue
+        is_meta = tag_name(match) == 'meta'
+        meta_content = None
+        meta_is_text = False
+        for name, start, end in attributes(content, match):
+            if name in TEXT_ATTRIBUTES:
+                yield start, end
+            elif is_meta and name == 'content':
+                meta_content = (start, end)
+            elif is_meta and name in ('name', 'property'):
+                meta_is_text = meta_is_text or content[start:end].lower() in META_TEXT_NAMES
+        if meta_is_text and meta_content:
+            yield meta_content
+
+
+def link_spans(content):
+    """Yield (attribute, start, end) for every href/src value, in document order."""
+    for token in tokenize(content):
+        if token[0] == TAG and not token[1].group(1):
+            for name, start, end in attributes(content, token[1]):
+                if name in LINK_ATTRIBUTES:
+                    yield name, start, end
+
+
+def css_url_spans(content, start=0, end=None):
+    """Yield (start, end) for the value of every url() in content[start:end], without quotes."""
+    for match in CSS_URL_PATTERN.finditer(content, start, len(content) if end is None else end):
+        for group in (1, 2, 3):
+            if match.group(group) is not None:
+                yield match.start(group), match.end(group)
+                break
+
+
+def srcset_spans(content, start, end):
+    """Yield (start, end) for each URL of the srcset value content[start:end]."""
+    pos = start
+    while True:
+        match = SRCSET_URL_PATTERN.search(content, pos, end)
+        if match is None:
+            return
+        url = match.group()
+        # A URL ending in a comma has no descriptor; the comma ends the candidate
+        if url.endswith(','):
+            yield match.start(), match.start() + len(url.rstrip(','))
+            pos = match.end()
+            continue
+        yield match.start(), match.end()
+        comma = content.find(',', match.end(), end)
+        if comma == -1:
+            return
+        pos = comma + 1
+
+
+def image_spans(content):
+    """Yield (source, start, end, fallback) for every URL that may point at an image, in document order.
+
+    source is the attribute (src, srcset, href, ...), the meta name for
+    META_IMAGE_NAMES meta tags, or 'url()' for CSS in style attributes and
+    <style> elements. Which of the URLs are images is for the caller to
+    decide from what they point at. fallback is True for the <img> of a
+    <picture> with <source> elements: the copy for browsers that take none
+    of the sources.
+    """
+    in_picture = False
+    has_sources = False
+    for token in tokenize(content):
+        if token[0] == TEXT:
+            continue
+
+        match = token[1]
+        name = tag_name(match)
+        if name == 'picture':
+            in_picture = not match.group(1)
+            has_sources = False
+            continue
+        if match.group(1) or name is None:
+            continue
+        if name == 'source' and in_picture:
+            has_sources = True
+        fallback = name == 'img' and has_sources
+
+        meta_name = None
+        meta_content = None
+        for attribute, start, end in attributes(content, match):
+            if attribute in IMAGE_ATTRIBUTES:
+                yield attribute, start, end, fallback
+            elif attribute in SRCSET_ATTRIBUTES:
+                for url_start, url_end in srcset_spans(content, start, end):
+                    yield attribute, url_start, url_end, fallback
+            elif attribute == 'style':
+                for url_start, url_end in css_url_spans(content, start, end):
+                    yield 'url()', url_start, url_end, False
+            elif name == 'meta' and attribute == 'content':
+                meta_content = (start, end)
+            elif name == 'meta' and attribute in ('name', 'property'):
+                if content[start:end].lower() in META_IMAGE_NAMES:
+                    meta_name = content[start:end].lower()
+        if meta_name and meta_content:
+            yield meta_name, *meta_content, False
+
+        if name == 'style':
+            close = STYLE_CLOSE_PATTERN.search(content, match.end())
+            for url_start, url_end in css_url_spans(content, match.end(), close.start() if close else None):
+                yield 'url()', url_start, url_end, False
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Check the site's images against the pages that use them.
+
+The images on disk come from the site's file index (see link_index.py),
+and every reference to one is collected in a single pass over the pages,
+stylesheets and web app manifests: src, srcset, <link href>, og:image and
+twitter:image, and CSS url() in style attributes, <style> elements and
+.css files. References are resolved like links are by
+fix-broken-links.py --check, and reported as:
+
+    missing-image       a reference to an image that is not on disk, with
+                        the closest existing image
+    webp-available      a JPG/PNG reference to an image with a .webp next
+                        to it (not counting the <img> fallback of a
+                        <picture>, icons and link previews)
+    unreferenced-image  an image nothing references, deployed for nothing
+
+Images only loaded from JavaScript are not seen; keep them out of the
+unreferenced list with --ignore.
+
+Usage:
+    python image-check.py [site_root] [--ignore GLOB ...] [--jobs N]
+    python image-check.py [site_root] --format {jsonl,sarif} [--quiet]
+
+Options:
+    --ignore GLOB   Do not report images matching GLOB (a path relative to
+                    the site root, e.g. 'images/email/*') as unreferenced
+    --jobs N        Scan files in N worker processes (0 = one per CPU)
+    --format FMT    text (default), or write each issue to stdout as a JSON
+                    record as soon as its file is scanned: jsonl (one object
+                    per line) or sarif (see issue_stream.py)
+    --quiet, -q     Print the summary only
+
+Exits with 1 when a referenced image is missing.
+"""
+
+import argparse
+import os
+import posixpath
+import re
+import sys
+from collections import Counter
+from fnmatch import fnmatchcase
+from functools import partial
+
+from html_scan import META_IMAGE_NAMES, css_url_spans, image_spans
+from issue_stream import IssueStream, add_format_arguments, issue_output
+from link_index import FileIndex, relink, resolve_link
+from site_common import add_jobs_argument, line_offsets, locate, map_files, read_candidate, resolve_jobs
+
+if sys.platform == 'win32':
+    sys.stdout.reconfigure(encoding='utf-8', errors='replace')
+
+# Extensions of the files counted as images
+IMAGE_EXTENSIONS = {'.webp', '.jpg', '.jpeg', '.png', '.gif', '.avif'}
+
+# Formats that should be served as their .webp sibling when there is one
+LEGACY_EXTENSIONS = {'.jpg', '.jpeg', '.png'}
+
+# Sources that keep JPG/PNG on purpose: icons, and link previews for scrapers without WebP
+WEBP_EXEMPT_SOURCES = {'href'} | META_IMAGE_NAMES
+
+# Web app manifests, whose icons are referenced by "src"
+MANIFEST_NAMES = {'manifest.json', 'manifest.webmanifest', 'site.webmanifest'}
+
+MANIFEST_SRC_PATTERN = re.compile(r'"src"\s*:\s*"([^"\\]*)"')
+
+# Files without any of these are skipped before decoding
+IMAGE_PREFILTER = re.compile(rb'(?i)\.(?:webp|jpe?g|png|gif|avif)')
+
+
+def is_image(path):
+    return posixpath.splitext(path)[1].lower() in IMAGE_EXTENSIONS
+
+def is_scanned(path):
+    """Return True for the files image references are collected from."""
+    return path.endswith(('.html', '.css')) or posixpath.basename(path) in MANIFEST_NAMES
+
+def reference_spans(path, content):
+    """Yield (source, start, end, fallback) for the URLs in a page, stylesheet or manifest (see image_spans)."""
+    if path.endswith('.html'):
+        yield from image_spans(content)
+    elif path.endswith('.css'):
+        for start, end in css_url_spans(content):
+            yield 'url()', start, end, False
+    else:
+        for match in MANIFEST_SRC_PATTERN.finditer(content):
+            yield 'src', match.start(1), match.end(1), False
+
+def image_references(file_path, root):
+    """Return the image references of one file, or None if it could not be read.
+
+    Each is (line, column, source, url, target, fallback), target being the
+    site-relative path resolve_link() gives.
+    """
+    path = os.path.relpath(file_path, root).replace(os.sep, '/')
+    try:
+        content = read_candidate(file_path, IMAGE_PREFILTER)
+    except Exception as e:
+        print(f"Error reading {file_path}: {e}")
+        return None
+
+    references = []
+    if content is None:
+        return references
+
+    offsets = None
+    for source, start, end, fallback in reference_spans(path, content):
+        url = content[start:end]
+        target = resolve_link(path, url)
+        if target is None or not is_image(target):
+            continue
+        if offsets is None:
+            offsets = line_offsets(content)
+        references.append((*locate(offsets, start), source, url, target, fallback))
+    return references
+
+def webp_sibling(path):
+    return posixpath.splitext(path)[0] + '.webp'
+
+def check_images(root, ignore=(), jobs=1, output=None):
+    """Check every image reference on the site and report the unreferenced images.
+
+    Returns the stats dict. The issues go to output, an IssueStream; without
+    it they are printed.
+    """
+    if output is None:
+        output = IssueStream('image-check')
+
+    index = FileIndex(root)
+    images = {path for path in index.files if is_image(path)}
+    formats = Counter(posixpath.splitext(path)[1].lower() for path in images)
+
+    if output.verbose:
+        print("=" * 60)
+        print("Image Check")
+        print("=" * 60)
+        print(f"Site root: {root}")
+        print(f"Images on disk: {len(images)} "
+              f"({', '.join(f'{count} {ext[1:]}' for ext, count in formats.most_common())})")
+        print("=" * 60)
+        print()
+
+    stats = {
+        'files': 0,
+        'images': len(images),
+        'references': 0,
+        'missing': 0,
+        'webp_available': 0,
+        'unreferenced': 0,
+        'unreferenced_bytes': 0,
+    }
+    referenced = set()
+
+    files = sorted(os.path.join(root, *path.split('/')) for path in index.files if is_scanned(path))
+    for file_path, references in map_files(partial(image_references, root=root), files, jobs):
+        if references is None:
+            continue
+        stats['files'] += 1
+        path = os.path.relpath(file_path, root).replace(os.sep, '/')
+        for line, column, source, url, target, fallback in references:
+            stats['references'] += 1
+            if target in index.files:
+                referenced.add(target)
+                webp = webp_sibling(target)
+                if (fallback or source in WEBP_EXEMPT_SOURCES or webp not in index.files
+                        or posixpath.splitext(target)[1].lower() not in LEGACY_EXTENSIONS):
+                    continue
+                stats['webp_available'] += 1
+                new_url = relink(path, url, webp)
+                if output.verbose:
+                    print(f"  {path}:{line}: {source}=\"{url}\" -> {new_url} (WebP available)")
+                output.issue(file_path, line, column, 'webp-available',
+                             f'{source}="{url}": serve {new_url} instead', url=url, target=target,
+                             webp=new_url)
+                continue
+
+            stats['missing'] += 1
+            # A JPG/PNG replaced by its WebP is the likeliest fix
+            if webp_sibling(target) in index.files:
+                suggestion = (webp_sibling(target), 1.0)
+            else:
+                suggestion = index.suggest(target)
+            message = f'{source}="{url}" -> {target} (not found)'
+            new_url = confidence = None
+            if suggestion is not None:
+                new_url, confidence = relink(path, url, suggestion[0]), suggestion[1]
+                message += f"; suggestion: {new_url} (confidence {confidence:.2f})"
+            if output.verbose:
+                print(f"  {path}:{line}: {source}=\"{url}\" -> {target} (not found)")
+                if new_url is not None:
+                    print(f"      suggestion: {new_url} (confidence {confidence:.2f})")
+            output.issue(file_path, line, column, 'missing-image', message, url=url, target=target,
+                         suggestion=new_url, confidence=confidence)
+
+    unreferenced = sorted(path for path in images - referenced
+                          if not any(fnmatchcase(path, pattern) for pattern in ignore))
+    if unreferenced and output.verbose:
+        print()
+        print("Unreferenced images:")
+    for path in unreferenced:
+        file_path = os.path.join(root, *path.split('/'))
+        try:
+            size = os.path.getsize(file_path)
+        except OSError:
+            size = 0
+        stats['unreferenced'] += 1
+        stats['unreferenced_bytes'] += size
+        if output.verbose:
+            print(f"  {path} ({size / 1024:.0f} KB)")
+        output.issue(file_path, None, None, 'unreferenced-image', f"{path} is not referenced anywhere",
+                     bytes=size)
+
+    return stats
+
+def main():
+    site_root = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+    parser = argparse.ArgumentParser(description="Check the site's images against the pages that use them")
+    parser.add_argument('directory', nargs='?', default=site_root,
+                        help='site root (default: the website folder)')
+    parser.add_argument('--ignore', action='append', default=[], metavar='GLOB',
+                        help='do not report images matching GLOB (relative to the site root) as unreferenced')
+    add_jobs_argument(parser)
+    add_format_arguments(parser)
+    args = parser.parse_args()
+
+    with issue_output('image-check', args.format, args.quiet, args.directory) as output:
+        stats = check_images(args.directory, args.ignore, resolve_jobs(args.jobs), output)
+
+        print()
+        print("=" * 60)
+        print("SUMMARY")
+        print("=" * 60)
+        print(f"Files scanned: {stats['files']}")
+        print(f"Image references: {stats['references']}")
+        print(f"Missing images: {stats['missing']}")
+        print(f"JPG/PNG references with a WebP available: {stats['webp_available']}")
+        print(f"Unreferenced images: {stats['unreferenced']} of {stats['images']} "
+              f"({stats['unreferenced_bytes'] / 1024 / 1024:.1f} MB)")
+        output.finish(stats)
+
+    return 1 if stats['missing'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
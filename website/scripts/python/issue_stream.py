@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Machine-readable issue output for the checkers (--format, --quiet).
+
+With --format jsonl or sarif, stdout carries only the records, each one
+written and flushed as soon as the file it is in has been checked, so an
+editor or CI job can read results while the run is still going. The text
+report is not printed at all; the summary goes to stderr, or nowhere with
+--quiet.
+
+    jsonl   One JSON object per line: {"type": "issue", "file", "line",
+            "column", "rule", "message", ...}, ending with a
+            {"type": "summary", ...} line.
+    sarif   A SARIF 2.1.0 log whose results array is written one result at
+            a time; the rules seen and the summary (as the invocation's
+            properties) follow the results.
+
+--quiet with the text format prints the summary only.
+"""
+
+import contextlib
+import json
+import os
+import sys
+
+FORMATS = ('text', 'jsonl', 'sarif')
+
+SARIF_VERSION = '2.1.0'
+SARIF_SCHEMA = 'https://json.schemastore.org/sarif-2.1.0.json'
+
+
+class IssueStream:
+    """Where a checker sends its issues. Get one from issue_output()."""
+
+    def __init__(self, tool, format='text', quiet=False, root='.', stream=None):
+        self.tool = tool
+        self.format = format
+        self.root = root
+        self.stream = stream
+        # Whether the checker prints its own text report (banners, per-file issues)
+        self.verbose = format == 'text' and not quiet
+        # Whether issue() records anything
+        self.records = format != 'text'
+        self.count = 0
+        # Rule ids seen, in order (for the SARIF driver)
+        self.rules = {}
+
+    def start(self):
+        if self.format == 'sarif':
+            self.stream.write(f'{{"version": "{SARIF_VERSION}", "$schema": "{SARIF_SCHEMA}", '
+                              f'"runs": [{{"results": [\n')
+            self.stream.flush()
+
+    def relative(self, path):
+        return os.path.relpath(path, self.root).replace(os.sep, '/')
+
+    def issue(self, path, line, column, rule, message, **properties):
+        """Write one issue record. path is a file path; properties are extra JSON fields.
+
+        line and column are None for an issue with a whole file.
+        """
+        if not self.records:
+            return
+        file = self.relative(path)
+        if self.format == 'jsonl':
+            record = {'type': 'issue', 'tool': self.tool, 'file': file, 'line': line, 'column': column,
+                      'rule': rule, 'message': message, **properties}
+            self.stream.write(json.dumps(record, ensure_ascii=False) + '\n')
+        else:
+            self.rules.setdefault(rule)
+            location = {'artifactLocation': {'uri': file, 'uriBaseId': 'SRCROOT'}}
+            if line is not None:
+                location['region'] = {'startLine': line, 'startColumn': column}
+            result = {
+                'ruleId': rule,
+                'level': 'warning',
+                'message': {'text': message},
+                'locations': [{'physicalLocation': location}],
+            }
+            if properties:
+                result['properties'] = properties
+            self.stream.write((',\n' if self.count else '') + json.dumps(result, ensure_ascii=False))
+        self.count += 1
+        self.stream.flush()
+
+    def finish(self, summary):
+        """Write the summary record (a dict of counts) and close the log."""
+        if self.format == 'jsonl':
+            self.stream.write(json.dumps({'type': 'summary', 'tool': self.tool, **summary}) + '\n')
+        elif self.format == 'sarif':
+            driver = {'name': self.tool, 'rules': [{'id': rule} for rule in self.rules]}
+            invocation = {'executionSuccessful': True, 'properties': summary}
+            self.stream.write(f'\n], "tool": {{"driver": {json.dumps(driver, ensure_ascii=False)}}}, '
+                              f'"invocations": [{json.dumps(invocation)}]}}]}}\n')
+        if self.stream is not None:
+            self.stream.flush()
+
+
+@contextlib.contextmanager
+def issue_output(tool, format='text', quiet=False, root='.'):
+    """Context for --format/--quiet. Yields the IssueStream of the run.
+
+    With a record format stdout is the record stream, and everything else
+    printed goes to stderr (to nowhere with quiet); the caller must call
+    finish() before leaving.
+    """
+    if format == 'text':
+        yield IssueStream(tool, format, quiet, root)
+        return
+    output = IssueStream(tool, format, quiet, root, sys.stdout)
+    output.start()
+    if quiet:
+        with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+            yield output
+    else:
+        with contextlib.redirect_stdout(sys.stderr):
+            yield output
+
+
+def add_format_arguments(parser):
+    """Add the --format and --quiet options."""
+    parser.add_argument('--format', choices=FORMATS, default='text',
+                        help='text report, or one JSON record per issue as it is found (jsonl, sarif) '
+                             'on stdout (default: text)')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='print the summary only (with jsonl or sarif: nothing but the records)')
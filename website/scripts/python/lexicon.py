@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Norwegian lexicon for the spellchecker: words that lost their æ/ø/å.
+
+A word list (one form per line, 100k+ forms for a full Bokmål list) is
+indexed once by the ASCII-folded spelling of every form that has an
+æ/ø/å. A word in the page text that is not itself in the list but folds to
+exactly one such form is reported with that form as the fix, so "hoyere"
+becomes "høyere" without a rule for it. Checking a word is one dict
+lookup.
+
+Building the index reads and folds the whole list, so it is cached next
+to the list as JSON and only rebuilt when the list changes.
+"""
+
+import hashlib
+import itertools
+import json
+import os
+import re
+import sys
+
+# Used when --lexicon is not given; the lexicon is off if it does not exist
+DEFAULT_WORD_LIST = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'nb-words.txt')
+
+# Bump when the index layout or the folding changes, so cached indexes are rebuilt
+INDEX_VERSION = 1
+
+# Spellings each letter may have lost its diacritic to; æ is written both ways
+FOLDS = {'æ': ('ae', 'a'), 'ø': ('o',), 'å': ('a',)}
+
+# A run of letters (no digits or underscores)
+WORD_PATTERN = re.compile(r'[^\W\d_]+')
+
+
+def folded_forms(word):
+    """Return every ASCII spelling of a lowercase word with its æ/ø/å folded."""
+    choices = [FOLDS.get(char, (char,)) for char in word]
+    return {''.join(parts) for parts in itertools.product(*choices)}
+
+
+def read_word_list(path):
+    """Return the set of lowercase word forms in a word list.
+
+    Takes the first field of each line, so Hunspell .dic files (word/FLAGS)
+    and tab-separated full-form lists work as they are. Blank lines, #
+    comments and anything that is not a single word are skipped.
+    """
+    words = set()
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            fields = line.split()
+            if not fields or fields[0].startswith('#'):
+                continue
+            word = fields[0].split('/', 1)[0].lower()
+            if WORD_PATTERN.fullmatch(word):
+                words.add(word)
+    return words
+
+
+def build_index(words):
+    """Map each folded spelling to the one form in words it could stand for.
+
+    Spellings that are words themselves, or that fold from more than one
+    form (e.g. "for" from "for" and "før"), are left out: they are never
+    reported.
+    """
+    index = {}
+    ambiguous = set()
+    for word in words:
+        if word.isascii():
+            continue
+        for key in folded_forms(word):
+            if key in words:
+                continue
+            if index.setdefault(key, word) != word:
+                ambiguous.add(key)
+    for key in ambiguous:
+        del index[key]
+    return index
+
+
+def match_case(found, replacement):
+    """Give replacement the capitalisation of found (UPPER, Title or lower)."""
+    if found.isupper() and len(found) > 1:
+        return replacement.upper()
+    if found[0].isupper():
+        return replacement[0].upper() + replacement[1:]
+    return replacement
+
+
+class Lexicon:
+    """Folded-spelling index of a word list. Build it with Lexicon.load()."""
+
+    def __init__(self, index, digest):
+        self.index = index
+        # SHA-1 of the word list, so scan caches expire when it changes
+        self.digest = digest
+
+    @classmethod
+    def load(cls, path):
+        """Return the lexicon of a word list, from its cached index if that is current."""
+        with open(path, 'rb') as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+
+        cache_path = os.path.splitext(path)[0] + '.lexicon-index.json'
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            if cached.get('version') == INDEX_VERSION and cached.get('source') == digest:
+                return cls(cached['index'], digest)
+        except (OSError, ValueError):
+            pass
+
+        index = build_index(read_word_list(path))
+        try:
+            temp_path = cache_path + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': INDEX_VERSION, 'source': digest, 'index': index},
+                          f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(temp_path, cache_path)
+        except OSError as e:
+            print(f"Warning: could not cache the lexicon index ({e})", file=sys.stderr)
+        return cls(index, digest)
+
+    def __len__(self):
+        return len(self.index)
+
+    def finditer(self, content, pos=0, endpos=None):
+        """Yield (start, end, word, replacement) for every folded word in content[pos:endpos]."""
+        index = self.index
+        for match in WORD_PATTERN.finditer(content, pos, len(content) if endpos is None else endpos):
+            word = match.group()
+            # Words with any non-ASCII letter already have their diacritics
+            if word.isascii():
+                form = index.get(word.lower())
+                if form:
+                    yield match.start(), match.end(), word, match_case(word, form)
+
+
+def load_lexicon(path=None):
+    """Return the Lexicon for --lexicon PATH, or None if there is no word list.
+
+    Without PATH the default list is used if it exists; a PATH given
+    explicitly must exist (FileNotFoundError otherwise).
+    """
+    if not path:
+        if not os.path.isfile(DEFAULT_WORD_LIST):
+            return None
+        path = DEFAULT_WORD_LIST
+    return Lexicon.load(path)
+
+
+def add_lexicon_argument(parser):
+    """Add the --lexicon option."""
+    parser.add_argument('--lexicon', metavar='PATH',
+                        help='word list for the lexicon check, one form per line '
+                             f'(default: {os.path.basename(DEFAULT_WORD_LIST)} next to the scripts, if present)')
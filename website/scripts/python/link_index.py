@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Index of the files in the site and resolution of links against it.
+
+Used by fix-broken-links.py to validate every href/src on the site: the
+tree is indexed once into sets, after which checking a link is a path
+normalisation and a set lookup. For links that do not resolve, a character
+trigram index over the file paths finds the closest existing file without
+comparing against every file on the site.
+"""
+
+import os
+import posixpath
+from collections import Counter, defaultdict
+from urllib.parse import quote, unquote, urlsplit, urlunsplit
+
+# Hosts that are this site, so absolute links to them are checked too
+SITE_HOSTS = {'thebackrom.com', 'www.thebackrom.com'}
+
+# Folders that are never part of the deployed site
+INDEX_EXCLUDE_DIRS = {'node_modules', '.git', '.norwegian-spellcheck-backup'}
+
+# Top-level folders holding a translation; suggestions never cross into or out of them
+LANGUAGE_ROOTS = {'en'}
+
+# How many of the best trigram candidates are scored in full
+SUGGESTION_CANDIDATES = 20
+
+
+# Letters folded for matching, so vestibulær-migrene.html finds vestibulaer-migrene.html
+FOLDED_LETTERS = str.maketrans({'æ': 'ae', 'ø': 'o', 'å': 'a', '-': ' ', '_': ' '})
+
+# Share of the score that comes from the filename rather than the folder
+FILENAME_WEIGHT = 0.8
+
+# Lead over the runner-up below which a suggestion loses confidence
+SUGGESTION_MARGIN = 0.1
+
+
+def trigrams(text):
+    """Return the set of character trigrams of text, padded so the ends count too."""
+    text = f' {text} '
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def dice(a, b):
+    """Dice coefficient of two trigram sets."""
+    if not a and not b:
+        return 1.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+def slug_keys(path):
+    """Return (folder, filename) of a path, lowercased, folded and without extension."""
+    folder, filename = posixpath.split(posixpath.splitext(path)[0].lower())
+    # Links escaping the root (../) are compared on the folders inside it
+    folder = '/'.join(part for part in folder.split('/') if part != '..')
+    return folder.translate(FOLDED_LETTERS), filename.translate(FOLDED_LETTERS)
+
+
+def suggestion_partition(path):
+    """Return the (language root, extension) a suggestion for path must share."""
+    top = path.split('/', 1)[0]
+    return (top if top in LANGUAGE_ROOTS else '',
+            posixpath.splitext(path)[1].lower())
+
+
+class FileIndex:
+    """Every file and folder under the site root, as '/'-separated relative paths."""
+
+    def __init__(self, root, exclude_dirs=INDEX_EXCLUDE_DIRS):
+        self.root = root
+        self.files = set()
+        self.dirs = {''}
+
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames if d not in exclude_dirs]
+            rel_dir = os.path.relpath(dirpath, root).replace(os.sep, '/')
+            rel_dir = '' if rel_dir == '.' else rel_dir
+            for dirname in dirnames:
+                self.dirs.add(posixpath.join(rel_dir, dirname))
+            for filename in filenames:
+                self.files.add(posixpath.join(rel_dir, filename))
+
+        self._postings = None
+
+    def add(self, path):
+        """Add a file that has appeared since the index was built."""
+        self.files.add(path)
+        folder = posixpath.dirname(path)
+        while folder and folder not in self.dirs:
+            self.dirs.add(folder)
+            folder = posixpath.dirname(folder)
+        if self._postings is not None and path not in self._ids:
+            self._post(path)
+
+    def remove(self, path):
+        """Drop a file that is gone. Its folders stay; exists() only counts them with an index.html.
+
+        The file keeps its trigram postings, which suggest() skips while it
+        is not in files, so it is not re-indexed if it comes back.
+        """
+        self.files.discard(path)
+
+    def exists(self, target):
+        """Return True if target is a file, or a folder with an index.html."""
+        return target in self.files or (
+            target in self.dirs and posixpath.join(target, 'index.html') in self.files)
+
+    def build_postings(self):
+        """Index every file by the trigrams of its filename, per suggestion_partition().
+
+        suggest() does this on first use; a long-running caller can do it
+        up front so the first suggestion is as quick as the rest.
+        """
+        self._paths = []
+        self._ids = {}
+        self._grams = []
+        self._postings = defaultdict(list)
+        for path in sorted(self.files):
+            self._post(path)
+
+    def _post(self, path):
+        i = len(self._paths)
+        self._paths.append(path)
+        self._ids[path] = i
+        folder, filename = slug_keys(path)
+        self._grams.append((trigrams(folder), trigrams(filename)))
+        partition = suggestion_partition(path)
+        for gram in self._grams[i][1]:
+            self._postings[partition, gram].append(i)
+
+    def suggest(self, target):
+        """Return (path, confidence) for the existing file closest to target, or None.
+
+        Only files with the same extension, in the same language tree, are
+        considered. Candidates come
+        from the filename trigram postings, so the cost depends on how many
+        files share trigrams with target rather than on the size of the
+        site. The score is the Dice coefficient of the filename trigrams,
+        with the folder counting for 1 - FILENAME_WEIGHT. The confidence is
+        the score, lowered by however much the runner-up comes closer than
+        SUGGESTION_MARGIN, since a near tie is a guess.
+        """
+        if self._postings is None:
+            self.build_postings()
+
+        partition = suggestion_partition(target)
+        folder, filename = slug_keys(target)
+        folder_grams, filename_grams = trigrams(folder), trigrams(filename)
+        shared = Counter()
+        for gram in filename_grams:
+            shared.update(self._postings.get((partition, gram), ()))
+        if not shared:
+            return None
+
+        # Files removed since the postings were built are left in them (see remove())
+        if len(self._paths) > len(self.files):
+            for i in [i for i in shared if self._paths[i] not in self.files]:
+                del shared[i]
+            if not shared:
+                return None
+
+        scores = []
+        for i, _ in shared.most_common(SUGGESTION_CANDIDATES):
+            score = (FILENAME_WEIGHT * dice(filename_grams, self._grams[i][1])
+                     + (1 - FILENAME_WEIGHT) * dice(folder_grams, self._grams[i][0]))
+            scores.append((-score, self._paths[i]))
+        scores.sort()
+        best, path = -scores[0][0], scores[0][1]
+        runner_up = -scores[1][0] if len(scores) > 1 else 0.0
+        return path, best - max(0.0, runner_up - (best - SUGGESTION_MARGIN))
+
+class LinkGraph:
+    """Which paths each page links to, and the reverse.
+
+    Lets a watcher recheck the pages linking to a file that appeared or
+    disappeared, without reading any other page.
+    """
+
+    def __init__(self):
+        self.targets = {}
+        self.linkers = defaultdict(set)
+
+    def update(self, page, targets):
+        """Record the set of paths page links to (see resolve_link), replacing what it linked to before."""
+        self.remove(page)
+        self.targets[page] = targets
+        for target in targets:
+            self.linkers[target].add(page)
+
+    def remove(self, page):
+        """Forget the links of a page that is gone."""
+        for target in self.targets.pop(page, ()):
+            self.linkers[target].discard(page)
+            if not self.linkers[target]:
+                del self.linkers[target]
+
+    def pages_linking_to(self, path):
+        """Return the pages with a link to path, including links to the folder of an index.html."""
+        pages = set(self.linkers.get(path, ()))
+        if posixpath.basename(path) == 'index.html':
+            pages.update(self.linkers.get(posixpath.dirname(path), ()))
+        return pages
+
+
+def resolve_link(page, url):
+    """Resolve an href/src value found in page (relative to the site root).
+
+    Returns the site-relative path the link points at, or None for links
+    that do not point into the site (fragments, other hosts, mailto:, ...).
+    Query strings and fragments are dropped, %-escapes decoded, and a path
+    ending in '/' points at that folder's index.html.
+    """
+    url = url.strip()
+    if not url or url.startswith('#'):
+        return None
+
+    parts = urlsplit(url)
+    if parts.scheme or parts.netloc:
+        if parts.scheme not in ('http', 'https', '') or parts.netloc.lower() not in SITE_HOSTS:
+            return None
+        path = parts.path or '/'
+    else:
+        path = parts.path
+        if not path:
+            return None
+
+    path = unquote(path)
+    if path.startswith('/'):
+        target = path.lstrip('/')
+    else:
+        target = posixpath.join(posixpath.dirname(page), path)
+
+    target = posixpath.normpath(target) if target else ''
+    if target == '.':
+        target = ''
+    if path.endswith('/') or not target:
+        target = posixpath.join(target, 'index.html')
+    return target
+
+
+def relink(page, url, target):
+    """Rewrite an href/src value from page so it points at target instead.
+
+    Keeps the form of the original link (relative, root-relative or
+    absolute, with any query string and fragment) and its %-escaping.
+    """
+    parts = urlsplit(url.strip())
+    if parts.scheme or parts.netloc or parts.path.startswith('/'):
+        path = '/' + target
+    else:
+        path = posixpath.relpath(target, posixpath.dirname(page) or '.')
+
+    if parts.path.endswith('/') and posixpath.basename(path) == 'index.html':
+        path = posixpath.dirname(path) + '/'
+    if '%' in parts.path:
+        path = quote(path, safe='/')
+    return urlunsplit(parts._replace(path=path))
@@ -2,295 +2,296 @@
 """
 Norwegian Character Encoding Spellchecker
 Scans HTML files for common Norwegian character encoding issues where
-special characters (ø, å, æ) are missing.
+special characters (ø, å, æ) are missing. The rules are in
+rules/spellcheck-patterns.tsv.
 
 Usage:
-    python norwegian-spellcheck.py [--fix]
+    python norwegian-spellcheck.py [directory] [--fix] [--dry-run] [--diff] [--lexicon PATH] [--jobs N] [--no-cache]
+    python norwegian-spellcheck.py [directory] --format {jsonl,sarif} [--quiet]
+    python norwegian-spellcheck.py [directory] --profile [FILE] [--dead-after N] [--fix --dry-run]
+    python norwegian-spellcheck.py [directory] --list-backups
+    python norwegian-spellcheck.py [directory] --restore [RUN] [--files PATH ...]
+    python norwegian-spellcheck.py [directory] --prune KEEP
 
 Options:
-    --fix    Automatically fix the issues (creates backup first)
+    --fix           Automatically fix the issues (creates backup first)
+    --dry-run       With --fix, go through the fixes without writing them
+    --diff          Print the fixes as a unified diff instead of writing them
+    --lexicon PATH  Also report words that are missing æ/ø/å according to a
+                    word list (default: python/nb-words.txt, if present)
+    --jobs N        Check files in N worker processes (0 = one per CPU)
+    --no-cache      Recheck files that passed before and have not changed since
+    --profile FILE  Count hits, files hit, fixes applied and match time per
+                    rule (see rule_profile.py), print them slowest first and
+                    write them as JSON (default: spellcheck-profile.json);
+                    checks every file, in one process
+    --dead-after N  With --profile, list the rules that matched nothing in
+                    the last N profiled runs (default: 3)
+    --format FMT    text (default), or write each issue to stdout as a JSON
+                    record as soon as its file is checked: jsonl (one object
+                    per line) or sarif (see issue_stream.py)
+    --quiet, -q     Print the summary only
+    --list-backups  List the backed-up --fix runs
+    --restore RUN   Put back the files a --fix run changed (default: the latest run)
+    --files PATH    With --restore, only these paths (relative to directory)
+    --prune KEEP    Keep the newest KEEP runs and delete the rest of the backups
 """
 
+import argparse
 import os
 import re
 import sys
-import shutil
+from collections import deque
+from functools import partial
 from pathlib import Path
-from datetime import datetime
+
+from backup_store import BACKUP_DIR, BackupStore
+from html_scan import text_spans
+from issue_stream import IssueStream, add_format_arguments, issue_output
+from lexicon import add_lexicon_argument, load_lexicon
+from rule_bundle import load_rules
+from rule_profile import RuleProfile, add_profile_arguments
+from site_common import (BYTES_BOUNDARY, BYTES_BOUNDARY_AFTER, BYTES_BOUNDARY_BEFORE, ScanCache,
+                         StagedWrites, add_cache_argument, add_jobs_argument, add_write_arguments,
+                         build_trie_regex, bytes_source, find_html_files, line_offsets, locate,
+                         map_files, patch_output, read_candidate, resolve_jobs, rules_version)
 
 # Fix Windows console encoding
 if sys.platform == 'win32':
     sys.stdout.reconfigure(encoding='utf-8', errors='replace')
 
-# Common Norwegian word patterns that often have encoding issues
+# A pattern that is plain text, optionally wrapped in \b, is folded into a
+# per-shape trie; anything else keeps its own named group in the matcher.
+LITERAL_PATTERN = re.compile(r'^(\\b)?([^\\.^$*+?{}\[\]|()]+)(\\b)?$')
+TEMPLATE_GROUP = re.compile(r'\\(\d+)|\\g<(\d+)>')
+
+
+def pattern_flags(pattern):
+    """Return the regex flags used for a PATTERNS entry."""
+    return re.IGNORECASE if pattern[0] != '\\' or pattern[1].islower() else 0
+
+
+def word_boundary(edge_chars, boundary):
+    """Return the bytes \\b for words whose edge characters are edge_chars.
+
+    boundary is the form to use when every edge character is an ASCII
+    word character (see site_common.bytes_source).
+    """
+    if all(char.isascii() and (char.isalnum() or char == '_') for char in edge_chars):
+        return boundary
+    return BYTES_BOUNDARY
+
+
+def compile_patterns(patterns):
+    """Compile PATTERNS into the sources of one combined regex. Returns them as JSON data.
+
+    Returns {'regex': str source, 'prefilter': bytes source as latin-1 or
+    None, 'literals': {shape: {lowercased text: pattern index}}}.
+    """
+    literals = {}
+    shapes = {}
+    branches = []
+
+    for index, (pattern, replacement, description) in enumerate(patterns):
+        flags = pattern_flags(pattern)
+        literal = LITERAL_PATTERN.match(pattern)
+        if literal and flags & re.IGNORECASE:
+            shape = f'lit_{int(bool(literal.group(1)))}{int(bool(literal.group(3)))}'
+            text = literal.group(2).lower()
+            shapes.setdefault(shape, (literal.group(1) or '', literal.group(3) or '', []))[2].append(text)
+            literals.setdefault(shape, {}).setdefault(text, index)
+        else:
+            body = pattern if flags & re.IGNORECASE else f'(?-i:{pattern})'
+            branches.append(f'(?P<r{index}>{body})')
+
+    literal_branches = []
+    prefilter_branches = []
+    for shape, (before, after, words) in sorted(shapes.items()):
+        trie = build_trie_regex(words)
+        literal_branches.append(f'(?P<{shape}>{before}{trie}{after})')
+        # The trie hides which characters sit next to each \b from bytes_source()
+        prefilter_branches.append(
+            (word_boundary((word[0] for word in words), BYTES_BOUNDARY_BEFORE) if before else b'')
+            + bytes_source(trie, re.IGNORECASE)
+            + (word_boundary((word[-1] for word in words), BYTES_BOUNDARY_AFTER) if after else b''))
+
+    # Same rules over raw bytes, so clean files can be skipped undecoded
+    prefilter_branches += [bytes_source(branch, re.IGNORECASE) for branch in branches]
+    prefilter = None
+    if None not in prefilter_branches:
+        prefilter = b'|'.join(prefilter_branches).decode('latin-1')
+
+    return {'regex': '|'.join(literal_branches + branches), 'prefilter': prefilter, 'literals': literals}
+
+
+class PatternMatcher:
+    """All PATTERNS compiled into a single regex that is run once per file.
+
+    Literal rules are looked up by their lowercased text once the combined
+    regex has matched; regex rules are identified by their named group.
+    When several rules match the same text, the first one in PATTERNS wins.
+    compiled is what compile_patterns() returns for patterns.
+    """
+
+    def __init__(self, patterns, compiled=None):
+        if compiled is None:
+            compiled = compile_patterns(patterns)
+        self.patterns = patterns
+        self.literals = compiled['literals']
+        self.regex = re.compile(compiled['regex'], re.IGNORECASE)
+        self.prefilter = None
+        if compiled['prefilter'] is not None:
+            self.prefilter = re.compile(compiled['prefilter'].encode('latin-1'), re.IGNORECASE)
+
+        # Shift group references in replacements to their place in the combined regex
+        self.templates = {}
+        for name, group in self.regex.groupindex.items():
+            if name.startswith('r'):
+                index = int(name[1:])
+                self.templates[index] = TEMPLATE_GROUP.sub(
+                    lambda m: f'\\g<{group + int(m.group(1) or m.group(2))}>',
+                    patterns[index][1])
+
+    def finditer(self, content, pos=0, endpos=None):
+        """Yield (match, pattern_index, replacement) for every hit in content[pos:endpos], left to right."""
+        for match in self.regex.finditer(content, pos, len(content) if endpos is None else endpos):
+            shape = match.lastgroup
+            if shape in self.literals:
+                index = self.literals[shape][match.group().lower()]
+                yield match, index, self.patterns[index][1]
+            else:
+                index = int(shape[1:])
+                yield match, index, match.expand(self.templates[index])
+
+
+# Bump when compile_patterns() changes, so the cached compiled PATTERNS are rebuilt
+PATTERNS_COMPILER = 1
+
+# Common Norwegian word patterns that often have encoding issues, from
+# rules/spellcheck-patterns.tsv (see rule_bundle.py)
 # Format: (pattern_to_find, correct_replacement, context_description)
-PATTERNS = [
-    # ROUND 4 - Comprehensive quality check patterns (January 2026)
-    # Common sentence patterns where 'a' should be 'å'
-    (r'mulig a:', 'mulig å:', 'possible to:'),
-    (r'mulig a ', 'mulig å ', 'possible to'),
-    (r'viktig a ', 'viktig å ', 'important to'),
-    (r'vanskelig a ', 'vanskelig å ', 'difficult to'),
-    (r'lett a ', 'lett å ', 'easy to'),
-    (r'bedre a ', 'bedre å ', 'better to'),
-    (r'begynne a ', 'begynne å ', 'begin to'),
-    (r'fortsette a ', 'fortsette å ', 'continue to'),
-    (r'prove a ', 'prøve å ', 'try to'),
-    (r'unnga a ', 'unngå å ', 'avoid to'),
-    (r'slutte a ', 'slutte å ', 'stop to'),
-    (r'anbefale a ', 'anbefale å ', 'recommend to'),
-
-    # Environment/miljo patterns
-    (r'\bmiljoer\b', 'miljøer', 'environments'),
-    (r'\bmiljo\b', 'miljø', 'environment'),
-    (r'\bMiljo\b', 'Miljø', 'Environment'),
-
-    # Learning patterns
-    (r'\blare\b', 'lære', 'learn'),
-    (r'\bLare\b', 'Lære', 'Learn'),
-    (r'\blarer\b', 'lærer', 'learns/teacher'),
-    (r'\blarere\b', 'lærere', 'teachers'),
-    (r'\blart\b', 'lært', 'learned'),
-
-    # Understand patterns
-    (r'\bforsta\b', 'forstå', 'understand'),
-    (r'\bForsta\b', 'Forstå', 'Understand'),
-    (r'\bforstar\b', 'forstår', 'understands'),
-    (r'\bforstatt\b', 'forstått', 'understood'),
-
-    # Seek/search patterns
-    (r'\boppsoke\b', 'oppsøke', 'seek out'),
-    (r'\bOppsoke\b', 'Oppsøke', 'Seek out'),
-    (r'\boppsok\b', 'oppsøk', 'seek'),
-    (r'\bOpsok\b', 'Oppsøk', 'Seek'),
-
-    # Common typos (non-Norwegian character issues)
-    (r'\bsekundare\b', 'sekundære', 'secondary'),
-    (r'\bvestibulare\b', 'vestibulære', 'vestibular'),
-    (r'\bVestibulare\b', 'Vestibulære', 'Vestibular'),
-    (r'\bves\btibulaer\b', 'vestibulær', 'vestibular'),
-
-    # ROUND 3 - Final deep dive fixes
-    (r'nær det Utføres', 'når det utføres', 'when performed'),
-    (r'nær det utføres', 'når det utføres', 'when performed'),
-    (r'\boppnær\b', 'oppnår', 'achieve'),
-    (r'\bOppnær\b', 'Oppnår', 'Achieve'),
-
-    # ROUND 2 - Additional errors found
-    (r'\bjegse\b', 'vise', 'show'),
-    (r'\bjegses\b', 'vises', 'is shown'),
-    (r'\bFa hjelp\b', 'Få hjelp', 'get help'),
-    (r'\boresus\b', 'øresus', 'tinnitus'),
-    (r'\bOresus\b', 'Øresus', 'Tinnitus'),
-    (r'\boresymptomer\b', 'øresymptomer', 'ear symptoms'),
-    (r'\bOresymptomer\b', 'Øresymptomer', 'Ear symptoms'),
-    (r'\boresmerter\b', 'øresmerter', 'ear pain'),
-    (r'\bOresmerter\b', 'Øresmerter', 'Ear pain'),
-    (r'\bhorselstap\b', 'hørselstap', 'hearing loss'),
-    (r'\bHorselstap\b', 'Hørselstap', 'Hearing loss'),
-    (r'\bore-nese-hals\b', 'øre-nese-hals', 'ENT'),
-    (r'\bOre-nese-hals\b', 'Øre-nese-hals', 'ENT'),
-    (r'\bPa en\b', 'På en', 'on a'),
-    (r'\bovre\b', 'øvre', 'upper'),
-    (r'\bOvre\b', 'Øvre', 'Upper'),
-    (r'\bapner\b', 'åpner', 'opens'),
-    (r'\bApner\b', 'Åpner', 'Opens'),
-    (r' ore\b', ' øre', 'ear'),
-    (r'\btett ore\b', 'tett øre', 'blocked ear'),
-
-    # HIGH PRIORITY - Common errors found in deep scan
-    (r'\bIfolge\b', 'Ifølge', 'according to'),
-    (r'\bifolge\b', 'ifølge', 'according to'),
-    (r'\bSvaert\b', 'Svært', 'very'),
-    (r'\bsvaert\b', 'svært', 'very'),
-    (r'\bsvert\b', 'svært', 'very'),
-    (r'\bSvert\b', 'Svært', 'very'),
-    (r'\boyet\b', 'øyet', 'the eye'),
-    (r'\boyene\b', 'øynene', 'the eyes'),
-    (r'\bnoytral\b', 'nøytral', 'neutral'),
-    (r'\bNoytral\b', 'Nøytral', 'Neutral'),
-    (r'\bSekundaer\b', 'Sekundær', 'secondary'),
-    (r'\bsekundaer\b', 'sekundær', 'secondary'),
-    (r'\bSekundaere\b', 'Sekundære', 'secondary (plural)'),
-    (r'\bsekundaere\b', 'sekundære', 'secondary (plural)'),
-    (r'\bPrimaer\b', 'Primær', 'primary'),
-    (r'\blaret\b', 'låret', 'the thigh'),
-    (r'\bhoeyt\b', 'høyt', 'high'),
-    (r'\btoeying\b', 'tøying', 'stretching'),
-    (r'\btoeye\b', 'tøye', 'stretch'),
-    (r'\boeker\b', 'øker', 'increases'),
-    (r'\bboeye\b', 'bøye', 'bend'),
-    (r'\bmoeter\b', 'møter', 'meets'),
-    (r'\btoey\b', 'tøy', 'stretch'),
-    (r'\bfoelelse\b', 'følelse', 'feeling'),
-    (r'\bfores\b', 'føres', 'is led'),
-    (r'\blosne\b', 'løsne', 'loosen'),
-    (r'\bmalet\b', 'målet', 'the goal'),
-    (r'\bMalet\b', 'Målet', 'The goal'),
-    (r'\bfolger\b', 'følger', 'follows'),
-    (r'\bFoller\b', 'Følger', 'Follows'),
-    (r'\bpalitelig\b', 'pålitelig', 'reliable'),
-    (r'\bPalitelig\b', 'Pålitelig', 'Reliable'),
-    (r'\butfores\b', 'utføres', 'is performed'),
-    (r'\bUtfores\b', 'Utføres', 'Is performed'),
-    (r'\bvaer\b', 'vær', 'be (imperative)'),
-    (r'\bVaer\b', 'Vær', 'Be (imperative)'),
-    (r'\bhoyeste\b', 'høyeste', 'highest'),
-    (r'\bHoyeste\b', 'Høyeste', 'Highest'),
-    (r'>Ga til\b', '>Gå til', 'Go to (link)'),
-    (r'\bblottvevet\b', 'bløtvevet', 'soft tissue'),
-    (r'\bblottvev\b', 'bløtvev', 'soft tissue'),
-
-    # ø patterns (o → ø)
-    (r'\bboye\b', 'bøye', 'bend'),
-    (r'\bboyer\b', 'bøyer', 'bends'),
-    (r'\bboyes\b', 'bøyes', 'is bent'),
-    (r'\bboyd\b', 'bøyd', 'bent'),
-    (r'\bboyde\b', 'bøyde', 'bent (plural)'),
-    (r'\bhofteboyer', 'hoftebøyer', 'hip flexor'),
-    (r'\bboyesenen\b', 'bøyesenen', 'flexor tendon'),
-    (r'\bhoye\b', 'høye', 'high (plural)'),
-    (r'\bhoyt\b', 'høyt', 'high'),
-    (r'\bhoyere\b', 'høyere', 'higher'),
-    (r'\bhoyden\b', 'høyden', 'the height'),
-    (r'\bHoye\b', 'Høye', 'High (plural)'),
-    (r'\bHoyest\b', 'Høyest', 'Highest'),
-    (r'\bforhoyet\b', 'forhøyet', 'elevated'),
-    (r'\bForhoyet\b', 'Forhøyet', 'Elevated'),
-    (r'\bForhoyede\b', 'Forhøyede', 'Elevated (plural)'),
-    (r'\blose\b', 'løse', 'loose'),
-    (r'\bLose\b', 'Løse', 'Loose'),
-    (r'\blosner\b', 'løsner', 'loosens'),
-    (r'\blosning\b', 'løsning', 'solution'),
-    (r'\boke\b', 'øke', 'increase'),
-    (r'\boker\b', 'øker', 'increases'),
-    (r'\bOker\b', 'Øker', 'Increases'),
-    (r'\bokt\b', 'økt', 'increased'),
-    (r'\bOkt\b', 'Økt', 'Increased'),
-    (r'\bokter\b', 'økter', 'sessions'),
-    (r'\bnoye\b', 'nøye', 'careful'),
-    (r'\bnoyer\b', 'nøyer', 'is careful'),
-    (r'\bblodarer\b', 'blodårer', 'blood vessels'),
-    (r'\bmisnoye\b', 'misnøye', 'dissatisfaction'),
-    (r'\bSok\b', 'Søk', 'Search'),
-    (r'\bsovn\b', 'søvn', 'sleep'),
-    (r'\bSovn\b', 'Søvn', 'Sleep'),
-    (r'\bstotte\b', 'støtte', 'support'),
-    (r'\bstorrelse\b', 'størrelse', 'size'),
-    (r'\brodhet\b', 'rødhet', 'redness'),
-    (r'\bmotes\b', 'møtes', 'meet'),
-    (r'\bryggsoylen\b', 'ryggsøylen', 'the spine'),
-    (r'\bskivehoyden\b', 'skivehøyden', 'disc height'),
-    (r'\bhjorne\b', 'hjørne', 'corner'),
-    (r'\boret\b', 'øret', 'the ear'),
-
-    # mønster (pattern) compound words
-    (r'\bmonster\b', 'mønster', 'pattern'),
-    (r'\bmonsteret\b', 'mønsteret', 'the pattern'),
-    (r'\bgangmonster\b', 'gangmønster', 'gait pattern'),
-    (r'\bsmertemonster\b', 'smertemønster', 'pain pattern'),
-    (r'\bsymptommonster\b', 'symptommønster', 'symptom pattern'),
-    (r'\bnervemonster\b', 'nervemønster', 'nerve pattern'),
-    (r'\bpustemonster\b', 'pustemønster', 'breathing pattern'),
-    (r'\bdermatom-monster\b', 'dermatom-mønster', 'dermatome pattern'),
-    (r'\bbelastningsmonster\b', 'belastningsmønster', 'load pattern'),
-    (r'\btidsmonster\b', 'tidsmønster', 'time pattern'),
-    (r'\bhanske-monster\b', 'hanske-mønster', 'glove pattern'),
-    (r'\bstrompe-hanske-monster\b', 'strømpe-hanske-mønster', 'stocking-glove pattern'),
-    (r'\barsaksmonster\b', 'årsaksmønster', 'cause pattern'),
-    (r'\bStralemonsteret\b', 'Strålemønsteret', 'radiation pattern'),
-    (r'\bbukkehorn-monster\b', 'bukkehorn-mønster', 'rams horn pattern'),
-
-    # å patterns (a → å)
-    (r'\barlig\b', 'årlig', 'yearly'),
-    (r'\bArlig\b', 'Årlig', 'Yearly'),
-    (r'\barene\b', 'årene', 'the years'),
-    (r'\barsaken\b', 'årsaken', 'the cause'),
-    (r'\bArsaken\b', 'Årsaken', 'The cause'),
-    (r'\barsak\b', 'årsak', 'cause'),
-    (r'(\d+)\s+ar\b', r'\1 år', 'X years'),
-    (r'(\d+)-ar\b', r'\1-år', 'X-year'),
-    (r'(\d+)-ars\b', r'\1-års', 'X-year (genitive)'),
-    (r'\bgar\b', 'går', 'goes'),
-    (r'\bsta\b', 'stå', 'stand'),
-    (r'\bSta\b', 'Stå', 'Stand'),
-    (r'\bgatt\b', 'gått', 'gone'),
-    (r'\bgjennomgatt\b', 'gjennomgått', 'gone through'),
-    (r'\bstatt\b', 'stått', 'stood'),
-    (r'\bnar\b', 'når', 'when'),
-    (r'\bNar\b', 'Når', 'When'),
-    (r'\bfar\b', 'får', 'gets'),
-    (r'\bforer\b', 'fører', 'leads'),
-    (r'\bforst\b', 'først', 'first'),
-    (r'\bforste\b', 'første', 'first'),
-    (r'\bForste\b', 'Første', 'First'),
-    (r'\bstorst\b', 'størst', 'biggest'),
-    (r'\bhjornesteinen\b', 'hjørnesteinen', 'cornerstone'),
-    (r'\bStralemonsteret\b', 'Strålemønsteret', 'radiation pattern'),
-    (r'\bpafolgende\b', 'påfølgende', 'following'),
-    (r'\bsamarbeidspartnere\b', 'samarbeidspartnere', 'partners'),
-    (r'\bmalrettet\b', 'målrettet', 'targeted'),
-    (r'\bpatale\b', 'påtale', 'prosecution'),
-    (r'\bsarbar\b', 'sårbar', 'vulnerable'),
-    (r'\bsarbart\b', 'sårbart', 'vulnerable'),
-
-    # æ patterns (ae/e → æ)
-    (r'\bvaert\b', 'vært', 'been'),
-    (r'\bvaere\b', 'være', 'be'),
-    (r'\bnaer\b', 'nær', 'near'),
-    (r'\bNaer\b', 'Nær', 'Near'),
-    (r'\bbaer\b', 'bær', 'berries'),
-    (r'\btaer\b', 'tær', 'toes'),
-    (r'\bhaeler\b', 'hæler', 'heels'),
-    (r'\bhael\b', 'hæl', 'heel'),
-    (r'\bhaelhoyde\b', 'hælhøyde', 'heel height'),
-    (r'\blaere\b', 'lære', 'learn'),
-    (r'\blaerer\b', 'lærer', 'teacher/teaches'),
-    (r'\blaerere\b', 'lærere', 'teachers'),
-    (r'\boyebevegelser\b', 'øyebevegelser', 'eye movements'),
-    (r'\boye\b', 'øye', 'eye'),
-    (r'\bprimaer\b', 'primær', 'primary'),
-    (r'\bprimaerhelsepersonell\b', 'primærhelsepersonell', 'primary healthcare'),
-    (r'\binnebar\b', 'innebær', 'entails'),
-    (r'\binnebarer\b', 'innebærer', 'entails'),
-    (r'\bnaerliggende\b', 'nærliggende', 'nearby'),
-    (r'\bsaerlig\b', 'særlig', 'especially'),
-    (r'\bSaerlig\b', 'Særlig', 'Especially'),
-]
+PATTERNS, COMPILED_PATTERNS = load_rules('spellcheck-patterns', 3, compile_patterns, PATTERNS_COMPILER)
+
+MATCHER = PatternMatcher(PATTERNS, COMPILED_PATTERNS)
+
+# Lexicon of the word list in use (see lexicon.py), or None for PATTERNS only
+LEXICON = None
+
+
+def rules_key():
+    """Return the scan cache version of the rules in use: PATTERNS plus the word list."""
+    if LEXICON is None:
+        return rules_version(PATTERNS)
+    return rules_version((PATTERNS, LEXICON.digest))
+
+
+def candidate_prefilter():
+    """Return the bytes regex a file must match to be checked, or None to check every file.
+
+    Any word can be a lexicon hit, so with a lexicon every file is read.
+    """
+    return MATCHER.prefilter if LEXICON is None else None
+
+
+class Issue:
+    """One issue found in a file.
+
+    Slotted, since a long report creates a great many of them. file and
+    description are references to the strings shared by all issues of a
+    file or rule, and the context is only sliced when an issue is printed
+    (see issue_context).
+    """
+
+    __slots__ = ('file', 'line', 'column', 'found', 'replacement', 'description', 'start', 'end', 'rule')
+
+    def __init__(self, file, line, column, found, replacement, description, start, end, rule=None):
+        self.file = file
+        self.line = line
+        self.column = column
+        self.found = found
+        self.replacement = replacement
+        self.description = description
+        self.start = start
+        self.end = end
+        # Index of the PATTERNS rule that found it, None for the lexicon
+        self.rule = rule
+
+
+# Description of the issues found by the lexicon
+LEXICON_DESCRIPTION = 'lexicon'
+
+
+def issue_context(content, issue, width=30):
+    """Return the text surrounding an issue, on a single line."""
+    start = max(0, issue.start - width)
+    end = min(len(content), issue.end + width)
+    return content[start:end].replace('\n', ' ')
+
+
+def span_hits(content, span_start, span_end):
+    """Yield (start, end, found, replacement, rule) for the hits in one text span, left to right.
+
+    rule is the index of the PATTERNS entry, or None for a lexicon hit.
+    PATTERNS hits come first: a lexicon hit overlapping one is dropped.
+    """
+    pattern_hits = ((match.start(), match.end(), match.group(), replacement, index)
+                    for match, index, replacement in MATCHER.finditer(content, span_start, span_end))
+    if LEXICON is None:
+        yield from pattern_hits
+        return
+
+    pattern_hit = next(pattern_hits, None)
+    last_end = -1
+    for start, end, word, replacement in LEXICON.finditer(content, span_start, span_end):
+        while pattern_hit is not None and pattern_hit[0] < end:
+            yield pattern_hit
+            last_end = pattern_hit[1]
+            pattern_hit = next(pattern_hits, None)
+        if start >= last_end:
+            yield start, end, word, replacement, None
+    if pattern_hit is not None:
+        yield pattern_hit
+        yield from pattern_hits
+
 
 def find_issues(file_path, content):
-    """Find all encoding issues in the content."""
-    issues = []
-    for pattern, replacement, description in PATTERNS:
-        for match in re.finditer(pattern, content, re.IGNORECASE if pattern[0] != '\\' or pattern[1].islower() else 0):
-            # Get line number
-            line_num = content[:match.start()].count('\n') + 1
-            # Get context (surrounding text)
-            start = max(0, match.start() - 30)
-            end = min(len(content), match.end() + 30)
-            context = content[start:end].replace('\n', ' ')
-
-            issues.append({
-                'file': file_path,
-                'line': line_num,
-                'found': match.group(),
-                'replacement': replacement,
-                'description': description,
-                'context': context,
-                'start': match.start(),
-                'end': match.end()
-            })
-    return issues
-
-def fix_issues(content, issues):
-    """Apply fixes to the content."""
-    # Sort issues by position in reverse order to avoid position shifts
-    sorted_issues = sorted(issues, key=lambda x: x['start'], reverse=True)
-
-    for issue in sorted_issues:
+    """Yield the encoding issues in the visible text of the content, in order.
+
+    Only text nodes and text attributes are checked (see html_scan), so
+    scripts, styles, URLs and class names are never reported or rewritten.
+    With a LEXICON, words it knows the æ/ø/å form of are reported too,
+    unless a PATTERNS rule already matched them. Issues are made one at a
+    time, so the same stream can be reported (IssueReport) and fixed
+    (fix_issues) in one go. Lines and columns come from a line_offsets()
+    index built on the first hit.
+    """
+    offsets = None
+    for span_start, span_end in text_spans(content):
+        for start, end, found, replacement, rule in span_hits(content, span_start, span_end):
+            # Index the line starts on the first hit, so clean files never build it
+            if offsets is None:
+                offsets = line_offsets(content)
+            line_num, column = locate(offsets, start)
+            description = LEXICON_DESCRIPTION if rule is None else PATTERNS[rule][2]
+            yield Issue(file_path, line_num, column, found, replacement, description, start, end, rule)
+
+def fix_issues(content, issues, applied=None):
+    """Apply fixes to the content.
+
+    issues are consumed as they come, in start order as find_issues()
+    yields them; one that starts inside an issue already applied is
+    skipped. applied, if given, is called with each issue that is fixed.
+    """
+    segments = []
+    pos = 0
+
+    for issue in issues:
+        if issue.start < pos:
+            continue
+
         # Preserve case when replacing
-        found = issue['found']
-        replacement = issue['replacement']
+        found = issue.found
+        replacement = issue.replacement
 
         # Handle case matching
         if found.isupper():
@@ -298,91 +299,304 @@ def fix_issues(content, issues):
         elif found[0].isupper():
             replacement = replacement[0].upper() + replacement[1:]
 
-        content = content[:issue['start']] + replacement + content[issue['end']:]
-
-    return content
-
-def scan_directory(directory, fix=False):
-    """Scan all HTML files in the directory."""
+        segments.append(content[pos:issue.start])
+        segments.append(replacement)
+        pos = issue.end
+        if applied is not None:
+            applied(issue)
+
+    segments.append(content[pos:])
+    return ''.join(segments)
+
+def use_matcher(matcher, lexicon=None):
+    """Pool initializer: install the compiled PATTERNS and the lexicon in a worker process."""
+    global MATCHER, LEXICON
+    MATCHER = matcher
+    LEXICON = lexicon
+
+# Per-rule counters of a --profile run (see rule_profile.py), or None
+PROFILE = None
+
+# Name the lexicon goes by in a profile, where it counts as one rule
+LEXICON_RULE = '(lexicon)'
+
+def start_profile(fixing):
+    """Install and return a RuleProfile of PATTERNS, plus the lexicon if one is in use."""
+    global PROFILE
+    rules = list(PATTERNS)
+    scanners = [(index, re.compile(pattern, pattern_flags(pattern)).finditer)
+                for index, (pattern, _, _) in enumerate(PATTERNS)]
+    if LEXICON is not None:
+        rules.append((LEXICON_RULE, '', LEXICON_DESCRIPTION))
+        scanners.append((len(PATTERNS), LEXICON.finditer))
+    PROFILE = RuleProfile('norwegian-spellcheck', rules, scanners, fixing)
+    return PROFILE
+
+def profile_rule(issue):
+    """Return the position in PROFILE of the rule that found an issue."""
+    return len(PATTERNS) if issue.rule is None else issue.rule
+
+def profile_hits(issues):
+    """Yield issues unchanged, counting them in PROFILE."""
+    for issue in issues:
+        PROFILE.hit(profile_rule(issue))
+        yield issue
+
+def profile_fix(issue):
+    PROFILE.fix(profile_rule(issue))
+
+
+class IssueReport:
+    """The printed report of one file, fed from its issue stream.
+
+    tap() passes the issues on unchanged (to fix_issues, say) while it
+    counts them and keeps the first few; print() then writes the report.
+    """
+
+    def __init__(self, rel_path, content, shown=10):
+        self.rel_path = rel_path
+        self.content = content
+        self.shown = shown
+        self.issues = []
+        self.count = 0
+
+    def tap(self, issues):
+        """Yield issues unchanged, recording them for the report."""
+        for issue in issues:
+            self.count += 1
+            if len(self.issues) < self.shown:
+                self.issues.append(issue)
+            yield issue
+
+    def print(self):
+        """Print the issues recorded so far."""
+        print(f"\n{self.rel_path} ({self.count} issues):")
+        print("-" * 40)
+
+        for issue in self.issues:  # Show the first few issues per file
+            print(f"  Line {issue.line}, col {issue.column}: '{issue.found}' -> '{issue.replacement}' ({issue.description})")
+            print(f"    Context: ...{issue_context(self.content, issue)}...")
+
+        if self.count > len(self.issues):
+            print(f"  ... and {self.count - len(self.issues)} more issues")
+
+def backup_file(file_path, directory):
+    """Store a file in the backup store before it is fixed. Returns the content hash.
+
+    The caller records the hash in the run's manifest (BackupRun.add).
+    """
+    return BackupStore(directory).store(file_path)
+
+def check_file(file_path, directory, fix=False, show=True, collect=False):
+    """Check one file and, with show, print its issues.
+
+    Returns (issues found, change, issues), or None if the file could not
+    be read. With fix, change is (original, fixed) text for StagedWrites;
+    otherwise it is None. With collect, issues is the list of Issues for
+    an IssueStream; otherwise it is None. Nothing is written here.
+    """
+    if PROFILE is not None:
+        PROFILE.start_file()
+    try:
+        content = read_candidate(file_path, candidate_prefilter())
+    except UnicodeDecodeError:
+        print(f"Warning: Could not read {file_path} (encoding issue)")
+        return None
+
+    if content is None:
+        return 0, None, None
+
+    report = IssueReport(os.path.relpath(file_path, directory), content, shown=10 if show else 0)
+    issues = report.tap(find_issues(file_path, content))
+    if PROFILE is not None:
+        PROFILE.time_rules(content)
+        issues = profile_hits(issues)
+    if collect:
+        issues = collected = list(issues)
+    if fix:
+        fixed = fix_issues(content, issues, applied=profile_fix if PROFILE is not None else None)
+    else:
+        deque(issues, maxlen=0)
+    if not report.count:
+        return 0, None, None
+
+    if show:
+        report.print()
+    return report.count, (content, fixed) if fix else None, collected if collect else None
+
+def issue_rule(issue):
+    """Return the rule id of an issue in --format output: its pattern, or 'lexicon'."""
+    return LEXICON_DESCRIPTION if issue.rule is None else PATTERNS[issue.rule][0]
+
+def scan_directory(directory, fix=False, jobs=1, use_cache=True, dry_run=False, diff=None, output=None):
+    """Scan all HTML files in the directory.
+
+    Files that are unchanged since they last came out clean are skipped.
+    With fix the fixed files are backed up and written together at the end
+    (see StagedWrites), unless dry_run; with diff (a stream) the fixes are
+    written to it as a unified diff instead. output is the IssueStream
+    (see issue_stream.py) the issues and the summary go to; without it the
+    text report is printed.
+    """
+    if output is None:
+        output = IssueStream('norwegian-spellcheck')
     total_issues = 0
     files_with_issues = 0
 
-    print(f"\n{'='*60}")
-    print(f"Norwegian Character Encoding Spellchecker")
-    print(f"{'='*60}")
-    print(f"Scanning: {directory}")
-    print(f"Mode: {'FIX' if fix else 'SCAN ONLY'}")
-    print(f"{'='*60}\n")
+    if output.verbose:
+        print(f"\n{'='*60}")
+        print(f"Norwegian Character Encoding Spellchecker")
+        print(f"{'='*60}")
+        print(f"Scanning: {directory}")
+        if diff:
+            mode = 'DIFF'
+        elif fix:
+            mode = 'DRY RUN' if dry_run else 'FIX'
+        else:
+            mode = 'SCAN ONLY'
+        print(f"Mode: {mode}")
+        if LEXICON is not None:
+            print(f"Lexicon: {len(LEXICON)} folded spellings")
+        print(f"{'='*60}\n")
 
     # Directories to exclude (English content)
-    exclude_dirs = {'en', 'node_modules', '.norwegian-spellcheck-backup'}
-
-    for root, dirs, files in os.walk(directory):
-        # Skip excluded directories
-        dirs[:] = [d for d in dirs if d not in exclude_dirs]
-        for file in files:
-            if file.endswith('.html'):
-                file_path = os.path.join(root, file)
-
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                except UnicodeDecodeError:
-                    print(f"Warning: Could not read {file_path} (encoding issue)")
-                    continue
-
-                issues = find_issues(file_path, content)
-
-                if issues:
-                    files_with_issues += 1
-                    total_issues += len(issues)
-
-                    rel_path = os.path.relpath(file_path, directory)
-                    print(f"\n{rel_path} ({len(issues)} issues):")
-                    print("-" * 40)
-
-                    for issue in issues[:10]:  # Show first 10 issues per file
-                        print(f"  Line {issue['line']}: '{issue['found']}' -> '{issue['replacement']}' ({issue['description']})")
-                        print(f"    Context: ...{issue['context']}...")
-
-                    if len(issues) > 10:
-                        print(f"  ... and {len(issues) - 10} more issues")
-
-                    if fix:
-                        # Create backup
-                        backup_dir = os.path.join(directory, '.norwegian-spellcheck-backup')
-                        os.makedirs(backup_dir, exist_ok=True)
-                        backup_path = os.path.join(backup_dir, f"{file}.{datetime.now().strftime('%Y%m%d_%H%M%S')}.bak")
-                        shutil.copy2(file_path, backup_path)
-
-                        # Apply fixes
-                        fixed_content = fix_issues(content, issues)
-                        with open(file_path, 'w', encoding='utf-8') as f:
-                            f.write(fixed_content)
-                        print(f"  -> Fixed! Backup saved to: {backup_path}")
+    exclude_dirs = {'en', 'node_modules', BACKUP_DIR}
+    html_files = find_html_files(directory, exclude_dirs)
+
+    cache = ScanCache(directory, {'norwegian-spellcheck': rules_key()}, enabled=use_cache)
+    html_files, skipped = cache.filter(html_files)
+
+    store = BackupStore(directory)
+    run = store.new_run()
+    writes = StagedWrites(directory, write=fix and not dry_run, diff=diff)
+    check = partial(check_file, directory=directory, fix=fix or diff is not None,
+                    show=output.verbose, collect=output.records)
+    for file_path, result in map_files(check, html_files, jobs,
+                                       initializer=use_matcher, initargs=(MATCHER, LEXICON)):
+        if result is None:
+            continue
+        count, change, issues = result
+        for issue in issues or ():
+            output.issue(file_path, issue.line, issue.column, issue_rule(issue),
+                         f"'{issue.found}' -> '{issue.replacement}' ({issue.description})",
+                         found=issue.found, replacement=issue.replacement)
+        if count:
+            files_with_issues += 1
+            total_issues += count
+        else:
+            cache.mark_clean(file_path)
+        if change:
+            writes.stage(file_path, *change)
+
+    # Back up everything first, so a failed commit leaves nothing unrecoverable
+    for file_path in writes.staged:
+        run.add(file_path, backup_file(file_path, directory))
+    run_name = run.save()
+    files_written = writes.commit()
+    cache.save()
 
     print(f"\n{'='*60}")
     print(f"SUMMARY")
     print(f"{'='*60}")
     print(f"Total issues found: {total_issues}")
     print(f"Files with issues: {files_with_issues}")
+    print(f"Unchanged files skipped: {len(skipped)}")
+    if files_written:
+        print(f"Files written: {files_written}")
 
     if not fix and total_issues > 0:
         print(f"\nTo fix these issues, run: python norwegian-spellcheck.py --fix")
-    elif fix and total_issues > 0:
-        print(f"\nAll issues have been fixed. Backups saved in .norwegian-spellcheck-backup/")
+    elif files_written:
+        print(f"\nAll issues have been fixed. Backup run: {run_name} "
+              f"(undo with: python norwegian-spellcheck.py --restore {run_name})")
 
+    output.finish({'issues': total_issues, 'files_with_issues': files_with_issues,
+                   'files_skipped': len(skipped), 'files_written': files_written})
     return total_issues
 
+def list_backups(directory):
+    """Print the backed-up --fix runs, oldest first."""
+    store = BackupStore(directory)
+    runs = store.runs()
+    if not runs:
+        print(f"No backups in {store.path}")
+        return
+    for run in runs:
+        print(f"  {run}: {len(store.manifest(run))} file(s)")
+
+def restore_backup(directory, run=None, paths=None):
+    """Restore the files of a --fix run (default: the latest). Returns 0 on success."""
+    store = BackupStore(directory)
+    runs = store.runs()
+    if run is None:
+        if not runs:
+            print(f"No backups in {store.path}")
+            return 1
+        run = runs[-1]
+    elif run not in runs:
+        print(f"Error: no backup run {run} (see --list-backups)")
+        return 1
+
+    restored = store.restore(run, paths)
+    for rel_path in restored:
+        print(f"  Restored: {rel_path}")
+    print(f"\nRestored {len(restored)} file(s) from {run}")
+    return 0
+
 def main():
     # Get the directory of this script
     script_dir = os.path.dirname(os.path.abspath(__file__))
 
-    # Check for --fix flag
-    fix = '--fix' in sys.argv
+    parser = argparse.ArgumentParser(description='Norwegian character encoding spellchecker')
+    parser.add_argument('directory', nargs='?', default=script_dir,
+                        help='directory to scan (default: the script directory)')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--fix', action='store_true',
+                      help='automatically fix the issues (creates backup first)')
+    mode.add_argument('--list-backups', action='store_true', help='list the backed-up --fix runs')
+    mode.add_argument('--restore', nargs='?', const='', metavar='RUN',
+                      help='put back the files a --fix run changed (default: the latest run)')
+    mode.add_argument('--prune', type=int, metavar='KEEP',
+                      help='keep the newest KEEP runs and delete the rest of the backups')
+    parser.add_argument('--files', nargs='+', metavar='PATH',
+                        help='with --restore, only these paths (relative to directory)')
+    add_write_arguments(parser)
+    add_lexicon_argument(parser)
+    add_jobs_argument(parser)
+    add_cache_argument(parser)
+    add_profile_arguments(parser, 'spellcheck-profile.json')
+    add_format_arguments(parser)
+    args = parser.parse_args()
+    if args.diff and args.format != 'text':
+        parser.error('--diff writes to stdout; it cannot be combined with --format ' + args.format)
+
+    if args.list_backups:
+        list_backups(args.directory)
+        return 0
+    if args.restore is not None:
+        return restore_backup(args.directory, args.restore or None, args.files)
+    if args.prune is not None:
+        runs, blobs = BackupStore(args.directory).prune(max(0, args.prune))
+        print(f"Removed {runs} run(s) and {blobs} unreferenced backup blob(s)")
+        return 0
+
+    try:
+        use_matcher(MATCHER, load_lexicon(args.lexicon))
+    except FileNotFoundError as e:
+        parser.error(str(e))
+
+    # The profile covers the whole tree, counted in this process
+    profile = start_profile(fixing=args.fix or args.diff) if args.profile else None
 
     # Scan the directory
-    total_issues = scan_directory(script_dir, fix=fix)
+    with patch_output(args.diff) as diff, \
+            issue_output('norwegian-spellcheck', args.format, args.quiet, args.directory) as output:
+        total_issues = scan_directory(args.directory, fix=args.fix,
+                                      jobs=1 if profile else resolve_jobs(args.jobs),
+                                      use_cache=not (args.no_cache or profile), dry_run=args.dry_run,
+                                      diff=diff, output=output)
+        if profile:
+            profile.finish(args.directory, args.profile, args.dead_after)
 
     return 0 if total_issues == 0 else 1
 
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Rule tables of the maintenance scripts, loaded from the files in rules/.
+
+Each table is a tab-separated file: one rule per line, # comment lines
+and blank lines skipped, and a field starting with # after a rule's own
+fields is a comment too. The scripts compile their tables into regexes
+and lookup tables; that work is done once and kept, together with the
+parsed rules, in one bundle (rules/.rule-bundle.json) shared by all the
+scripts. A table is read back from the bundle as long as its file's hash
+and the script's compiler version match, so startup does not parse or
+compile the rules again however many there are; only re.compile() of
+the finished regex sources is left.
+"""
+
+import hashlib
+import json
+import os
+import sys
+
+# Folder of the rule files
+RULES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rules')
+
+# Compiled rules of every table, keyed by table name
+BUNDLE_PATH = os.path.join(RULES_DIR, '.rule-bundle.json')
+
+# Bump when the bundle layout changes, so bundles are rebuilt
+BUNDLE_VERSION = 1
+
+
+def use_bundle(path):
+    """Keep the compiled rules in path instead of BUNDLE_PATH (a benchmark's own copy, say).
+
+    Call it before the scripts that load rules are imported.
+    """
+    global BUNDLE_PATH
+    BUNDLE_PATH = path
+
+
+def read_rule_file(path, fields, text=None):
+    """Return the rules of a rule file as tuples of fields strings.
+
+    Raises ValueError naming the line of a rule with too few or too many
+    fields.
+    """
+    if text is None:
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+    rules = []
+    for line_num, line in enumerate(text.splitlines(), 1):
+        if not line.strip() or line.startswith('#'):
+            continue
+        values = line.split('\t')
+        # A trailing comment field
+        if len(values) > fields and values[fields].startswith('#'):
+            values = values[:fields]
+        if len(values) != fields:
+            raise ValueError(f"{path}:{line_num}: expected {fields} tab-separated fields, got {len(values)}")
+        rules.append(tuple(values))
+    return rules
+
+
+def read_bundle():
+    try:
+        with open(BUNDLE_PATH, 'r', encoding='utf-8') as f:
+            bundle = json.load(f)
+        if bundle.get('version') == BUNDLE_VERSION:
+            return bundle
+    except (OSError, ValueError):
+        pass
+    return {'version': BUNDLE_VERSION, 'tables': {}}
+
+
+def load_rules(name, fields, compile_rules=None, compiler_version=1):
+    """Return (rules, compiled) for the table rules/<name>.tsv.
+
+    compile_rules(rules) returns the table's compiled form as JSON data
+    (bytes regex sources as latin-1 strings, say); compiled is None
+    without it. Both come from the bundle when it is current, and are
+    added to it otherwise. Bump compiler_version when compile_rules
+    changes.
+    """
+    path = os.path.join(RULES_DIR, name + '.tsv')
+    with open(path, 'rb') as f:
+        data = f.read()
+    digest = hashlib.sha1(data).hexdigest()
+
+    cached = read_bundle()['tables'].get(name)
+    if cached and cached['source'] == digest and cached['compiler'] == compiler_version:
+        return [tuple(rule) for rule in cached['rules']], cached['compiled']
+
+    rules = read_rule_file(path, fields, data.decode('utf-8'))
+    compiled = compile_rules(rules) if compile_rules else None
+
+    # Read again just before writing, to keep the tables other scripts added meanwhile
+    bundle = read_bundle()
+    bundle['tables'][name] = {'source': digest, 'compiler': compiler_version,
+                              'rules': rules, 'compiled': compiled}
+    try:
+        temp_path = f'{BUNDLE_PATH}.{os.getpid()}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(bundle, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(temp_path, BUNDLE_PATH)
+    except OSError as e:
+        print(f"Warning: could not cache the compiled {name} rules ({e})", file=sys.stderr)
+    return rules, compiled
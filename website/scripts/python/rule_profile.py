@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Per-rule profile of a rule table (spellcheck PATTERNS, encoding REPLACEMENTS).
+
+With --profile a script counts, for every rule, how often it matched, on
+how many files, how many of its fixes were applied and how long the
+rule's own regex takes to run over the pages that were checked. The rules
+run as one combined regex, whose time cannot be split between them, so
+each rule is also run on its own for the timing; the counts come from the
+real run.
+
+Every profiled run is added to a history in the site root, so a rule that
+has matched nothing on the whole tree for the last N runs can be reported
+as dead.
+"""
+
+import json
+import os
+import sys
+import time
+from collections import Counter
+from datetime import datetime
+
+# History of profiled runs, stored in the scanned root
+HISTORY_NAME = '.rule-profile-history.json'
+
+# Profiled runs kept in the history per tool
+HISTORY_RUNS = 20
+
+# Runs without a match after which a rule is reported dead
+DEAD_AFTER = 3
+
+
+class RuleStats:
+    """Counters of one rule."""
+
+    __slots__ = ('hits', 'files', 'seconds', 'fixes')
+
+    def __init__(self):
+        self.hits = 0
+        self.files = 0
+        self.seconds = 0.0
+        self.fixes = 0
+
+
+class RuleProfile:
+    """Per-rule counters for one run of a tool.
+
+    rules is a list of (pattern, replacement, description), in table
+    order. Rules are referred to by their position in the list, and across
+    runs in the history by their pattern and replacement (numbered if the
+    table lists the same rule twice). scanners is a list of
+    (rule, finditer) running one rule on its own, for time_rules().
+    """
+
+    def __init__(self, tool, rules, scanners=(), fixing=True):
+        self.tool = tool
+        self.rules = rules
+        self.scanners = scanners
+        self.fixing = fixing
+        self.stats = [RuleStats() for _ in rules]
+        self.keys = []
+        seen = Counter()
+        for pattern, replacement, _ in rules:
+            key = f'{pattern} -> {replacement}'
+            seen[key] += 1
+            self.keys.append(key if seen[key] == 1 else f'{key} #{seen[key]}')
+        self.files = 0
+        self._file_hits = set()
+
+    def start_file(self):
+        """Start counting the hits of the next file."""
+        self.files += 1
+        self._file_hits = set()
+
+    def hit(self, rule):
+        stats = self.stats[rule]
+        stats.hits += 1
+        if rule not in self._file_hits:
+            self._file_hits.add(rule)
+            stats.files += 1
+
+    def fix(self, rule):
+        self.stats[rule].fixes += 1
+
+    def time_rules(self, content):
+        """Run each rule's scanner over content on its own, timing it."""
+        for rule, finditer in self.scanners:
+            start = time.perf_counter()
+            for _ in finditer(content):
+                pass
+            self.stats[rule].seconds += time.perf_counter() - start
+
+    def record(self, root, dead_after=DEAD_AFTER):
+        """Add this run to the history in root. Returns (dead rule positions, runs in the history).
+
+        A rule is dead when it has had no hits in each of the last
+        dead_after runs; until there are that many, none is.
+        """
+        path = os.path.join(root, HISTORY_NAME)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                history = json.load(f)
+        except (OSError, ValueError):
+            history = {}
+
+        runs = history.setdefault(self.tool, [])
+        runs.append({
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'files': self.files,
+            'hits': {key: stats.hits for key, stats in zip(self.keys, self.stats)},
+        })
+        del runs[:-HISTORY_RUNS]
+
+        temp_path = path + '.tmp'
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(history, f, ensure_ascii=False, indent=1)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"Warning: could not save the profile history ({e})", file=sys.stderr)
+
+        recent = runs[-dead_after:] if dead_after > 0 else []
+        if len(recent) < dead_after:
+            return set(), len(runs)
+        # A rule added since one of the recent runs is not dead yet
+        dead = {rule for rule, key in enumerate(self.keys)
+                if all(run['hits'].get(key, 1) == 0 for run in recent)}
+        return dead, len(runs)
+
+    def report(self, dead=()):
+        """Return the profile as a JSON-serializable dict."""
+        return {
+            'tool': self.tool,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'files': self.files,
+            'fixing': self.fixing,
+            'rules': [{
+                'pattern': pattern,
+                'replacement': replacement,
+                'description': description,
+                'hits': stats.hits,
+                'files': stats.files,
+                'seconds': round(stats.seconds, 6),
+                'fixes': stats.fixes if self.fixing else None,
+                'dead': rule in dead,
+            } for rule, ((pattern, replacement, description), stats) in enumerate(zip(self.rules, self.stats))],
+        }
+
+    def write(self, path, dead=()):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(dead), f, ensure_ascii=False, indent=1)
+
+    def print_table(self, dead=(), runs=0, dead_after=DEAD_AFTER):
+        """Print the rules slowest first, then the dead ones."""
+        order = sorted(range(len(self.rules)),
+                       key=lambda rule: (-self.stats[rule].seconds, -self.stats[rule].hits, rule))
+        total = sum(stats.seconds for stats in self.stats)
+
+        print(f"\n{'='*60}")
+        print(f"Rule profile: {len(self.rules)} rules over {self.files} files "
+              f"({total:.3f}s standalone match time)")
+        print(f"{'='*60}")
+        print(f"  {'time (ms)':>10} {'hits':>7} {'files':>6} {'fixes':>6}  rule")
+        for rule in order:
+            stats = self.stats[rule]
+            fixes = stats.fixes if self.fixing else '-'
+            pattern, replacement, _ = self.rules[rule]
+            print(f"  {stats.seconds * 1000:>10.2f} {stats.hits:>7} {stats.files:>6} {fixes:>6}  "
+                  f"{pattern!r} -> {replacement!r}")
+
+        if dead_after <= 0:
+            return
+        if runs < dead_after:
+            print(f"\nDead rules: need {dead_after} profiled runs, have {runs}")
+        elif dead:
+            print(f"\nDead rules (no match in the last {dead_after} runs): {len(dead)}")
+            for rule in sorted(dead):
+                pattern, replacement, description = self.rules[rule]
+                print(f"  {pattern!r} -> {replacement!r}" + (f" ({description})" if description else ''))
+        else:
+            print(f"\nNo dead rules: every rule matched in the last {dead_after} runs")
+
+    def finish(self, root, path, dead_after=DEAD_AFTER):
+        """Record the run, print the table and write the JSON profile to path."""
+        dead, runs = self.record(root, dead_after)
+        self.print_table(dead, runs, dead_after)
+        self.write(path, dead)
+        print(f"\nProfile written to {path}")
+
+
+def add_profile_arguments(parser, default_path):
+    """Add the --profile and --dead-after options."""
+    parser.add_argument('--profile', nargs='?', const=default_path, metavar='FILE',
+                        help='count hits, files, fixes and match time per rule, write them to FILE '
+                             f'(default: {default_path}) and print them; checks every file in one process')
+    parser.add_argument('--dead-after', type=int, default=DEAD_AFTER, metavar='N',
+                        help=f'with --profile, report rules with no match in the last N profiled runs '
+                             f'(default: {DEAD_AFTER}, 0 = never)')
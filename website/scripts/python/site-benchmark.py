@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+"""
+Site Script Benchmark
+Times the maintenance scripts on synthetic sites (see site_corpus.py) of
+1x, 10x and 100x the size of the real one, so a change to a script can be
+measured before it meets the real tree, and a slowdown is caught when the
+site grows.
+
+Each tool runs in a fresh process, single-threaded and with its caches
+removed, so every run starts cold: startup, training and indexing count.
+The fixers run in dry-run mode: they find and apply every fix in memory
+but write nothing, so all tools see the same tree. For each run the
+benchmark records the wall time, files/sec and MB/sec over the pages the
+tool covers, the peak RSS of the process and the time spent in each stage
+(self time: a stage's time excludes the stages it calls; "other" is the
+rest).
+
+Tools:
+    fix-encoding      fix-encoding.py (Norwegian pages)
+    spellcheck        norwegian-spellcheck.py --fix (Norwegian pages)
+    fix-broken-links  fix-broken-links.py --fix (en/ pages)
+    link-check        fix-broken-links.py --check --fix (all pages)
+    update-sitemap    update-sitemap.py (all pages)
+    image-check       image-check.py (all pages)
+
+Usage:
+    python site-benchmark.py [--scales 1,10,100] [--tools ...] [--repeat N] [--output FILE] [--compare BASELINE.json]
+
+Options:
+    --scales    Comma-separated site sizes relative to the real site (default: 1,10,100)
+    --tools     Comma-separated tools to run (default: all)
+    --repeat N  Run each tool N times and keep the fastest run (default: 1)
+    --output    Where to write the results as JSON (default: site-benchmark.json)
+    --compare   Results of an earlier run; prints the change per tool and
+                exits with 1 if a tool got slower by more than --threshold
+    --workdir   Where to generate the sites (default: a temporary folder)
+    --keep      Keep the generated sites
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+
+import rule_bundle
+from site_corpus import add_corpus_arguments, generate_site
+
+# Fix Windows console encoding
+if sys.platform == 'win32':
+    sys.stdout.reconfigure(encoding='utf-8', errors='replace')
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+TOOLS = ('fix-encoding', 'spellcheck', 'fix-broken-links', 'link-check', 'update-sitemap', 'image-check')
+
+# Pages each tool goes through: Norwegian, English or all of them
+TOOL_PAGES = {
+    'fix-encoding': 'nb',
+    'spellcheck': 'nb',
+    'fix-broken-links': 'en',
+    'link-check': 'all',
+    'update-sitemap': 'all',
+    'image-check': 'all',
+}
+
+# Compiled rule bundle of the benchmark runs, kept in the site root so the
+# scripts' own bundle (rule_bundle.BUNDLE_PATH) is left alone
+BUNDLE_FILE = '.rule-bundle.json'
+
+# Caches the tools leave in the site root, removed before every run
+CACHE_FILES = ('.site-scan-cache.json', '.encoding-model.json', '.sitemap-hashes.json',
+               '.norwegian-spellcheck-backup', BUNDLE_FILE)
+
+# Slowdown (as a fraction) --compare reports as a regression
+REGRESSION_THRESHOLD = 0.10
+
+
+class StageTimer:
+    """Self time per stage of functions wrapped with wrap().
+
+    A wrapped function called from another one is timed to its own stage
+    and left out of the caller's, so the stages add up to no more than the
+    total. Recursive calls are timed once.
+    """
+
+    def __init__(self):
+        self.totals = Counter()
+        self.stack = []
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        # Re-entering the running stage (recursion) is timed by the outer call
+        if self.stack and self.stack[-1][0] == name:
+            yield
+            return
+        frame = [name, 0.0]
+        self.stack.append(frame)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stack.pop()
+            self.totals[name] += elapsed - frame[1]
+            if self.stack:
+                self.stack[-1][1] += elapsed
+
+    def wrap(self, owner, attr, name):
+        """Replace owner.attr (a function or method) with one timed as stage name."""
+        original = getattr(owner, attr)
+
+        def timed(*args, **kwargs):
+            with self.stage(name):
+                return original(*args, **kwargs)
+
+        setattr(owner, attr, timed)
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None where it cannot be read."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def run_tool(tool, root):
+    """Run one tool over the site at root in this process. Returns its timings."""
+    rule_bundle.use_bundle(os.path.join(root, BUNDLE_FILE))
+    timer = StageTimer()
+    start = time.perf_counter()
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+        run = prepare_tool(tool, root, timer)
+        run()
+    seconds = time.perf_counter() - start
+
+    stages = dict(timer.totals)
+    stages['other'] = max(0.0, seconds - sum(stages.values()))
+    return {'seconds': seconds, 'stages': stages, 'peak_rss_mb': peak_rss_mb()}
+
+
+def prepare_tool(tool, root, timer):
+    """Load tool and wrap its stages in timer. Returns the function that runs it over root."""
+    with timer.stage('startup'):
+        import corpus_resolver
+        import link_index
+        from lexicon import load_lexicon
+        from site_common import load_script
+        if tool == 'fix-encoding':
+            module = load_script(os.path.join(SCRIPT_DIR, '..', 'fix-encoding.py'), 'fix_encoding')
+        elif tool == 'spellcheck':
+            module = load_script(os.path.join(SCRIPT_DIR, 'norwegian-spellcheck.py'), 'norwegian_spellcheck')
+        elif tool in ('fix-broken-links', 'link-check'):
+            module = load_script(os.path.join(SCRIPT_DIR, 'fix-broken-links.py'), 'fix_broken_links')
+        elif tool == 'image-check':
+            module = load_script(os.path.join(SCRIPT_DIR, 'image-check.py'), 'image_check')
+        else:
+            module = load_script(os.path.join(SCRIPT_DIR, 'update-sitemap.py'), 'update_sitemap')
+
+    if tool == 'fix-encoding':
+        timer.wrap(module, 'find_html_files', 'walk')
+        timer.wrap(corpus_resolver.CorpusResolver, 'load', 'train')
+        timer.wrap(module, 'has_corruption', 'read')
+        timer.wrap(module, 'read_candidate', 'read')
+        timer.wrap(module, 'fix_content', 'fix')
+        run = lambda: module.fix_directory(argparse.Namespace(directory=root, dry_run=True, jobs=1,
+                                                              no_cache=True, profile=None))
+    elif tool == 'spellcheck':
+        timer.wrap(module, 'find_html_files', 'walk')
+        timer.wrap(module, 'read_candidate', 'read')
+        timer.wrap(module, 'check_file', 'check')
+
+        def run():
+            with timer.stage('lexicon'):
+                module.use_matcher(module.MATCHER, load_lexicon())
+            module.scan_directory(root, fix=True, jobs=1, use_cache=False, dry_run=True)
+    elif tool == 'fix-broken-links':
+        timer.wrap(module, 'find_html_files', 'walk')
+        timer.wrap(module, 'read_candidate', 'read')
+        timer.wrap(module, 'fix_links', 'fix')
+        run = lambda: module.fix_known_links(argparse.Namespace(directory=root, fix=True, dry_run=True,
+                                                                jobs=1, no_cache=True))
+    elif tool == 'link-check':
+        timer.wrap(link_index.FileIndex, '__init__', 'index')
+        timer.wrap(link_index.FileIndex, 'build_postings', 'index')
+        timer.wrap(link_index.FileIndex, 'suggest', 'suggest')
+        timer.wrap(module, 'check_page', 'check')
+        run = lambda: module.run_check(root, fix=True, jobs=1, dry_run=True)
+    elif tool == 'image-check':
+        timer.wrap(link_index.FileIndex, '__init__', 'index')
+        timer.wrap(link_index.FileIndex, 'suggest', 'suggest')
+        timer.wrap(module, 'read_candidate', 'read')
+        timer.wrap(module, 'image_references', 'scan')
+        run = lambda: module.check_images(root, jobs=1)
+    else:
+        timer.wrap(link_index.FileIndex, '__init__', 'index')
+        timer.wrap(module, 'read_entries', 'read-sitemap')
+        timer.wrap(module, 'text_hash', 'hash')
+        timer.wrap(module, 'build_sections', 'pages')
+        run = lambda: module.update_sitemap(root, write=False)
+    return run
+
+
+def clean_caches(root):
+    for name in CACHE_FILES:
+        path = os.path.join(root, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+
+
+def measure(tool, root, corpus, repeat):
+    """Run tool over root repeat times in fresh processes. Returns the fastest run's result."""
+    best = None
+    for _ in range(repeat):
+        clean_caches(root)
+        completed = subprocess.run([sys.executable, os.path.abspath(__file__), '--run-tool', tool, root],
+                                   capture_output=True, text=True, encoding='utf-8')
+        if completed.returncode != 0:
+            raise RuntimeError(f"{tool} failed:\n{completed.stderr.strip()}")
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        if best is None or result['seconds'] < best['seconds']:
+            best = result
+    clean_caches(root)
+
+    pages = TOOL_PAGES[tool]
+    files = corpus['pages'] if pages == 'all' else corpus[f'{pages}_pages']
+    size = corpus['bytes'] if pages == 'all' else corpus[f'{pages}_bytes']
+    best.update({
+        'tool': tool,
+        'files': files,
+        'bytes': size,
+        'files_per_sec': files / best['seconds'],
+        'mb_per_sec': size / 1e6 / best['seconds'],
+    })
+    return best
+
+
+def git_commit():
+    """Return the commit the scripts are at, or None outside a git checkout."""
+    try:
+        completed = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=SCRIPT_DIR,
+                                   capture_output=True, text=True)
+    except OSError:
+        return None
+    return completed.stdout.strip() if completed.returncode == 0 else None
+
+
+def format_rss(rss):
+    return f"{rss:.0f} MB" if rss is not None else '-'
+
+
+def print_result(scale, result):
+    print(f"  {scale:>6g}x {result['tool']:<17} {result['files']:>7} files {result['seconds']:>8.2f}s "
+          f"{result['files_per_sec']:>8.1f} files/s {result['mb_per_sec']:>7.2f} MB/s "
+          f"peak {format_rss(result['peak_rss_mb'])}")
+    stages = sorted(result['stages'].items(), key=lambda item: -item[1])
+    print('           ' + ', '.join(f"{name} {seconds:.2f}s" for name, seconds in stages))
+
+
+def compare(results, baseline, threshold):
+    """Print each tool's change against the baseline results. Returns the number of regressions."""
+    before = {(run['scale'], run['tool']): run for run in baseline['results']}
+    regressions = 0
+    print(f"\nCompared with {baseline.get('commit') or 'baseline'} ({baseline.get('created', '?')}):")
+    for run in results:
+        old = before.get((run['scale'], run['tool']))
+        if old is None:
+            print(f"  {run['scale']:>6g}x {run['tool']:<17} not in the baseline")
+            continue
+        change = run['seconds'] / old['seconds'] - 1
+        line = (f"  {run['scale']:>6g}x {run['tool']:<17} {old['seconds']:>8.2f}s -> {run['seconds']:>8.2f}s "
+                f"({change:+.1%})")
+        if old.get('peak_rss_mb') and run.get('peak_rss_mb'):
+            line += f", peak {format_rss(old['peak_rss_mb'])} -> {format_rss(run['peak_rss_mb'])}"
+        if change > threshold:
+            regressions += 1
+            line += '  REGRESSION'
+        print(line)
+    return regressions
+
+
+def parse_list(value, allowed=None):
+    items = [item.strip() for item in value.split(',') if item.strip()]
+    if allowed is not None:
+        unknown = [item for item in items if item not in allowed]
+        if unknown:
+            raise argparse.ArgumentTypeError(f"unknown: {', '.join(unknown)} (choose from {', '.join(allowed)})")
+    return items
+
+
+def parse_scales(value):
+    try:
+        scales = [float(item) for item in parse_list(value)]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not a list of numbers: {value}")
+    if not scales or any(scale <= 0 for scale in scales):
+        raise argparse.ArgumentTypeError("scales must be positive")
+    return scales
+
+
+def main():
+    # Worker mode: time one tool in this process and print the result as JSON
+    if len(sys.argv) == 4 and sys.argv[1] == '--run-tool':
+        print(json.dumps(run_tool(sys.argv[2], sys.argv[3])))
+        return 0
+
+    parser = argparse.ArgumentParser(description='Benchmark the site scripts on synthetic sites')
+    parser.add_argument('--scales', type=parse_scales, default=[1.0, 10.0, 100.0],
+                        help='comma-separated site sizes relative to the real site (default: 1,10,100)')
+    parser.add_argument('--tools', type=lambda value: parse_list(value, TOOLS), default=list(TOOLS),
+                        help=f"comma-separated tools to run (default: {','.join(TOOLS)})")
+    parser.add_argument('--repeat', type=int, default=1, metavar='N',
+                        help='runs per tool; the fastest is kept (default: 1)')
+    parser.add_argument('--output', default='site-benchmark.json', metavar='FILE',
+                        help='where to write the results (default: site-benchmark.json)')
+    parser.add_argument('--compare', metavar='BASELINE',
+                        help='results of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD, metavar='F',
+                        help=f'slowdown --compare counts as a regression (default: {REGRESSION_THRESHOLD})')
+    parser.add_argument('--workdir', help='folder to generate the sites in (default: a temporary folder)')
+    parser.add_argument('--keep', action='store_true', help='keep the generated sites')
+    add_corpus_arguments(parser)
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        try:
+            with open(args.compare, 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            parser.error(f"could not read {args.compare}: {e}")
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='site-benchmark-')
+    os.makedirs(workdir, exist_ok=True)
+
+    print("=" * 60)
+    print("Site Script Benchmark")
+    print("=" * 60)
+    print(f"Scales: {', '.join(f'{scale:g}x' for scale in args.scales)}")
+    print(f"Tools: {', '.join(args.tools)}")
+    print(f"Sites: {workdir}")
+    print("=" * 60)
+
+    results = []
+    corpora = {}
+    try:
+        for scale in args.scales:
+            root = os.path.join(workdir, f'site-{scale:g}x')
+            if os.path.exists(root):
+                shutil.rmtree(root)
+            start = time.perf_counter()
+            corpus = generate_site(root, scale, args.seed, args.missing_rate, args.fffd_rate,
+                                   args.broken_rate)
+            corpora[f'{scale:g}'] = corpus
+            print(f"\n{scale:g}x: {corpus['pages']} pages ({corpus['bytes'] / 1e6:.1f} MB), "
+                  f"{corpus['images']} images, generated in {time.perf_counter() - start:.1f}s")
+
+            for tool in args.tools:
+                try:
+                    result = measure(tool, root, corpus, max(1, args.repeat))
+                except RuntimeError as e:
+                    print(f"Error: {e}")
+                    return 1
+                result['scale'] = scale
+                results.append(result)
+                print_result(scale, result)
+
+            if not args.keep:
+                shutil.rmtree(root)
+    finally:
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {'seed': args.seed, 'missing_rate': args.missing_rate, 'fffd_rate': args.fffd_rate,
+                     'broken_rate': args.broken_rate, 'repeat': args.repeat},
+        'corpora': corpora,
+        'results': results,
+    }
+    temp_path = args.output + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    os.replace(temp_path, args.output)
+    print(f"\nResults written to {args.output}")
+
+    if baseline is not None and compare(results, baseline, args.threshold):
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,441 @@
+#!/usr/bin/env python3
+"""
+Site Maintenance Pipeline
+Runs the maintenance scripts as stages of a single pass over the tree:
+the tree is walked once, every page is read once, passed through the
+selected stages in order and written back at most once. The sitemap stage
+reuses the walk and the pages the content stages have read.
+
+Stages (in order):
+    encoding   Repair corrupted æ/ø/å (fix-encoding.py, Norwegian pages)
+    spelling   Missing æ/ø/å in Norwegian words (norwegian-spellcheck.py, Norwegian pages)
+    links      Known broken links (fix-broken-links.py, en/ pages)
+    sitemap    Pages added to or gone from the sitemap (update-sitemap.py)
+
+Usage:
+    python site-pipeline.py [site_root] [--stages encoding,spelling,links,sitemap] [--fix] [--dry-run] [--diff] [--lexicon PATH] [--jobs N] [--no-cache]
+    python site-pipeline.py [site_root] --watch [--interval S] [--stages ...] [--lexicon PATH]
+
+Options:
+    --stages    Comma-separated stages to run (default: all)
+    --fix       Write the fixes back to the files (creates backup first); all
+                pages are written together at the end, or none if one fails
+    --dry-run   With --fix, go through the fixes without writing them
+    --diff      Print the page fixes as a unified diff instead of writing them
+    --lexicon PATH
+                Word list for the spelling stage (see norwegian-spellcheck.py)
+    --jobs N    Process files in N worker processes (0 = one per CPU)
+    --no-cache  Recheck files that passed before and have not changed since
+    --watch     Keep running and recheck pages as they are saved (never writes);
+                with the links stage every link on a saved page is validated,
+                as are the links to a file that appears or disappears
+    --interval S
+                How often --watch looks for changes (default: 0.1 seconds)
+"""
+
+import argparse
+import os
+import sys
+import time
+from functools import partial
+
+from backup_store import BACKUP_DIR, BackupStore
+from corpus_resolver import CorpusResolver
+from html_scan import link_spans
+from lexicon import add_lexicon_argument, load_lexicon
+from link_index import INDEX_EXCLUDE_DIRS, FileIndex, LinkGraph, resolve_link
+from site_common import (ScanCache, StagedWrites, TreePoller, add_cache_argument, add_jobs_argument,
+                         add_write_arguments, decode_text, load_script, map_files,
+                         patch_output, resolve_jobs, rules_version)
+
+# Fix Windows console encoding
+if sys.platform == 'win32':
+    sys.stdout.reconfigure(encoding='utf-8', errors='replace')
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Loaded at import time so worker processes get them too
+fix_encoding = load_script(os.path.join(SCRIPT_DIR, '..', 'fix-encoding.py'), 'fix_encoding')
+spellcheck = load_script(os.path.join(SCRIPT_DIR, 'norwegian-spellcheck.py'), 'norwegian_spellcheck')
+broken_links = load_script(os.path.join(SCRIPT_DIR, 'fix-broken-links.py'), 'fix_broken_links')
+sitemap = load_script(os.path.join(SCRIPT_DIR, 'update-sitemap.py'), 'update_sitemap')
+
+STAGES = ('encoding', 'spelling', 'links', 'sitemap')
+
+# Scan cache checker name and rule table of each stage that reads page content
+STAGE_CHECKS = {
+    'encoding': ('fix-encoding', fix_encoding.REPLACEMENTS),
+    'spelling': ('norwegian-spellcheck', spellcheck.PATTERNS),
+    'links': ('fix-broken-links', broken_links.LINK_CORRECTIONS),
+}
+
+EXCLUDE_DIRS = {'node_modules', BACKUP_DIR}
+
+# Seconds between two looks for changed files in --watch mode
+WATCH_INTERVAL = 0.1
+
+
+def use_models(matcher, lexicon, resolver):
+    """Pool initializer: install the spelling rules and the encoding model in a worker process."""
+    spellcheck.use_matcher(matcher, lexicon)
+    fix_encoding.use_replacements(fix_encoding.REPLACEMENT_REGEX, fix_encoding.REPLACEMENT_TABLE,
+                                  resolver)
+
+
+def stage_prefilter(stage):
+    """Return the bytes regex a page must match for a content stage to have work.
+
+    None means every page may have work for the stage.
+    """
+    if stage == 'encoding':
+        return fix_encoding.ENCODING_PREFILTER
+    if stage == 'spelling':
+        return spellcheck.candidate_prefilter()
+    return broken_links.LINK_PREFILTER
+
+
+def parse_stages(value):
+    """Parse a comma-separated --stages value, returning the stages in pipeline order."""
+    selected = {stage.strip() for stage in value.split(',') if stage.strip()}
+    unknown = selected - set(STAGES)
+    if unknown:
+        raise argparse.ArgumentTypeError(
+            f"unknown stage(s): {', '.join(sorted(unknown))} (choose from {', '.join(STAGES)})")
+    return [stage for stage in STAGES if stage in selected]
+
+
+def content_stages(rel_path, stages):
+    """Return the content stages that apply to a page."""
+    english = rel_path.replace('\\', '/').startswith('en/')
+    applicable = []
+    for stage in stages:
+        if stage in ('encoding', 'spelling') and not english:
+            applicable.append(stage)
+        elif stage == 'links' and english:
+            applicable.append(stage)
+    return applicable
+
+
+def process_file(file_path, root, stages, write=False):
+    """Run the content stages over one file.
+
+    Returns (issue counts per stage, change, summary), or None if the file
+    could not be read. change is (original, fixed) text for StagedWrites,
+    or None if the stages changed nothing. With the sitemap stage, summary
+    is the page's update-sitemap page_summary() as it will be on disk
+    (fixed if write, else original), so the sitemap need not read it
+    again; otherwise it is None.
+    """
+    rel_path = os.path.relpath(file_path, root)
+    applicable = content_stages(rel_path, stages)
+    counts = dict.fromkeys(applicable, 0)
+    summarize = 'sitemap' in stages and sitemap.is_sitemap_page(rel_path)
+
+    try:
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        # Only decode files where some stage's byte prefilter finds a candidate
+        candidates = {stage for stage in applicable
+                      if stage_prefilter(stage) is None or stage_prefilter(stage).search(data)}
+        if not candidates and not summarize:
+            return counts, None, None
+        original = decode_text(data)
+    except (OSError, UnicodeDecodeError) as e:
+        print(f"Error reading {file_path}: {e}")
+        return None
+
+    content = original
+
+    for stage in applicable:
+        # Once an earlier stage has changed the text the prefilter result is stale
+        if stage not in candidates and content == original:
+            continue
+        if stage == 'encoding':
+            content, counts[stage] = fix_encoding.fix_content(content, file_path)
+            if counts[stage]:
+                print(f"\n[encoding] {rel_path}: {counts[stage]} replacements")
+        elif stage == 'spelling':
+            report = spellcheck.IssueReport(rel_path, content)
+            fixed = spellcheck.fix_issues(content, report.tap(spellcheck.find_issues(file_path, content)))
+            counts[stage] = report.count
+            if report.count:
+                report.print()
+                content = fixed
+        elif stage == 'links':
+            content, counts[stage] = broken_links.fix_links(content)
+            if counts[stage]:
+                print(f"\n[links] {rel_path}: {counts[stage]} link(s)")
+
+    summary = sitemap.page_summary(content if write else original) if summarize else None
+    return counts, (original, content) if content != original else None, summary
+
+
+def site_pages(root):
+    """Walk the tree once. Returns (FileIndex, sorted paths of its .html files)."""
+    index = FileIndex(root, INDEX_EXCLUDE_DIRS | EXCLUDE_DIRS)
+    html_files = sorted(os.path.join(root, *path.split('/'))
+                        for path in index.files if path.endswith('.html'))
+    return index, html_files
+
+
+def use_encoding_model(root, html_files, pages):
+    """Install the encoding model if one of pages has U+FFFD. Returns True if it did.
+
+    The model is trained on the pages the encoding stage applies to; a
+    site without U+FFFD in the pages about to be checked never loads it.
+    """
+    def encoded(path):
+        return bool(content_stages(os.path.relpath(path, root), ['encoding']))
+
+    if not any(fix_encoding.has_corruption(path) for path in pages if encoded(path)):
+        return False
+    corpus = [path for path in html_files if encoded(path)]
+    fix_encoding.use_replacements(fix_encoding.REPLACEMENT_REGEX, fix_encoding.REPLACEMENT_TABLE,
+                                  CorpusResolver.load(root, corpus))
+    return True
+
+
+def run_pipeline(root, stages, fix=False, jobs=1, use_cache=True, dry_run=False, diff=None):
+    """Run the selected stages over every page under root. Returns the total issue count.
+
+    With fix the changed pages are backed up and written in one commit
+    phase at the end (see StagedWrites), unless dry_run; with diff (a
+    stream) the page fixes are written to it as a unified diff instead.
+    """
+    write = fix and not dry_run and diff is None
+    print(f"\n{'='*60}")
+    print(f"Site Maintenance Pipeline")
+    print(f"{'='*60}")
+    print(f"Site root: {root}")
+    print(f"Stages: {', '.join(stages)}")
+    if diff:
+        mode = 'DIFF'
+    elif fix:
+        mode = 'DRY RUN' if dry_run else 'FIX'
+    else:
+        mode = 'SCAN ONLY'
+    print(f"Mode: {mode}")
+    print(f"{'='*60}")
+
+    index, html_files = site_pages(root)
+
+    checks = {STAGE_CHECKS[stage][0]: rules_version(STAGE_CHECKS[stage][1])
+              for stage in stages if stage in STAGE_CHECKS}
+    if 'spelling' in stages:
+        # Includes the word list, if any
+        checks[STAGE_CHECKS['spelling'][0]] = spellcheck.rules_key()
+    cache = ScanCache(root, checks, enabled=use_cache)
+
+    # Pages with no content stage to run, or clean for all of them, are not read
+    pending = []
+    skipped = 0
+    for file_path in html_files:
+        names = [STAGE_CHECKS[stage][0]
+                 for stage in content_stages(os.path.relpath(file_path, root), stages)]
+        if not names:
+            continue
+        if cache.is_clean(file_path, names):
+            skipped += 1
+        else:
+            pending.append((file_path, names))
+
+    if 'encoding' in stages:
+        use_encoding_model(root, html_files, [path for path, _ in pending])
+
+    totals = dict.fromkeys(STAGE_CHECKS, 0)
+    names_by_path = dict(pending)
+
+    summaries = {}
+
+    run = BackupStore(root).new_run()
+    writes = StagedWrites(root, write=write, diff=diff)
+    process = partial(process_file, root=root, stages=stages, write=write)
+    for file_path, result in map_files(process, [path for path, _ in pending], jobs,
+                                       initializer=use_models,
+                                       initargs=(spellcheck.MATCHER, spellcheck.LEXICON,
+                                                 fix_encoding.RESOLVER)):
+        if result is None:
+            continue
+        counts, change, summary = result
+        if summary is not None:
+            summaries[os.path.relpath(file_path, root).replace(os.sep, '/')] = summary
+        for stage, count in counts.items():
+            totals[stage] += count
+        if not any(counts.values()):
+            cache.mark_clean(file_path, names_by_path[file_path])
+        if change:
+            writes.stage(file_path, *change)
+
+    # Back up everything first, so a failed commit leaves nothing unrecoverable
+    for file_path in writes.staged:
+        run.add(file_path, spellcheck.backup_file(file_path, root))
+    run_name = run.save()
+    files_written = writes.commit()
+    cache.save()
+
+    sitemap_changes = 0
+    if 'sitemap' in stages:
+        print(f"\n[sitemap]")
+        # Pages the content stages skipped are read by the sitemap itself
+        sitemap_changes = sitemap.update_sitemap(root, write=write, index=index, summaries=summaries)
+
+    print(f"\n{'='*60}")
+    print(f"SUMMARY")
+    print(f"{'='*60}")
+    print(f"Files read: {len(pending)}")
+    print(f"Unchanged files skipped: {skipped}")
+    if 'encoding' in stages:
+        print(f"Encoding replacements: {totals['encoding']}")
+    if 'spelling' in stages:
+        print(f"Spelling issues: {totals['spelling']}")
+    if 'links' in stages:
+        print(f"Links {'fixed' if write else 'to fix'}: {totals['links']}")
+    if 'sitemap' in stages:
+        print(f"Sitemap URLs {'added/removed' if write else 'to add/remove'}: {sitemap_changes}")
+    if write:
+        print(f"Files written: {files_written}")
+        if run_name:
+            print(f"Backup run: {run_name} (undo with: "
+                  f"python norwegian-spellcheck.py {root} --restore {run_name})")
+
+    return sum(totals.values()) + sitemap_changes
+
+
+def page_targets(root, page):
+    """Return the set of site paths a page links to, or None if it cannot be read."""
+    try:
+        with open(os.path.join(root, *page.split('/')), 'r', encoding='utf-8') as f:
+            content = f.read()
+    except (OSError, UnicodeDecodeError):
+        return None
+    targets = {resolve_link(page, content[start:end]) for _, start, end in link_spans(content)}
+    targets.discard(None)
+    return targets
+
+
+def watch_site(root, stages, interval=WATCH_INTERVAL):
+    """Recheck pages as they change until interrupted (--watch). Nothing is written.
+
+    The rules and the file index are loaded once, and the encoding model
+    the first time a page with U+FFFD is saved. Each poll (see TreePoller)
+    finds the pages saved since the last one; they go through the content
+    stages and, with the links stage, have every link validated. A page's
+    links only depend on which files exist, so other pages are only
+    revalidated when a file they link to appears or disappears (see
+    LinkGraph).
+    """
+    validate = 'links' in stages
+    index, html_files = site_pages(root)
+    # Done once the encoding model is installed, or with no encoding stage
+    encoding_ready = 'encoding' not in stages
+
+    index.build_postings()
+    broken_links.use_index(index)
+    graph = LinkGraph()
+    if validate:
+        for file_path in html_files:
+            page = os.path.relpath(file_path, root).replace(os.sep, '/')
+            graph.update(page, page_targets(root, page) or set())
+    poller = TreePoller(root, INDEX_EXCLUDE_DIRS, watch=lambda path: path.endswith('.html'))
+
+    print(f"\n{'='*60}")
+    print(f"Site Maintenance Pipeline (watching)")
+    print(f"{'='*60}")
+    print(f"Site root: {root}")
+    print(f"Stages: {', '.join(stage for stage in stages if stage != 'sitemap')}")
+    print(f"Pages: {len(html_files)}, files: {len(index.files)}")
+    print(f"Press Ctrl+C to stop")
+    print(f"{'='*60}")
+
+    try:
+        while True:
+            time.sleep(interval)
+            added, removed, modified = poller.poll()
+            if not (added or removed or modified):
+                continue
+            started = time.perf_counter()
+
+            for path in removed:
+                index.remove(path)
+                graph.remove(path)
+            for path in added:
+                index.add(path)
+
+            changed = sorted(path for path in added + modified if path.endswith('.html'))
+            linkers = set()
+            if validate:
+                for path in added + removed:
+                    linkers |= graph.pages_linking_to(path)
+            revalidate = sorted(linkers - set(changed))
+
+            print(f"\n[{time.strftime('%H:%M:%S')}] {len(added)} added, {len(removed)} removed, "
+                  f"{len(modified)} modified")
+            if not encoding_ready:
+                encoding_ready = use_encoding_model(
+                    root, sorted(os.path.join(root, *path.split('/')) for path in index.files
+                                 if path.endswith('.html')),
+                    [os.path.join(root, *page.split('/')) for page in changed])
+            issues = 0
+            for page in changed:
+                file_path = os.path.join(root, *page.split('/'))
+                result = process_file(file_path, root, stages)
+                if result is not None:
+                    issues += sum(result[0].values())
+            if validate:
+                for page in changed + revalidate:
+                    targets = page_targets(root, page)
+                    if targets is None:
+                        continue
+                    graph.update(page, targets)
+                    result = broken_links.check_page(os.path.join(root, *page.split('/')), root)
+                    if result is not None:
+                        issues += result[1]
+
+            elapsed = (time.perf_counter() - started) * 1000
+            print(f"  {len(changed) + len(revalidate)} page(s) checked in {elapsed:.0f} ms, "
+                  f"{issues} issue(s)")
+    except KeyboardInterrupt:
+        print("\nStopped watching")
+    return 0
+
+
+def main():
+    site_root = os.path.abspath(os.path.join(SCRIPT_DIR, '..', '..'))
+
+    parser = argparse.ArgumentParser(description='Run the site maintenance stages in one pass')
+    parser.add_argument('directory', nargs='?', default=site_root,
+                        help='site root (default: the website folder)')
+    parser.add_argument('--stages', type=parse_stages, default=list(STAGES),
+                        help=f"comma-separated stages to run (default: {','.join(STAGES)})")
+    parser.add_argument('--fix', action='store_true',
+                        help='write the fixes back to the files (creates backup first)')
+    parser.add_argument('--watch', action='store_true',
+                        help='keep running and recheck pages as they are saved (never writes)')
+    parser.add_argument('--interval', type=float, default=WATCH_INTERVAL, metavar='S',
+                        help=f'seconds between two looks for changes with --watch (default: {WATCH_INTERVAL})')
+    add_write_arguments(parser)
+    add_lexicon_argument(parser)
+    add_jobs_argument(parser)
+    add_cache_argument(parser)
+    args = parser.parse_args()
+
+    if 'spelling' in args.stages:
+        try:
+            spellcheck.use_matcher(spellcheck.MATCHER, load_lexicon(args.lexicon))
+        except FileNotFoundError as e:
+            parser.error(str(e))
+
+    if args.watch:
+        if args.fix or args.diff:
+            parser.error('--watch only reports; it cannot be combined with --fix or --diff')
+        return watch_site(args.directory, args.stages, interval=args.interval)
+
+    with patch_output(args.diff) as diff:
+        total_issues = run_pipeline(args.directory, args.stages, fix=args.fix,
+                                    jobs=resolve_jobs(args.jobs), use_cache=not args.no_cache,
+                                    dry_run=args.dry_run, diff=diff)
+
+    return 0 if total_issues == 0 else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
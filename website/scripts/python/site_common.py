@@ -0,0 +1,510 @@
+#!/usr/bin/env python3
+"""
+Shared helpers for the site maintenance scripts.
+
+The scripts in this folder (and scripts/fix-encoding.py) import this module
+for the parts that are the same everywhere: walking and watching the tree,
+spreading per-file work over several processes, remembering which files
+already passed a check and writing the fixes.
+"""
+
+import contextlib
+import difflib
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import re
+import shutil
+import sys
+from bisect import bisect_right
+from multiprocessing import Pool
+
+# Manifest of files that passed a checker, stored in the scanned root
+CACHE_NAME = '.site-scan-cache.json'
+
+
+def find_html_files(directory, exclude_dirs=()):
+    """Return every .html file under directory, sorted by path."""
+    html_files = []
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = [d for d in dirs if d not in exclude_dirs]
+        for file in files:
+            if file.endswith('.html'):
+                html_files.append(os.path.join(root, file))
+    return sorted(html_files)
+
+
+class TreePoller:
+    """Finds the files added, removed or modified under a root, cheaply enough to poll often.
+
+    A folder is only listed again when its mtime changes, which happens
+    whenever an entry in it is created, removed or renamed. On each poll
+    only the folders and the files selected by watch (a function of the
+    '/'-separated relative path) are stat()ed, so other files (images,
+    say) are seen coming and going but not changing.
+    """
+
+    def __init__(self, root, exclude_dirs=(), watch=None):
+        self.root = root
+        self.exclude_dirs = set(exclude_dirs)
+        self.watch = watch or (lambda rel_path: True)
+        # Relative folder -> (mtime_ns, file names, subfolder names)
+        self.dirs = {}
+        # Relative path of each watched file -> (mtime_ns, size)
+        self.stats = {}
+        self._scan_dir('', [], [])
+
+    def _path(self, rel_path):
+        return os.path.join(self.root, *rel_path.split('/')) if rel_path else self.root
+
+    def _scan_dir(self, rel_dir, added, removed):
+        """List a folder, recording the files and folders that came or went since the last listing."""
+        try:
+            # The mtime is read first, so a change during the listing shows up on the next poll
+            mtime = os.stat(self._path(rel_dir)).st_mtime_ns
+            with os.scandir(self._path(rel_dir)) as entries:
+                entries = list(entries)
+        except FileNotFoundError:
+            self._drop_dir(rel_dir, removed)
+            return
+
+        files = {entry.name for entry in entries if not entry.is_dir()}
+        subdirs = {entry.name for entry in entries
+                   if entry.is_dir() and entry.name not in self.exclude_dirs}
+        _, old_files, old_subdirs = self.dirs.get(rel_dir, (None, set(), set()))
+        self.dirs[rel_dir] = (mtime, files, subdirs)
+        prefix = f'{rel_dir}/' if rel_dir else ''
+
+        for name in sorted(files - old_files):
+            rel_path = prefix + name
+            added.append(rel_path)
+            if self.watch(rel_path):
+                try:
+                    stat = os.stat(self._path(rel_path))
+                except FileNotFoundError:
+                    continue
+                self.stats[rel_path] = (stat.st_mtime_ns, stat.st_size)
+        for name in sorted(old_files - files):
+            removed.append(prefix + name)
+            self.stats.pop(prefix + name, None)
+        for name in sorted(subdirs - old_subdirs):
+            self._scan_dir(prefix + name, added, removed)
+        for name in sorted(old_subdirs - subdirs):
+            self._drop_dir(prefix + name, removed)
+
+    def _drop_dir(self, rel_dir, removed):
+        """Forget a folder that is gone, recording everything in it as removed."""
+        entry = self.dirs.pop(rel_dir, None)
+        if entry is None:
+            return
+        prefix = f'{rel_dir}/' if rel_dir else ''
+        for name in sorted(entry[1]):
+            removed.append(prefix + name)
+            self.stats.pop(prefix + name, None)
+        for name in sorted(entry[2]):
+            self._drop_dir(prefix + name, removed)
+
+    def poll(self):
+        """Return (added, removed, modified) relative paths since the last poll."""
+        added = []
+        removed = []
+        for rel_dir in list(self.dirs):
+            entry = self.dirs.get(rel_dir)
+            if entry is None:
+                continue  # Dropped with its parent during this poll
+            try:
+                mtime = os.stat(self._path(rel_dir)).st_mtime_ns
+            except FileNotFoundError:
+                continue  # Its parent's mtime has changed too; it is dropped from there
+            if mtime != entry[0]:
+                self._scan_dir(rel_dir, added, removed)
+
+        modified = []
+        new = set(added)
+        for rel_path, old in list(self.stats.items()):
+            if rel_path in new:
+                continue
+            try:
+                stat = os.stat(self._path(rel_path))
+            except FileNotFoundError:
+                continue  # Removed; its folder is listed again on the next poll
+            if (stat.st_mtime_ns, stat.st_size) != old:
+                self.stats[rel_path] = (stat.st_mtime_ns, stat.st_size)
+                modified.append(rel_path)
+        return added, removed, modified
+
+
+def build_trie_regex(words):
+    """Build a regex alternation factored on shared prefixes."""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def emit(node):
+        branches = [re.escape(char) + emit(child)
+                    for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        optional = '' in node
+        if len(branches) == 1 and not optional:
+            return branches[0]
+        return '(?:' + '|'.join(branches) + (')?' if optional else ')')
+
+    return emit(trie)
+
+
+# Escapes whose bytes meaning is narrower than their str meaning, widened to
+# also accept any non-ASCII byte so a bytes prefilter never misses a str match
+_BYTES_WIDENED = {r'\d': rb'(?:\d|[\x80-\xff])', r'\s': rb'(?:\s|[\x80-\xff])',
+                  r'\w': rb'(?:\w|[\x80-\xff])'}
+
+# Bytes \b treats every non-ASCII byte as non-word, so "forst" would end at
+# a boundary inside "forstå". The U+00C0-U+00FF letters (0xC3 lead byte,
+# minus × and ÷) are word characters, so next to an ASCII word character
+# in the pattern it is enough to rule them out on the other side
+# (BYTES_BOUNDARY_AFTER/BEFORE). Anywhere else the boundary is widened:
+# other non-ASCII bytes may be either, and a position matches unless both
+# sides are certainly word or certainly non-word characters.
+_LATIN1_LETTER = rb'\xc3[\x80-\x96\x98-\xb6\xb8-\xbf]'
+BYTES_BOUNDARY_AFTER = rb'\b(?!' + _LATIN1_LETTER + rb')'
+BYTES_BOUNDARY_BEFORE = rb'\b(?<!' + _LATIN1_LETTER + rb')'
+BYTES_BOUNDARY = (
+    rb'(?:(?<![0-9A-Za-z_])(?<!' + _LATIN1_LETTER + rb')|(?![0-9A-Za-z_]|' + _LATIN1_LETTER + rb'))'
+    rb'(?:(?<=[0-9A-Za-z_\x80-\xff])|(?=[0-9A-Za-z_\x80-\xff]))')
+
+_ASCII_WORD = re.compile(r'[0-9A-Za-z_]')
+
+
+def bytes_source(pattern, flags=0):
+    """Translate a str regex into bytes regex source that matches at least wherever it does.
+
+    Non-ASCII characters become an alternation of their case variants in
+    UTF-8, since bytes matching only folds ASCII case. Returns None for
+    patterns using character sets, which are not translated.
+    """
+    tokens = re.findall(r'\\.|.', pattern, re.DOTALL)
+    parts = []
+    for i, token in enumerate(tokens):
+        if token == r'\b':
+            if i > 0 and _ASCII_WORD.fullmatch(tokens[i - 1]):
+                parts.append(BYTES_BOUNDARY_AFTER)
+            elif i + 1 < len(tokens) and _ASCII_WORD.fullmatch(tokens[i + 1]):
+                parts.append(BYTES_BOUNDARY_BEFORE)
+            else:
+                parts.append(BYTES_BOUNDARY)
+        elif token in _BYTES_WIDENED:
+            parts.append(_BYTES_WIDENED[token])
+        elif token == '[':
+            return None
+        elif token.isascii():
+            parts.append(token.encode('ascii'))
+        else:
+            char = token[-1]
+            variants = {char, char.lower(), char.upper()} if flags & re.IGNORECASE else {char}
+            parts.append(b'(?:' + b'|'.join(re.escape(v.encode('utf-8')) for v in sorted(variants)) + b')')
+    return b''.join(parts)
+
+
+def bytes_prefilter(pattern, flags=0):
+    """Compile a str regex into a bytes regex that matches at least wherever it does (see bytes_source)."""
+    source = bytes_source(pattern, flags)
+    return None if source is None else re.compile(source, flags)
+
+
+def read_candidate(path, prefilter):
+    """Read a file in one go and decode it only if prefilter finds a candidate.
+
+    prefilter is a compiled bytes regex, or None to always decode. Returns
+    the text with newlines translated as open(path, 'r') would, or None when
+    the file has nothing for the prefilter and was not decoded.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if prefilter is not None and not prefilter.search(data):
+        return None
+    return decode_text(data)
+
+
+def decode_text(data):
+    """Decode UTF-8 file bytes with universal newlines, like open(path, 'r', encoding='utf-8')."""
+    text = data.decode('utf-8')
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
+
+
+def line_offsets(content):
+    """Return the offset at which each line of the content starts."""
+    offsets = [0]
+    pos = content.find('\n')
+    while pos != -1:
+        offsets.append(pos + 1)
+        pos = content.find('\n', pos + 1)
+    return offsets
+
+
+def locate(offsets, pos):
+    """Return the 1-based (line, column) of an offset using a line_offsets() index."""
+    line = bisect_right(offsets, pos)
+    return line, pos - offsets[line - 1] + 1
+
+
+def load_script(path, name):
+    """Import a script with a hyphenated filename (e.g. fix-encoding.py) as module name."""
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+class _CapturedCall:
+    """Picklable wrapper returning func(path) together with everything it printed."""
+
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, path):
+        buffer = io.StringIO()
+        with contextlib.redirect_stdout(buffer):
+            result = self.func(path)
+        return result, buffer.getvalue()
+
+
+def map_files(func, paths, jobs=1, initializer=None, initargs=()):
+    """Yield (path, result) for func(path) over paths, in the order given.
+
+    With jobs > 1 the calls run in a process pool. initializer(*initargs) is
+    run once per worker, so compiled rules are shipped once rather than with
+    every file. Anything func prints is buffered in the worker and replayed
+    here, which keeps the output in path order whatever finishes first.
+    func must be a module-level function (or a functools.partial of one).
+    """
+    if jobs <= 1 or len(paths) <= 1:
+        for path in paths:
+            yield path, func(path)
+        return
+
+    chunksize = max(1, len(paths) // (jobs * 8))
+    with Pool(jobs, initializer=initializer, initargs=initargs) as pool:
+        calls = pool.imap(_CapturedCall(func), paths, chunksize)
+        for path, (result, output) in zip(paths, calls):
+            if output:
+                print(output, end='')
+            yield path, result
+
+
+def add_jobs_argument(parser):
+    """Add the shared --jobs option to an argparse parser."""
+    parser.add_argument('-j', '--jobs', type=int, default=1, metavar='N',
+                        help='process files in N worker processes (0 = one per CPU)')
+
+
+def resolve_jobs(jobs):
+    """Turn a --jobs value into a worker count."""
+    return jobs if jobs > 0 else (os.cpu_count() or 1)
+
+
+def add_cache_argument(parser):
+    """Add the shared --no-cache option to an argparse parser."""
+    parser.add_argument('--no-cache', action='store_true',
+                        help=f'check every file, even those {CACHE_NAME} says are unchanged')
+
+
+def rules_version(rules):
+    """Return a short hash of a rule table, so cached results expire when it changes."""
+    return hashlib.sha1(repr(rules).encode('utf-8')).hexdigest()[:16]
+
+
+def file_hash(path):
+    """Return the SHA-1 of a file's bytes."""
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+class ScanCache:
+    """On-disk manifest of files that already passed one or more checkers.
+
+    Each entry records the file's size, mtime and content hash, plus the
+    rule-set version it passed for each checker. checks maps the checker
+    names in use to their current versions. A file is skipped when it is
+    unchanged and passed every requested checker with the current rules; a
+    changed mtime alone falls back to comparing the content hash.
+    """
+
+    def __init__(self, root, checks, enabled=True):
+        self.root = root
+        self.checks = checks
+        self.enabled = enabled
+        self.path = os.path.join(root, CACHE_NAME)
+        self.files = {}
+        self.dirty = False
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.files = json.load(f).get('files', {})
+        except (OSError, ValueError):
+            pass
+
+    def _key(self, path):
+        return os.path.relpath(path, self.root).replace(os.sep, '/')
+
+    def is_clean(self, path, names=None):
+        """Return True if path is unchanged since it last passed the named checkers (default: all)."""
+        entry = self.files.get(self._key(path))
+        if not self.enabled or not entry:
+            return False
+        if any(entry['passed'].get(name) != self.checks[name] for name in names or self.checks):
+            return False
+
+        stat = os.stat(path)
+        if stat.st_size != entry['size']:
+            return False
+        if stat.st_mtime_ns == entry['mtime_ns']:
+            return True
+        if file_hash(path) != entry['sha1']:
+            return False
+
+        entry['mtime_ns'] = stat.st_mtime_ns
+        self.dirty = True
+        return True
+
+    def mark_clean(self, path, names=None):
+        """Record that path passed the named checkers (default: all) with the current rules."""
+        key = self._key(path)
+        stat = os.stat(path)
+        digest = file_hash(path)
+
+        entry = self.files.get(key)
+        if entry is None or entry['sha1'] != digest:
+            # New or changed content: results from other checkers no longer apply
+            entry = self.files[key] = {'passed': {}}
+        entry.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns, sha1=digest)
+        for name in names or self.checks:
+            entry['passed'][name] = self.checks[name]
+        self.dirty = True
+
+    def filter(self, paths):
+        """Split paths into (to_check, skipped)."""
+        to_check = []
+        skipped = []
+        for path in paths:
+            (skipped if self.is_clean(path) else to_check).append(path)
+        return to_check, skipped
+
+    def save(self):
+        """Write the manifest back if anything changed."""
+        if not self.dirty:
+            return
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'files': self.files}, f, indent=1, sort_keys=True)
+        os.replace(temp_path, self.path)
+        self.dirty = False
+
+
+@contextlib.contextmanager
+def patch_output(enabled):
+    """Context for --diff. Yields the stream the patch goes to, or None if not enabled.
+
+    While enabled everything else printed goes to stderr, so stdout is a
+    patch that can be piped straight into git apply or patch -p1.
+    """
+    if not enabled:
+        yield None
+        return
+    stream = sys.stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        yield stream
+
+
+def add_write_arguments(parser):
+    """Add the shared --dry-run and --diff options to an argparse parser."""
+    parser.add_argument('--dry-run', action='store_true', help='do not write any files')
+    parser.add_argument('--diff', action='store_true',
+                        help='print the fixes as a unified diff instead of writing them '
+                             '(implies --dry-run)')
+
+
+def unified_diff(original, content, rel_path):
+    """Yield the lines of a unified diff from original to content, as git apply and patch take it.
+
+    A last line without a newline, on either side, is followed by the
+    "\\ No newline at end of file" marker.
+    """
+    for line in difflib.unified_diff(original.splitlines(keepends=True), content.splitlines(keepends=True),
+                                     f'a/{rel_path}', f'b/{rel_path}'):
+        if line.endswith('\n'):
+            yield line
+        else:
+            yield line + '\n\\ No newline at end of file\n'
+
+
+class StagedWrites:
+    """Fixed file contents, collected during a run and written in one commit phase.
+
+    Workers return new contents instead of writing them; the main process
+    stage()s each one and commit()s them all at the end. A commit first
+    writes every file to a temp file beside it, then moves them into place
+    with os.replace, so each file is either old or new. If anything fails,
+    including Ctrl-C, files already replaced are put back, and the tree is
+    left as it was before the commit.
+
+    With diff (a stream, see patch_output) stage() writes a unified diff of
+    each change to it as it comes in and nothing is written to disk; with
+    write=False nothing is written either.
+    """
+
+    def __init__(self, root, write=True, diff=None):
+        self.root = root
+        self.write = write and diff is None
+        self.diff = diff
+        self.staged = {}
+
+    def stage(self, path, original, content):
+        """Queue content to replace path, whose text was original when it was read."""
+        if content == original:
+            return
+        if self.diff is not None:
+            rel_path = os.path.relpath(path, self.root).replace(os.sep, '/')
+            self.diff.writelines(unified_diff(original, content, rel_path))
+        if self.write:
+            self.staged[path] = content
+
+    def __len__(self):
+        return len(self.staged)
+
+    def commit(self):
+        """Write every staged file, or none of them. Returns the number written."""
+        temp_paths = {path: f'{path}.{os.getpid()}.tmp' for path in self.staged}
+        originals = {}
+        try:
+            for path, content in self.staged.items():
+                with open(temp_paths[path], 'w', encoding='utf-8') as f:
+                    f.write(content)
+                shutil.copymode(path, temp_paths[path])
+
+            for path in self.staged:
+                with open(path, 'rb') as f:
+                    originals[path] = f.read()
+                os.replace(temp_paths[path], path)
+        except BaseException:
+            for path, data in originals.items():
+                if os.path.exists(temp_paths[path]):
+                    continue  # Read but never replaced
+                with open(temp_paths[path], 'wb') as f:
+                    f.write(data)
+                os.replace(temp_paths[path], path)
+            for temp_path in temp_paths.values():
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            raise
+
+        written = len(self.staged)
+        self.staged = {}
+        return written
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Synthetic site generator for benchmarking the maintenance scripts.
+
+Builds a tree shaped like the real site: Norwegian plager/<category>/,
+blogg/, tjeneste/ and faq/ pages, their English counterparts under
+en/conditions/<category>/, en/blog/ and en/services/, top-level pages,
+an images/ folder and an old single-file sitemap.xml. Page counts and
+average sizes per section are those of the site in January 2026, times
+the scale. Pages carry the same kind of markup the scripts have to get
+through (head meta tags, hreflang pairs, JSON-LD, navigation, images)
+around generated article text.
+
+Defects are planted at controllable rates: Norwegian words missing their
+æ/ø/å (norwegian-spellcheck.py), Norwegian pages with æ/ø/å turned into
+U+FFFD (fix-encoding.py, which trains on the clean ones) and links to
+pages that do not exist (fix-broken-links.py, partly in the
+LINK_CORRECTIONS forms). The same seed and settings always
+give the same tree.
+
+Usage:
+    python site_corpus.py <directory> [--scale X] [--seed N] [--missing-rate R] [--fffd-rate R] [--broken-rate R]
+"""
+
+import argparse
+import os
+import random
+import sys
+from xml.sax.saxutils import escape
+
+DOMAIN = "https://thebackrom.com"
+
+# (folder, language, pages at scale 1, average page size in bytes); a
+# {category} folder spreads its pages over the language's CATEGORIES
+SECTIONS = [
+    ('plager/{category}', 'nb', 166, 36900),
+    ('blogg', 'nb', 44, 30000),
+    ('tjeneste', 'nb', 13, 32000),
+    ('faq', 'nb', 24, 23200),
+    ('', 'nb', 14, 26500),
+    ('en/conditions/{category}', 'en', 167, 38300),
+    ('en/blog', 'en', 44, 24800),
+    ('en/services', 'en', 13, 32800),
+    ('en', 'en', 13, 26100),
+]
+
+CATEGORIES = {
+    'nb': ['korsrygg', 'nakke', 'skulder', 'hofte', 'kne', 'fot', 'hodepine', 'svimmelhet',
+           'kjeve', 'albue-arm', 'brystrygg', 'idrettsskader'],
+    'en': ['lower-back', 'neck', 'shoulder', 'hip', 'knee', 'foot', 'headache', 'dizziness',
+           'jaw', 'elbow-arm', 'upper-back', 'sports-injuries'],
+}
+
+# Images on the site at scale 1
+IMAGES = 2470
+
+# Words with æ/ø/å that norwegian-spellcheck.py has a rule for when they are missing
+DIACRITIC_WORDS = [
+    'høyere', 'særlig', 'være', 'støtte', 'søvn', 'følelse', 'løsning', 'økt', 'øker', 'nær',
+    'først', 'første', 'årsak', 'årsaken', 'målet', 'størrelse', 'bøye', 'øvre', 'ifølge',
+    'svært', 'forstå', 'lære', 'vært', 'mønster', 'påfølgende', 'nærliggende', 'hjørne',
+    'sårbar', 'primær', 'høyt', 'øyet', 'pålitelig', 'utføres', 'målrettet', 'gjennomgått',
+]
+
+NORWEGIAN_WORDS = [
+    'og', 'det', 'er', 'som', 'med', 'til', 'ikke', 'en', 'et', 'kan', 'har', 'av', 'de', 'den',
+    'smerte', 'smerter', 'behandling', 'rygg', 'nakke', 'kiropraktor', 'pasient', 'trening',
+    'muskel', 'muskler', 'ledd', 'bevegelse', 'uke', 'dag', 'ofte', 'kroppen', 'plager',
+    'symptomer', 'studier', 'viser', 'god', 'hjelp', 'gjennom', 'etter', 'under', 'mellom',
+    'uten', 'andre', 'mange', 'flere', 'lenge', 'tid', 'arbeid', 'hverdag', 'stilling', 'hode',
+    'skulder', 'kne', 'hofte', 'fot', 'arm', 'ryggen', 'nakken', 'vanlig', 'vanligste',
+    'undersøkelse', 'diagnose', 'akutt', 'kronisk', 'belastning', 'aktivitet', 'hvile',
+]
+
+ENGLISH_WORDS = [
+    'the', 'and', 'of', 'to', 'in', 'is', 'a', 'for', 'with', 'that', 'pain', 'treatment',
+    'back', 'neck', 'chiropractor', 'patient', 'exercise', 'muscle', 'muscles', 'joint',
+    'movement', 'week', 'day', 'often', 'body', 'symptoms', 'studies', 'show', 'good', 'help',
+    'through', 'after', 'under', 'between', 'without', 'other', 'many', 'more', 'long', 'time',
+    'work', 'posture', 'head', 'shoulder', 'knee', 'hip', 'foot', 'arm', 'common',
+    'examination', 'diagnosis', 'acute', 'chronic', 'load', 'activity', 'rest', 'recovery',
+]
+
+# Misspelt links fix-broken-links.py knows how to correct (see LINK_CORRECTIONS)
+KNOWN_BROKEN_LINKS = [
+    'en/conditions/neck/c5-c6-prolapse.html',
+    'en/conditions/neck/cervical-disc-herniation.html',
+    'en/conditions/low-back/sciatica.html',
+    'en/conditions/lower-back/lumbago.html',
+    'en/conditions/neck/cervical-cervical-foraminal-stenosis.html',
+]
+
+FOLDED = str.maketrans({'æ': 'ae', 'ø': 'o', 'å': 'a'})
+CORRUPTED = str.maketrans({'æ': '\ufffd', 'ø': '\ufffd', 'å': '\ufffd'})
+
+# Share of the æ/ø/å words turned into U+FFFD on a corrupted page
+CORRUPTED_WORDS = 0.2
+
+# Links and images in a page's navigation, article and footer
+NAV_LINKS = 20
+ARTICLE_LINKS = 25
+FOOTER_LINKS = 6
+PAGE_IMAGES = 5
+
+
+class SiteGenerator:
+    """Writes one synthetic site. Call generate() once."""
+
+    def __init__(self, root, scale=1.0, seed=0, missing_rate=0.02, fffd_rate=0.05, broken_rate=0.02):
+        self.root = root
+        self.scale = scale
+        self.random = random.Random(seed)
+        self.missing_rate = missing_rate
+        self.fffd_rate = fffd_rate
+        self.broken_rate = broken_rate
+        # Whether the page being written has U+FFFD in it
+        self.corrupted = False
+        self.pages = {'nb': [], 'en': []}
+        self.images = []
+        self.stats = {'pages': 0, 'nb_pages': 0, 'en_pages': 0, 'bytes': 0, 'nb_bytes': 0,
+                      'en_bytes': 0, 'images': 0}
+
+    def plan(self):
+        """Decide every page path, so pages can link to pages written after them."""
+        for folder, language, count, size in SECTIONS:
+            count = max(1, round(count * self.scale))
+            for i in range(count):
+                if '{category}' in folder:
+                    categories = CATEGORIES[language]
+                    path_folder = folder.format(category=categories[i % len(categories)])
+                else:
+                    path_folder = folder
+                words = ENGLISH_WORDS if language == 'en' else NORWEGIAN_WORDS
+                slug = f"{self.random.choice(words)}-{self.random.choice(words)}-{i}"
+                path = f"{path_folder}/{slug}.html" if path_folder else f"{slug}.html"
+                self.pages[language].append((path, size))
+
+        for i in range(max(1, round(IMAGES * self.scale))):
+            self.images.append(f"images/{i % 40}/image-{i}.webp")
+
+    def word(self, language):
+        """Return the next word of the article text, with the planted defects."""
+        if language == 'en':
+            return self.random.choice(ENGLISH_WORDS)
+        if self.random.random() < 0.15:
+            word = self.random.choice(DIACRITIC_WORDS)
+            roll = self.random.random()
+            if roll < self.missing_rate:
+                return word.translate(FOLDED)
+            if self.corrupted and roll < self.missing_rate + CORRUPTED_WORDS:
+                return word.translate(CORRUPTED)
+            return word
+        return self.random.choice(NORWEGIAN_WORDS)
+
+    def sentence(self, language):
+        words = [self.word(language) for _ in range(self.random.randint(6, 18))]
+        return words[0][:1].upper() + ' '.join(words)[1:] + '.'
+
+    def link(self, page, language):
+        """Return a relative href from page to another page, broken at broken_rate."""
+        target = self.random.choice(self.pages[language])[0]
+        if self.random.random() < self.broken_rate:
+            if language == 'en' and self.random.random() < 0.5:
+                target = self.random.choice(KNOWN_BROKEN_LINKS)
+            else:
+                target = target[:-len('.html')] + 'x.html'
+        return os.path.relpath(target, os.path.dirname(page) or '.').replace(os.sep, '/')
+
+    def image(self, page):
+        return os.path.relpath(self.random.choice(self.images),
+                               os.path.dirname(page) or '.').replace(os.sep, '/')
+
+    def page(self, path, language, size, alternate):
+        """Return the HTML of one page of about size bytes."""
+        self.corrupted = language == 'nb' and self.random.random() < self.fffd_rate
+        title = ' '.join(self.word(language) for _ in range(5)).capitalize()
+        description = self.sentence(language)
+        parts = [
+            '<!DOCTYPE html>\n',
+            f'<html lang="{language}">\n<head>\n',
+            '  <meta charset="UTF-8" />\n',
+            '  <meta name="viewport" content="width=device-width, initial-scale=1.0" />\n',
+            f'  <title>{escape(title)} | Kiropraktor</title>\n',
+            f'  <meta name="description" content="{escape(description)}" />\n',
+            f'  <meta property="og:title" content="{escape(title)}">\n',
+            f'  <meta property="og:url" content="{DOMAIN}/{path}">\n',
+            f'  <link rel="canonical" href="{DOMAIN}/{path}" />\n',
+            f'  <link rel="stylesheet" href="{os.path.relpath("css/main.css", os.path.dirname(path) or ".")}" />\n',
+        ]
+        if alternate:
+            pair = {language: path, ('en' if language == 'nb' else 'nb'): alternate}
+            for hreflang in ('nb', 'en'):
+                parts.append(f'  <link rel="alternate" hreflang="{hreflang}" href="{DOMAIN}/{pair[hreflang]}" />\n')
+        parts += [
+            '  <script type="application/ld+json">\n',
+            f'  {{"@context": "https://schema.org", "@type": "MedicalWebPage", "name": "{escape(title)}", '
+            f'"description": "{escape(description)}", "url": "{DOMAIN}/{path}"}}\n',
+            '  </script>\n</head>\n<body>\n  <header class="site-header">\n    <nav>\n',
+        ]
+        for _ in range(NAV_LINKS):
+            parts.append(f'      <a href="{self.link(path, language)}" class="nav-link">'
+                         f'{escape(self.word(language).capitalize())}</a>\n')
+        parts.append(f'    </nav>\n  </header>\n  <main>\n    <article>\n      <h1>{escape(title)}</h1>\n')
+
+        footer = ['  </main>\n  <footer>\n']
+        for _ in range(FOOTER_LINKS):
+            footer.append(f'    <a href="{self.link(path, language)}">{escape(self.word(language))}</a>\n')
+        footer.append('  </footer>\n  <script src="/js/main.js" defer></script>\n</body>\n</html>\n')
+        footer_size = sum(len(part) for part in footer)
+
+        # Article paragraphs until the page reaches its size, with the links and images spread through
+        target = size * self.random.uniform(0.7, 1.3) - footer_size
+        length = sum(len(part) for part in parts)
+        links = ARTICLE_LINKS
+        images = PAGE_IMAGES
+        while length < target:
+            paragraph = [self.sentence(language) for _ in range(self.random.randint(2, 5))]
+            if links and self.random.random() < 0.5:
+                paragraph.append(f'<a href="{self.link(path, language)}">'
+                                 f'{escape(self.word(language))} {escape(self.word(language))}</a>')
+                links -= 1
+            text = f'      <p>{" ".join(paragraph)}</p>\n'
+            if images and self.random.random() < 0.15:
+                text += (f'      <img src="{self.image(path)}" alt="{escape(self.sentence(language))}" '
+                         f'loading="lazy" />\n')
+                images -= 1
+            if self.random.random() < 0.1:
+                text += f'      <h2>{escape(self.sentence(language))}</h2>\n'
+            parts.append(text)
+            length += len(text)
+        parts.append('    </article>\n')
+        return ''.join(parts + footer)
+
+    def write(self, path, content):
+        full_path = os.path.join(self.root, *path.split('/'))
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'w', encoding='utf-8', newline='\n') as f:
+            f.write(content)
+        return len(content.encode('utf-8'))
+
+    def generate(self):
+        """Write the site. Returns the stats: pages and bytes per language, and images."""
+        self.plan()
+
+        for path in self.images:
+            self.write(path, '')
+        self.write('css/main.css', 'body { margin: 0; }\n')
+        self.stats['images'] = len(self.images)
+
+        # The plager and en/conditions pages are nb/en pairs, like on the real site
+        conditions = {'nb': [path for path, _ in self.pages['nb'] if path.startswith('plager/')],
+                      'en': [path for path, _ in self.pages['en'] if path.startswith('en/conditions/')]}
+        alternates = {}
+        for nb_path, en_path in zip(conditions['nb'], conditions['en']):
+            alternates[nb_path] = en_path
+            alternates[en_path] = nb_path
+
+        for language in ('nb', 'en'):
+            for path, size in self.pages[language]:
+                written = self.write(path, self.page(path, language, size, alternates.get(path)))
+                self.stats['pages'] += 1
+                self.stats[f'{language}_pages'] += 1
+                self.stats['bytes'] += written
+                self.stats[f'{language}_bytes'] += written
+
+        # An old single-file sitemap, missing some pages and listing some that are gone
+        urls = [path for language in ('nb', 'en') for path, _ in self.pages[language]
+                if self.random.random() < 0.95]
+        urls += [f"gone/page-{i}.html" for i in range(max(1, round(5 * self.scale)))]
+        sitemap = ['<?xml version="1.0" encoding="UTF-8"?>\n',
+                   '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n']
+        for path in urls:
+            sitemap.append(f'  <url>\n    <loc>{DOMAIN}/{path}</loc>\n    <lastmod>2026-01-01</lastmod>\n'
+                           f'    <changefreq>monthly</changefreq>\n    <priority>0.7</priority>\n  </url>\n')
+        sitemap.append('</urlset>\n')
+        self.write('sitemap.xml', ''.join(sitemap))
+        return self.stats
+
+
+def generate_site(root, scale=1.0, seed=0, missing_rate=0.02, fffd_rate=0.05, broken_rate=0.02):
+    """Write a synthetic site under root (see SiteGenerator). Returns its stats."""
+    return SiteGenerator(root, scale, seed, missing_rate, fffd_rate, broken_rate).generate()
+
+
+def add_corpus_arguments(parser):
+    """Add the options that shape a generated site."""
+    parser.add_argument('--seed', type=int, default=0, help='random seed (default: 0)')
+    parser.add_argument('--missing-rate', type=float, default=0.02, metavar='R',
+                        help='share of æ/ø/å words written without them (default: 0.02)')
+    parser.add_argument('--fffd-rate', type=float, default=0.05, metavar='R',
+                        help='share of Norwegian pages with æ/ø/å turned into U+FFFD (default: 0.05)')
+    parser.add_argument('--broken-rate', type=float, default=0.02, metavar='R',
+                        help='share of links to pages that do not exist (default: 0.02)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic site for benchmarking')
+    parser.add_argument('directory', help='folder to write the site to (must not exist)')
+    parser.add_argument('--scale', type=float, default=1.0, metavar='X',
+                        help='size relative to the real site (default: 1)')
+    add_corpus_arguments(parser)
+    args = parser.parse_args()
+
+    if os.path.exists(args.directory):
+        parser.error(f"{args.directory} already exists")
+    stats = generate_site(args.directory, args.scale, args.seed, args.missing_rate,
+                          args.fffd_rate, args.broken_rate)
+    print(f"Wrote {stats['pages']} pages ({stats['bytes'] / 1e6:.1f} MB) and "
+          f"{stats['images']} images to {args.directory}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,25 +1,84 @@
 #!/usr/bin/env python3
 """
-Script to add missing HTML pages to sitemap.xml
+Generate the sitemap from the pages on disk.
+
+The pages are taken from the site's file index and written out one section
+at a time (Norwegian plager/blogg/tjeneste, the en/ subfolders and the
+remaining top-level pages) as sitemap-<section>.xml, each with a gzipped
+copy next to it, under a sitemap index in sitemap.xml. Entries are
+streamed to disk, never built up as one string. Section files of
+sections that are gone are deleted once the new index is written.
+
+The changefreq, priority and hreflang alternates of pages already in the
+sitemap are kept; new pages get defaults; entries whose file no longer
+exists are dropped. lastmod follows the page's visible text: a hash of it
+is kept per URL in .sitemap-hashes.json (commit it with the sitemap; the
+site's .htaccess keeps it from being served), and lastmod is set to today
+only when that hash changes, so markup-only edits do not send crawlers
+back to a page. When nothing changed the sitemap
+files are left alone.
+
+The xhtml:link alternates come from each page's own
+<link rel="alternate" hreflang> tags. They are collected into an index of
+nb/en pairs, which also fills in a page with no tags of its own from the
+page that claims it, and reports pairs that are one-sided (no link back)
+or conflicting (the link back points at another page).
+
+Usage:
+    python update-sitemap.py [site_root] [--dry-run]
+
+Options:
+    --dry-run   Report what would be added, removed and updated without writing
 """
 
+import argparse
+import gzip
+import hashlib
+import html
+import json
 import os
+import posixpath
 import re
-from pathlib import Path
+import sys
+import xml.etree.ElementTree as ET
 from datetime import datetime
+from xml.sax.saxutils import escape, quoteattr
+
+from html_scan import TAG, attributes, tag_name, text_spans, tokenize
+from link_index import INDEX_EXCLUDE_DIRS, FileIndex, resolve_link
+from site_common import decode_text
+
+if sys.platform == 'win32':
+    sys.stdout.reconfigure(encoding='utf-8', errors='replace')
 
-BASE_DIR = Path(r"D:\0 - 0 - Totall Clarity\0 - 0 - Nettside code – Kopi\website")
 DOMAIN = "https://thebackrom.com"
 
-# Directories to scan for pages to add
-SCAN_DIRS = [
-    'en/blog',
-    'en/conditions',
-    'en/services',
-    'plager',
-    'blogg',
-    'tjeneste',
-]
+SITEMAP_NS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+XHTML_NS = 'http://www.w3.org/1999/xhtml'
+
+# The sitemap robots.txt points at; becomes the index of the section files
+SITEMAP_NAME = 'sitemap.xml'
+
+# Name of a section file (see section_file)
+SECTION_FILE_PATTERN = re.compile(r'sitemap-[^/]+\.xml')
+
+# Top-level folders with a section file of their own; en/ gets one per subfolder
+SECTIONS = ['plager', 'blogg', 'tjeneste']
+
+# Section for pages outside SECTIONS and the en/ subfolders
+DEFAULT_SECTION = 'pages'
+
+ENGLISH = 'en'
+NORWEGIAN = 'nb'
+
+# <html lang> values meaning the same language as an hreflang
+LANGUAGE_ALIASES = {'no': NORWEGIAN, 'nn': NORWEGIAN}
+
+# Hash of each page's visible text when its lastmod was last set
+HASHES_NAME = '.sitemap-hashes.json'
+
+# Folders holding no published pages
+SITEMAP_EXCLUDE_DIRS = INDEX_EXCLUDE_DIRS | {'docs', 'scripts'}
 
 # Files to exclude
 EXCLUDE_PATTERNS = [
@@ -29,38 +88,29 @@ EXCLUDE_PATTERNS = [
     r'template',
 ]
 
-def get_existing_urls(sitemap_path):
-    """Extract existing URLs from sitemap."""
-    with open(sitemap_path, 'r', encoding='utf-8') as f:
-        content = f.read()
-
-    urls = set()
-    for match in re.finditer(r'<loc>([^<]+)</loc>', content):
-        url = match.group(1)
-        # Normalize URL
-        url = url.rstrip('/')
-        urls.add(url)
-    return urls
-
-def get_html_files(base_dir, scan_dirs):
-    """Find all HTML files in specified directories."""
-    html_files = []
-
-    for scan_dir in scan_dirs:
-        dir_path = base_dir / scan_dir
-        if dir_path.exists():
-            for html_file in dir_path.rglob('*.html'):
-                rel_path = html_file.relative_to(base_dir)
-                # Skip excluded patterns
-                skip = False
-                for pattern in EXCLUDE_PATTERNS:
-                    if re.search(pattern, str(rel_path), re.IGNORECASE):
-                        skip = True
-                        break
-                if not skip:
-                    html_files.append(rel_path)
-
-    return html_files
+def is_excluded(rel_path):
+    """Return True if a page matches one of EXCLUDE_PATTERNS."""
+    return any(re.search(pattern, str(rel_path), re.IGNORECASE) for pattern in EXCLUDE_PATTERNS)
+
+def in_excluded_dir(rel_path):
+    """Return True if a path is inside one of SITEMAP_EXCLUDE_DIRS, at any depth."""
+    return any(part in SITEMAP_EXCLUDE_DIRS for part in rel_path.split('/')[:-1])
+
+def is_sitemap_page(rel_path):
+    """Return True if a page (relative to the site root) belongs in the sitemap."""
+    url_path = str(rel_path).replace('\\', '/')
+    return (url_path.endswith('.html')
+            and not in_excluded_dir(url_path)
+            and not is_excluded(url_path))
+
+def section_of(rel_path):
+    """Return the name of the section file a page is listed in."""
+    parts = rel_path.split('/')
+    if parts[0] in SECTIONS and len(parts) > 1:
+        return parts[0]
+    if parts[0] == 'en':
+        return 'en-' + parts[1] if len(parts) > 2 else 'en'
+    return DEFAULT_SECTION
 
 def path_to_url(rel_path):
     """Convert file path to URL."""
@@ -68,69 +118,459 @@ def path_to_url(rel_path):
     url_path = str(rel_path).replace('\\', '/')
     return f"{DOMAIN}/{url_path}"
 
-def create_url_entry(url, lastmod=None, changefreq='monthly', priority='0.5'):
-    """Create a sitemap URL entry."""
-    if lastmod is None:
-        lastmod = datetime.now().strftime('%Y-%m-%d')
+def url_to_path(url):
+    """Return the site-relative file a sitemap URL points at, or None if it is not on DOMAIN."""
+    if not url.startswith(DOMAIN + '/'):
+        return None
+    path = url[len(DOMAIN) + 1:]
+    return posixpath.join(path, 'index.html') if not path or path.endswith('/') else path
 
-    return f"""  <url>
-    <loc>{url}</loc>
-    <lastmod>{lastmod}</lastmod>
-    <changefreq>{changefreq}</changefreq>
-    <priority>{priority}</priority>
-  </url>"""
+def default_entry(rel_path):
+    """Sitemap fields for a page that is not in the sitemap yet."""
+    # Determine priority based on path
+    if '/blog/' in rel_path or rel_path.startswith('blogg/'):
+        priority = '0.6'
+    elif 'index.html' in rel_path:
+        priority = '0.7'
+    else:
+        priority = '0.5'
 
-def main():
-    sitemap_path = BASE_DIR / 'sitemap.xml'
+    return {
+        'lastmod': today(),
+        'changefreq': 'monthly',
+        'priority': priority,
+        'alternates': [],
+    }
+
+def today():
+    """Today's date in sitemap lastmod format."""
+    return datetime.now().strftime('%Y-%m-%d')
+
+def text_hash(content):
+    """Return the SHA-1 of a page's visible text, whitespace collapsed."""
+    text = ' '.join(' '.join(content[start:end] for start, end in text_spans(content)).split())
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+def page_summary(content):
+    """Return what the sitemap needs of a page: (text_hash, (language, alternates))."""
+    return text_hash(content), page_alternates(content)
+
+class ContentHashes:
+    """Per-URL store of visible-text hashes, saved as HASHES_NAME in the site root.
+
+    Only the hashes are stored, not sizes or mtimes, so the file stays the
+    same across checkouts and can be committed.
+    """
+
+    def __init__(self, root):
+        self.path = os.path.join(root, HASHES_NAME)
+        self.urls = {}
+        self.dirty = False
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.urls = json.load(f).get('urls', {})
+        except (OSError, ValueError):
+            pass
+
+    def changed(self, url, digest):
+        """Record the current hash of url's page. Returns True if it differs from the stored one.
+
+        A URL seen for the first time is recorded and reported unchanged.
+        """
+        previous = self.urls.get(url)
+        if previous == digest:
+            return False
+
+        self.urls[url] = digest
+        self.dirty = True
+        return previous is not None
+
+    def forget(self, urls):
+        """Drop the entries of URLs no longer in the sitemap."""
+        for url in urls:
+            if self.urls.pop(url, None) is not None:
+                self.dirty = True
+
+    def save(self):
+        """Write the store back if anything changed."""
+        if not self.dirty:
+            return
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'urls': self.urls}, f, indent=1, sort_keys=True)
+        os.replace(temp_path, self.path)
+        self.dirty = False
+
+def path_language(rel_path):
+    """Return the hreflang a page is assumed to be in from its path: en/ or not."""
+    return ENGLISH if rel_path.split('/', 1)[0] == 'en' else NORWEGIAN
+
+def page_alternates(content):
+    """Read a page's head. Returns (language, alternates).
+
+    language is the <html lang> (None if missing), alternates the
+    (hreflang, href) of each <link rel="alternate" hreflang>.
+    """
+    language = None
+    alternates = []
+    for token in tokenize(content):
+        if token[0] != TAG:
+            continue
+        name = tag_name(token[1])
+        if name == 'body':
+            break
+        if name not in ('html', 'link'):
+            continue
+        values = {attribute: html.unescape(content[start:end])
+                  for attribute, start, end in attributes(content, token[1])}
+        if name == 'html' and values.get('lang'):
+            language = values['lang'].split('-', 1)[0].lower()
+            language = LANGUAGE_ALIASES.get(language, language)
+        elif ('alternate' in values.get('rel', '').lower().split()
+                and values.get('hreflang') and values.get('href')):
+            alternates.append((values['hreflang'], values['href']))
+    return language, alternates
+
+class AlternateIndex:
+    """Pairs of pages that name each other as hreflang alternates.
 
-    # Get existing URLs
-    existing_urls = get_existing_urls(sitemap_path)
-    print(f"Found {len(existing_urls)} existing URLs in sitemap")
+    add() each page's alternates, then ask for a page's alternates() and the
+    problems() found across all of them. Pages are site-relative paths.
+    """
 
-    # Get HTML files
-    html_files = get_html_files(BASE_DIR, SCAN_DIRS)
-    print(f"Found {len(html_files)} HTML files in scan directories")
+    def __init__(self):
+        self.languages = {}
+        self.declared = {}
+        self.claimed_by = {}
 
-    # Find missing URLs
-    missing = []
-    for rel_path in html_files:
+    def add(self, page, language, alternates):
+        """Record the language of a page (None: go by its path) and the alternates it declares."""
+        self.languages[page] = language or path_language(page)
+        self.declared[page] = [(lang, href, resolve_link(page, href)) for lang, href in alternates]
+        for lang, href, target in self.declared[page]:
+            if target and target != page:
+                self.claimed_by.setdefault(target, []).append((self.languages[page], page))
+
+    def language(self, page):
+        """Return the hreflang a page is written in."""
+        return self.languages.get(page) or path_language(page)
+
+    def target(self, page, lang):
+        """Return the page a page names as its lang alternate, or None."""
+        for alternate_lang, _, target in self.declared.get(page, ()):
+            if alternate_lang == lang:
+                return target
+        return None
+
+    def alternates(self, page):
+        """Return the (hreflang, url) alternates to list for a page in the sitemap.
+
+        A page without tags of its own gets the pair from the one page of
+        the other language that names it, if there is exactly one.
+        """
+        if self.declared.get(page):
+            seen = set()
+            alternates = []
+            for lang, href, _ in self.declared[page]:
+                if (lang, href) not in seen:
+                    seen.add((lang, href))
+                    alternates.append((lang, href))
+            return alternates
+
+        claims = [(lang, other) for lang, other in self.claimed_by.get(page, ())
+                  if lang != self.language(page)]
+        if len(claims) != 1:
+            return []
+        lang, other = claims[0]
+        pair = {self.language(page): path_to_url(page), lang: path_to_url(other)}
+        return [(lang, pair[lang]) for lang in (NORWEGIAN, ENGLISH) if lang in pair]
+
+    def problems(self):
+        """Yield (page, message) for one-sided and conflicting alternate pairs."""
+        for page in sorted(self.declared):
+            lang = self.language(page)
+            own = self.target(page, lang)
+            if own is not None and own != page:
+                yield page, f'hreflang="{lang}" points at {own}, not at the page itself'
+
+            for other_lang, href, target in self.declared[page]:
+                if other_lang == lang or other_lang == 'x-default' or target is None:
+                    continue
+                if target not in self.declared:
+                    yield page, f'hreflang="{other_lang}" {href}: not a sitemap page'
+                    continue
+                back = self.target(target, lang)
+                if back is None:
+                    yield page, f'hreflang="{other_lang}" {target} does not link back'
+                elif back != page:
+                    yield page, f'hreflang="{other_lang}" {target} links back to {back} instead'
+
+def read_entries(root):
+    """Stream the current sitemap (an urlset or a sitemap index) into {url: fields}.
+
+    Section files listed in an index are read from the site root. Returns
+    (entries, sources), sources being the files read relative to the root.
+    """
+    entries = {}
+    sources = []
+    pending = [SITEMAP_NAME]
+
+    while pending:
+        source = pending.pop(0)
+        path = os.path.join(root, *source.split('/'))
+        if not os.path.exists(path):
+            continue
+        sources.append(source)
+
+        entry = None
+        for event, element in ET.iterparse(path, events=('start', 'end')):
+            tag = element.tag.rsplit('}', 1)[-1]
+            if event == 'start':
+                if tag == 'url':
+                    entry = {'alternates': []}
+                continue
+
+            if tag == 'loc' and entry is not None:
+                entry['loc'] = (element.text or '').strip()
+            elif tag == 'loc':
+                # <sitemap><loc> of an index
+                section_path = url_to_path((element.text or '').strip())
+                if section_path:
+                    pending.append(section_path)
+            elif tag in ('lastmod', 'changefreq', 'priority') and entry is not None:
+                entry[tag] = (element.text or '').strip()
+            elif tag == 'link' and entry is not None:
+                entry['alternates'].append((element.get('hreflang'), element.get('href')))
+            elif tag == 'url':
+                if entry.get('loc'):
+                    entries[entry.pop('loc')] = entry
+                entry = None
+                element.clear()
+
+    return entries, sources
+
+class SitemapWriter:
+    """Write an XML file and its .gz copy entry by entry, replacing both on close."""
+
+    def __init__(self, path):
+        self.path = path
+        self.plain = open(path + '.tmp', 'w', encoding='utf-8', newline='\n')
+        self.compressed = gzip.open(path + '.gz.tmp', 'wt', encoding='utf-8', newline='\n')
+
+    def write(self, text):
+        self.plain.write(text)
+        self.compressed.write(text)
+
+    def close(self):
+        self.plain.close()
+        self.compressed.close()
+        os.replace(self.path + '.tmp', self.path)
+        os.replace(self.path + '.gz.tmp', self.path + '.gz')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+            return
+        self.plain.close()
+        self.compressed.close()
+        for temp_path in (self.path + '.tmp', self.path + '.gz.tmp'):
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+def write_urlset(path, urls):
+    """Write a section file from (url, fields) pairs."""
+    with SitemapWriter(path) as out:
+        out.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        out.write(f'<urlset xmlns="{SITEMAP_NS}"\n        xmlns:xhtml="{XHTML_NS}">\n')
+        for url, fields in urls:
+            out.write('  <url>\n')
+            out.write(f'    <loc>{escape(url)}</loc>\n')
+            if fields.get('lastmod'):
+                out.write(f"    <lastmod>{escape(fields['lastmod'])}</lastmod>\n")
+            for hreflang, href in fields['alternates']:
+                out.write(f'    <xhtml:link rel="alternate" hreflang={quoteattr(hreflang)} '
+                          f'href={quoteattr(href)}/>\n')
+            if fields.get('changefreq'):
+                out.write(f"    <changefreq>{escape(fields['changefreq'])}</changefreq>\n")
+            if fields.get('priority'):
+                out.write(f"    <priority>{escape(fields['priority'])}</priority>\n")
+            out.write('  </url>\n')
+        out.write('</urlset>\n')
+
+def write_index(path, sections):
+    """Write the sitemap index from (section file url, lastmod) pairs."""
+    with SitemapWriter(path) as out:
+        out.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        out.write(f'<sitemapindex xmlns="{SITEMAP_NS}">\n')
+        for url, lastmod in sections:
+            out.write('  <sitemap>\n')
+            out.write(f'    <loc>{escape(url)}</loc>\n')
+            if lastmod:
+                out.write(f'    <lastmod>{escape(lastmod)}</lastmod>\n')
+            out.write('  </sitemap>\n')
+        out.write('</sitemapindex>\n')
+
+def section_file(section):
+    """Filename of a section's sitemap."""
+    return f'sitemap-{section}.xml'
+
+def stale_section_files(root, layout):
+    """Return the section sitemaps (and .gz copies) in root that layout no longer lists."""
+    stale = []
+    for name in sorted(os.listdir(root)):
+        plain = name[:-len('.gz')] if name.endswith('.gz') else name
+        if SECTION_FILE_PATTERN.fullmatch(plain) and plain not in layout:
+            stale.append(name)
+    return stale
+
+def build_sections(root, hashes, pairs, index=None, summaries=None):
+    """Work out the new sitemap. Returns (sections, added, removed, updated, sources).
+
+    sections maps each section name to its sorted (url, fields) pairs;
+    added and removed are the URLs that are new or dropped, updated those
+    whose visible text or alternates changed (a text change also sets
+    lastmod to today). sources are the sitemap files the current sitemap
+    was read from. Every listed page is read once, into hashes and the
+    AlternateIndex pairs, unless summaries (rel_path -> page_summary())
+    already has it. index may include SITEMAP_EXCLUDE_DIRS; their pages
+    are left out either way.
+    """
+    if index is None:
+        index = FileIndex(root, SITEMAP_EXCLUDE_DIRS)
+    entries, sources = read_entries(root)
+
+    listed = []
+    removed = []
+    for url, fields in entries.items():
+        rel_path = url_to_path(url)
+        if rel_path is None or rel_path not in index.files or in_excluded_dir(rel_path):
+            removed.append(url)
+            continue
+        listed.append((url, rel_path, fields))
+
+    added = []
+    listed_paths = {rel_path for _, rel_path, _ in listed}
+    for rel_path in sorted(index.files):
+        if rel_path in listed_paths or not is_sitemap_page(rel_path):
+            continue
         url = path_to_url(rel_path)
-        if url not in existing_urls:
-            missing.append((rel_path, url))
+        added.append(url)
+        listed.append((url, rel_path, default_entry(rel_path)))
 
-    print(f"\nMissing from sitemap: {len(missing)} URLs")
+    digests = {}
+    for _, rel_path, _ in listed:
+        if rel_path in digests:
+            continue
+        summary = summaries.get(rel_path) if summaries else None
+        if summary is None:
+            with open(os.path.join(root, *rel_path.split('/')), 'rb') as f:
+                summary = page_summary(decode_text(f.read()))
+        digests[rel_path], (language, alternates) = summary
+        pairs.add(rel_path, language, alternates)
 
-    if not missing:
-        print("Nothing to add!")
-        return
+    sections = {}
+    updated = []
+    new_urls = set(added)
+    for url, rel_path, fields in listed:
+        changed = hashes.changed(url, digests[rel_path])
+        if changed and url not in new_urls:
+            fields['lastmod'] = today()
+        alternates = pairs.alternates(rel_path)
+        if alternates != fields['alternates']:
+            fields['alternates'] = alternates
+            changed = True
+        if changed and url not in new_urls:
+            updated.append(url)
+        sections.setdefault(section_of(rel_path), []).append((url, fields))
 
-    # Read sitemap
-    with open(sitemap_path, 'r', encoding='utf-8') as f:
-        content = f.read()
+    # Also drops hashes left behind by URLs no sitemap file lists any more
+    current = {url for url, _, _ in listed}
+    hashes.forget([url for url in hashes.urls if url not in current])
+    for urls in sections.values():
+        urls.sort()
+    return sections, added, sorted(removed), sorted(updated), sources
 
-    # Create new entries
-    new_entries = []
-    for rel_path, url in sorted(missing):
-        # Determine priority based on path
-        if '/blog/' in str(rel_path) or '/blogg/' in str(rel_path):
-            priority = '0.6'
-        elif 'index.html' in str(rel_path):
-            priority = '0.7'
-        else:
-            priority = '0.5'
+def update_sitemap(root, write=True, index=None, summaries=None):
+    """Regenerate the sitemap of the site at root.
 
-        entry = create_url_entry(url, priority=priority)
-        new_entries.append(entry)
-        print(f"  Added: {url}")
+    Returns the number of URLs added, removed or updated. With
+    write=False the changes are only listed. The sitemap is not rewritten
+    when there are none and it is already in the split layout. index and
+    summaries let a caller that has already walked the tree and read the
+    pages pass them in (see build_sections).
+    """
+    hashes = ContentHashes(root)
+    pairs = AlternateIndex()
+    sections, added, removed, updated, sources = build_sections(root, hashes, pairs, index, summaries)
+    changes = len(added) + len(removed) + len(updated)
+
+    total = sum(len(urls) for urls in sections.values())
+    print(f"Pages in sitemap: {total} in {len(sections)} section(s)")
+    for url in added:
+        print(f"  {'Added' if write else 'Missing'}: {url}")
+    for url in removed:
+        print(f"  {'Removed' if write else 'No longer exists'}: {url}")
+    for url in updated:
+        print(f"  {'Updated' if write else 'Changed'}: {url}")
+
+    problems = list(pairs.problems())
+    if problems:
+        print(f"\nhreflang pairs with problems: {len(problems)}")
+        for page, message in problems:
+            print(f"  {page}: {message}")
+
+    layout = [SITEMAP_NAME] + [section_file(section) for section in sorted(sections)]
+    stale = stale_section_files(root, layout)
+    for name in stale:
+        print(f"  {'Deleted' if write else 'No longer in the index'}: {name}")
+
+    if not write:
+        return changes
+
+    up_to_date = (changes == 0 and sources == layout and not stale
+                  and all(os.path.exists(os.path.join(root, name + '.gz')) for name in layout))
+    if not up_to_date:
+        index_entries = []
+        for section in sorted(sections):
+            name = section_file(section)
+            write_urlset(os.path.join(root, name), sections[section])
+            lastmod = max((fields.get('lastmod') or '' for _, fields in sections[section]),
+                          default='')
+            index_entries.append((f"{DOMAIN}/{name}", lastmod))
+        write_index(os.path.join(root, SITEMAP_NAME), index_entries)
+        # Only once the new index no longer points at them
+        for name in stale:
+            os.remove(os.path.join(root, name))
+
+    hashes.save()
+
+    if up_to_date:
+        print("\nSitemap is up to date, nothing written")
+    else:
+        print(f"\n✓ Wrote {len(sections)} section sitemaps (+ .gz) and {SITEMAP_NAME} "
+              f"({len(added)} added, {len(removed)} removed, {len(updated)} updated)")
+    return changes
+
+def main():
+    site_root = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
 
-    # Insert before closing tag
-    new_content = content.replace('</urlset>', '\n'.join(new_entries) + '\n</urlset>')
+    parser = argparse.ArgumentParser(description='Generate the sitemap from the pages on disk')
+    parser.add_argument('directory', nargs='?', default=site_root,
+                        help='site root (default: the website folder)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='report what would be added, removed and updated without writing')
+    args = parser.parse_args()
 
-    # Write updated sitemap
-    with open(sitemap_path, 'w', encoding='utf-8') as f:
-        f.write(new_content)
+    if not os.path.isdir(args.directory):
+        print(f"Error: site root not found at {args.directory}")
+        return 1
 
-    print(f"\n✓ Added {len(missing)} URLs to sitemap")
+    update_sitemap(args.directory, write=not args.dry_run)
+    return 0
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())